@@ -0,0 +1,157 @@
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import constants as ct
+
+# =========================
+# 音声ファイルの保存領域
+# =========================
+# 会話履歴から聞き直せるよう、各ターンの音声をセッションごとのディレクトリに保存する。
+# 全セッション合計の容量上限と保存期間を超えたものは古い順に削除し、
+# 会話のリセット・ログアウト時にはそのセッションのファイルをまとめて削除する。
+
+MIME_TYPE_SUFFIXES = {
+    "audio/wav": ".wav",
+    "audio/mpeg": ".mp3",
+    "audio/ogg": ".ogg",
+    "audio/aac": ".aac",
+}
+
+
+class ArtifactStore:
+    """
+    セッションごとの名前空間を持つ、容量上限付きの音声ファイル保存領域
+    - 保存したファイルは古い順の索引と合計容量で管理し、保存のたびに保存領域全体を走査しない
+    - 索引は初回アクセス時に、前回起動時までに保存されたファイルから作成する
+    """
+
+    def __init__(self, root_dir, max_bytes, max_age_seconds):
+        self.root_dir = Path(root_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._index = None  # ファイルのパス → (保存時刻, サイズ, セッションID)。保存時刻の古い順
+        self._sessions = {}  # セッションID → ファイルのパスの集合
+        self._total_bytes = 0
+
+    def _session_dir(self, session_id):
+        return self.root_dir / session_id
+
+    def _load_index(self):
+        """
+        索引を作成（初回のみ保存領域を走査する。ロック取得済みで呼ぶ）
+        """
+        if self._index is not None:
+            return
+
+        entries = []
+        for path in self.root_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._index = OrderedDict()
+        for mtime, size, path in entries:
+            self._add(path, mtime, size, path.parent.name)
+
+    def _add(self, path, mtime, size, session_id):
+        self._index[path] = (mtime, size, session_id)
+        self._sessions.setdefault(session_id, set()).add(path)
+        self._total_bytes += size
+
+    def _discard(self, path):
+        _, size, session_id = self._index.pop(path)
+        self._total_bytes -= size
+        paths = self._sessions[session_id]
+        paths.discard(path)
+        if not paths:
+            del self._sessions[session_id]
+        return session_id
+
+    def save(self, session_id, data, mime_type="audio/wav"):
+        """
+        音声データをセッションのディレクトリに保存
+        Args:
+            session_id: セッションID
+            data: 音声データのバイト列
+            mime_type: 音声データのMIMEタイプ（拡張子の決定に使う）
+        Returns:
+            保存したファイルのパス
+        """
+        # ファイル名は一意なため、同じ秒に複数セッションが保存しても衝突しない
+        path = self._session_dir(session_id) / f"{uuid.uuid4().hex}{MIME_TYPE_SUFFIXES.get(mime_type, '.bin')}"
+
+        # 別セッションの削除処理が空のディレクトリを消すため、ディレクトリの作成と書き込みは同じロックの中で行う
+        with self._lock:
+            self._load_index()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            self._add(path, time.time(), len(data), session_id)
+            self._cleanup()
+        return str(path)
+
+    def remove_session(self, session_id):
+        """
+        セッションのファイルをすべて削除
+        """
+        with self._lock:
+            self._load_index()
+            for path in list(self._sessions.get(session_id, ())):
+                self._discard(path)
+            shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+
+    def _cleanup(self):
+        """
+        保存期間を過ぎたファイルと、容量上限を超えた分の古いファイルを削除（ロック取得済みで呼ぶ）
+        - 索引の先頭（古い順）から、条件を満たす間だけ削除する
+        """
+        expire_before = time.time() - self.max_age_seconds
+        emptied = set()
+        while self._index:
+            path, (mtime, _, _) = next(iter(self._index.items()))
+            if mtime >= expire_before and self._total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            session_id = self._discard(path)
+            if session_id not in self._sessions:
+                emptied.add(session_id)
+
+        # 空になったセッションのディレクトリも削除
+        for session_id in emptied:
+            try:
+                self._session_dir(session_id).rmdir()
+            except OSError:
+                pass
+
+    def usage(self, session_id=None):
+        """
+        保存領域の使用状況を取得
+        Args:
+            session_id: 指定した場合はそのセッション分のみ
+        Returns:
+            ファイル数・使用容量・容量上限の辞書
+        """
+        with self._lock:
+            self._load_index()
+            if session_id is None:
+                files, total_bytes = len(self._index), self._total_bytes
+            else:
+                paths = self._sessions.get(session_id, ())
+                files, total_bytes = len(paths), sum(self._index[path][1] for path in paths)
+            return {
+                "files": files,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# 全セッションで共有する保存領域
+artifact_store = ArtifactStore(ct.AUDIO_OUTPUT_DIR, ct.ARTIFACT_MAX_BYTES, ct.ARTIFACT_MAX_AGE_SECONDS)
@@ -0,0 +1,368 @@
+import io
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+import constants as ct
+
+# =========================
+# メモリ上の音声データ処理
+# =========================
+# APIレスポンスから st.audio / Whisper へのアップロードまで、音声はバイト列のまま扱う。
+# ファイルに書き出さないため、セッション間でファイル名が衝突することもない。
+
+# ブラウザ（st.audio）がそのまま再生できる形式とMIMEタイプ
+BROWSER_PLAYABLE_FORMATS = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+}
+
+
+def convert_to_wav(audio_data, audio_format="mp3"):
+    """
+    音声データをffmpegでデコードしてwav形式に変換
+    Args:
+        audio_data: 変換元の音声データのバイト列
+        audio_format: 変換元の音声形式
+    Returns:
+        wav形式の音声データのバイト列
+    """
+    audio = AudioSegment.from_file(io.BytesIO(audio_data), format=audio_format)
+    return export_wav(audio)
+
+
+def pcm_to_wav(pcm_data, sample_rate=ct.TTS_PCM_SAMPLE_RATE, channels=1, sample_width=2):
+    """
+    PCMの生データにwavヘッダーを付ける（デコード処理は発生しない）
+    Args:
+        pcm_data: 16bitリトルエンディアンのPCMデータ
+        sample_rate: サンプリングレート
+        channels: チャンネル数
+        sample_width: 1サンプルあたりのバイト数
+    Returns:
+        wav形式の音声データのバイト列
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_data)
+    return buffer.getvalue()
+
+
+def decode_to_wav(audio_data, audio_format):
+    """
+    音声合成の出力形式に応じて、1回だけデコードしてwav形式にそろえる
+    Args:
+        audio_data: 音声合成結果のバイト列
+        audio_format: 音声合成の出力形式（ct.TTS_RESPONSE_FORMAT）
+    Returns:
+        wav形式の音声データのバイト列
+    """
+    if audio_format == "pcm":
+        return pcm_to_wav(audio_data)
+    if audio_format == "wav":
+        return audio_data
+    return convert_to_wav(audio_data, audio_format)
+
+
+def to_playable(audio_data, audio_format, speed=1.0):
+    """
+    音声合成結果をブラウザで再生できる形にする
+    - 通常速度でブラウザが再生できる形式なら、変換せずにそのまま返す
+    - 再生速度を変える場合のみwavにデコードして加工する
+    Args:
+        audio_data: 音声合成結果のバイト列
+        audio_format: 音声合成の出力形式
+        speed: 再生速度
+    Returns:
+        audio_data: 再生用の音声データのバイト列
+        mime_type: 再生用の音声データのMIMEタイプ
+    """
+    if speed == 1.0 and audio_format in BROWSER_PLAYABLE_FORMATS:
+        return audio_data, BROWSER_PLAYABLE_FORMATS[audio_format]
+
+    wav_data = decode_to_wav(audio_data, audio_format)
+    return change_speed(wav_data, speed), BROWSER_PLAYABLE_FORMATS["wav"]
+
+
+def export_wav(audio):
+    """
+    AudioSegmentをwav形式のバイト列に書き出す
+    """
+    buffer = io.BytesIO()
+    audio.export(buffer, format="wav")
+    return buffer.getvalue()
+
+
+def wav_to_array(wav_data):
+    """
+    wav形式の音声データを16bitのNumPy配列に変換
+    Args:
+        wav_data: wav形式の音声データのバイト列
+    Returns:
+        samples: int16の配列（モノラルは(サンプル数,)、ステレオ以上は(サンプル数, チャンネル数)）
+        sample_rate: サンプリングレート
+    """
+    with wave.open(io.BytesIO(wav_data), "rb") as wav_file:
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width != 2:
+        # 16bit以外はpydubで16bitにそろえる
+        audio = AudioSegment.from_wav(io.BytesIO(wav_data)).set_sample_width(2)
+        frames = audio.raw_data
+
+    samples = np.frombuffer(frames, dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return samples, sample_rate
+
+
+def array_to_wav(samples, sample_rate):
+    """
+    16bitのNumPy配列をwav形式の音声データに変換
+    Args:
+        samples: int16の配列（wav_to_array() と同じ形）
+        sample_rate: サンプリングレート
+    Returns:
+        wav形式の音声データのバイト列
+    """
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    return pcm_to_wav(
+        np.ascontiguousarray(samples, dtype=np.int16).tobytes(),
+        sample_rate=sample_rate,
+        channels=channels
+    )
+
+
+def time_stretch(samples, speed, sample_rate, frame_ms=ct.TIME_STRETCH_FRAME_MS):
+    """
+    WSOLA（波形類似度に基づく重ね合わせ）で、音の高さを保ったまま再生速度を変更
+    - 出力フレームごとに、入力上の基準位置の前後から直前のフレームに最も自然につながる区間を
+      相互相関で探し、窓をかけて重ね合わせる
+    - 1.0より速い速度・遅い速度のどちらにも対応
+    Args:
+        samples: int16の配列（モノラルは(サンプル数,)、ステレオ以上は(サンプル数, チャンネル数)）
+        speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
+        sample_rate: サンプリングレート
+        frame_ms: 重ね合わせるフレームの長さ（ミリ秒）
+    Returns:
+        再生速度を変更したint16の配列
+    """
+    if speed == 1.0 or len(samples) == 0:
+        return samples
+
+    frame_length = max(2, int(sample_rate * frame_ms / 1000) // 2 * 2)
+    synthesis_hop = frame_length // 2
+    analysis_hop = synthesis_hop * speed
+    tolerance = synthesis_hop // 2
+
+    signal = samples.astype(np.float32)
+    # 類似度の探索はチャンネルを平均したモノラル信号で行う
+    mono = signal.mean(axis=1) if signal.ndim == 2 else signal
+
+    # 探索範囲が端をはみ出さないよう、前後を無音で埋める
+    pad = frame_length + tolerance
+    pad_width = ((pad, pad),) + ((0, 0),) * (signal.ndim - 1)
+    signal = np.pad(signal, pad_width)
+    mono = np.pad(mono, (pad, pad))
+    last_start = len(mono) - frame_length
+
+    output_length = int(round(len(samples) / speed))
+    frame_count = output_length // synthesis_hop + 1
+    window = np.hanning(frame_length).astype(np.float32)
+    output = np.zeros((frame_count * synthesis_hop + frame_length,) + signal.shape[1:], dtype=np.float32)
+    window_sum = np.zeros(frame_count * synthesis_hop + frame_length, dtype=np.float32)
+    frame_window = window if signal.ndim == 1 else window[:, np.newaxis]
+
+    position = pad
+    for frame_index in range(frame_count):
+        nominal = pad + int(round(frame_index * analysis_hop))
+        if frame_index > 0:
+            # 直前に選んだ区間をそのまま延長した波形に最も似ている区間を選ぶ
+            natural = mono[position + synthesis_hop:position + synthesis_hop + frame_length]
+            start = max(nominal - tolerance, 0)
+            stop = min(nominal + tolerance, last_start)
+            scores = np.correlate(mono[start:stop + frame_length], natural, mode="valid")
+            position = start + int(np.argmax(scores))
+        else:
+            position = nominal
+
+        output_start = frame_index * synthesis_hop
+        output[output_start:output_start + frame_length] += signal[position:position + frame_length] * frame_window
+        window_sum[output_start:output_start + frame_length] += window
+
+    # 窓の重なりによる振幅の偏りを補正
+    window_sum = np.maximum(window_sum, 1e-3)
+    output = output / (window_sum if output.ndim == 1 else window_sum[:, np.newaxis])
+    output = output[:output_length]
+
+    return np.clip(np.round(output), -32768, 32767).astype(np.int16)
+
+
+def change_speed(wav_data, speed):
+    """
+    音声データの再生速度を変更（音の高さは変えない）
+    Args:
+        wav_data: wav形式の音声データのバイト列
+        speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
+    Returns:
+        再生速度を変更したwav形式の音声データのバイト列
+    """
+    if speed == 1.0:
+        return wav_data
+    samples, sample_rate = wav_to_array(wav_data)
+    return array_to_wav(time_stretch(samples, speed, sample_rate), sample_rate)
+
+
+def detect_speech(samples, sample_rate):
+    """
+    音量とゼロ交差率から発話区間を検出
+    - 音量が背景雑音の一定倍以上のフレームを発話とみなす
+    - 背景雑音は、先頭・末尾の静かな方の音量と、小さい方から10%のフレームの音量のうち小さい方で推定する
+    - 無音の少ない録音では推定値も発話（小声）の音量になるため、推定値が発話の音量（大きい方から10%の
+      フレームの音量）より十分に小さい場合のみ使い、それ以外は最小の音量だけで判定する
+    - 音量がやや小さくても、ゼロ交差率の高いフレーム（s, f などの摩擦音）は発話とみなす
+    Args:
+        samples: int16の配列
+        sample_rate: サンプリングレート
+    Returns:
+        発話区間の (開始サンプル, 終了サンプル)。発話がなければNone
+    """
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    frame_length = max(1, int(sample_rate * ct.VAD_FRAME_MS / 1000))
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return None
+
+    frames = samples[:frame_count * frame_length].astype(np.float32).reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    zcr = np.mean(np.abs(np.diff(np.signbit(frames), axis=1)), axis=1)
+
+    noise_rms, speech_rms = np.percentile(rms, [10, 90])
+    edge_frames = max(1, ct.VAD_EDGE_MS // ct.VAD_FRAME_MS)
+    noise_rms = min(noise_rms, np.median(rms[:edge_frames]), np.median(rms[-edge_frames:]))
+    threshold = ct.VAD_MIN_RMS
+    if noise_rms * ct.VAD_CLEAR_NOISE_RATIO <= speech_rms:
+        threshold = max(threshold, noise_rms * ct.VAD_NOISE_RATIO)
+    is_speech = (rms >= threshold) | ((rms >= threshold / 2) & (zcr >= ct.VAD_ZCR_THRESHOLD))
+    speech_frames = np.flatnonzero(is_speech)
+    if len(speech_frames) == 0:
+        return None
+
+    padding = int(sample_rate * ct.VAD_PADDING_MS / 1000)
+    start = max(0, speech_frames[0] * frame_length - padding)
+    end = min(len(samples), (speech_frames[-1] + 1) * frame_length + padding)
+    return start, end
+
+
+def trim_silence(wav_data):
+    """
+    wav音声の前後の無音を除去
+    Args:
+        wav_data: wav形式の音声データのバイト列
+    Returns:
+        trimmed_wav_data: 無音を除去したwav形式の音声データ
+        speech_seconds: 発話区間の長さ（秒）。発話がなければ0
+    """
+    samples, sample_rate = wav_to_array(wav_data)
+    speech = detect_speech(samples, sample_rate)
+    if speech is None:
+        return wav_data, 0.0
+
+    start, end = speech
+    return array_to_wav(samples[start:end], sample_rate), (end - start) / sample_rate
+
+
+def resample(samples, source_rate, target_rate):
+    """
+    ポリフェーズフィルタでサンプリングレートを変換
+    Args:
+        samples: int16のモノラル配列
+        source_rate: 変換元のサンプリングレート
+        target_rate: 変換先のサンプリングレート
+    Returns:
+        変換後のint16の配列
+    """
+    if source_rate == target_rate:
+        return samples
+    from scipy.signal import resample_poly
+
+    divisor = np.gcd(source_rate, target_rate)
+    resampled = resample_poly(samples.astype(np.float32), target_rate // divisor, source_rate // divisor)
+    return np.clip(np.round(resampled), -32768, 32767).astype(np.int16)
+
+
+def downsample_for_transcription(wav_data):
+    """
+    録音データを文字起こし用の16kHz・モノラルのwavに変換
+    Args:
+        wav_data: wav形式の音声データのバイト列
+    Returns:
+        16kHz・モノラルのwav形式の音声データのバイト列
+    """
+    samples, sample_rate = wav_to_array(wav_data)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1).astype(np.int16)
+    samples = resample(samples, sample_rate, ct.TRANSCRIBE_SAMPLE_RATE)
+    return array_to_wav(samples, ct.TRANSCRIBE_SAMPLE_RATE)
+
+
+def encode_for_upload(wav_data, upload_format=ct.TRANSCRIBE_UPLOAD_FORMAT):
+    """
+    文字起こし用の音声をアップロード形式に圧縮
+    Args:
+        wav_data: wav形式の音声データのバイト列
+        upload_format: "flac" / "opus" / "wav"
+    Returns:
+        upload_data: アップロードする音声データのバイト列
+        upload_filename: アップロード時のファイル名（拡張子で形式が判定される）
+    """
+    if upload_format == "wav":
+        return wav_data, "audio_input.wav"
+
+    audio = AudioSegment.from_wav(io.BytesIO(wav_data))
+    buffer = io.BytesIO()
+    if upload_format == "opus":
+        audio.export(buffer, format="ogg", codec="libopus", bitrate=ct.TRANSCRIBE_OPUS_BITRATE)
+        return buffer.getvalue(), "audio_input.ogg"
+
+    audio.export(buffer, format=upload_format)
+    return buffer.getvalue(), f"audio_input.{upload_format}"
+
+
+def wav_duration(wav_data):
+    """
+    wavのヘッダーから音声の長さ（秒）を取得（音声本体はデコードしない）
+    """
+    with wave.open(io.BytesIO(wav_data), "rb") as wav_file:
+        return wav_file.getnframes() / float(wav_file.getframerate())
+
+
+def concat_wav(wav_clips):
+    """
+    複数のwav音声を順番に連結（同じ形式のwav同士のため、デコードせずにフレームを結合）
+    Args:
+        wav_clips: wav形式の音声データのバイト列のリスト
+    Returns:
+        連結したwav形式の音声データのバイト列
+    """
+    if not wav_clips:
+        return pcm_to_wav(b"")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as output_file:
+        for index, wav_data in enumerate(wav_clips):
+            with wave.open(io.BytesIO(wav_data), "rb") as input_file:
+                if index == 0:
+                    output_file.setparams(input_file.getparams())
+                output_file.writeframes(input_file.readframes(input_file.getnframes()))
+    return buffer.getvalue()
@@ -1,28 +1,157 @@
 import streamlit as st
 import bcrypt
 import json
-import os
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from pathlib import Path
 
+import constants as ct
+import tracing
+from artifact_store import artifact_store
+
 # =========================
 # ユーザー認証システム
 # =========================
 
 # ユーザーデータベースを外部ファイルから読み込み
 # .pathファイルにbcryptでハッシュ化されたパスワードを保存
-def load_users():
+class UserStore:
+    """
+    .pathファイルのユーザー情報（全セッションで共有）
+    - ファイルの更新日時が変わったら読み込み直すため、ユーザーの追加・変更にアプリの再起動は不要
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._users = {}
+        self._mtime = None
+
+    def get(self):
+        """
+        ユーザー情報を取得（ファイルが更新されていれば読み込み直す）
+        Returns:
+            ユーザー名とbcryptのハッシュの辞書（ファイルがない場合は空）
+        """
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._mtime:
+                if mtime is None:
+                    self._users = {}
+                    self._mtime = None
+                else:
+                    try:
+                        with open(self.path, 'r', encoding='utf-8') as f:
+                            self._users = json.load(f)
+                        self._mtime = mtime
+                    except json.JSONDecodeError:
+                        # 書き込み途中のファイルは読み込まず、前回の内容を使う（次回の呼び出しで再読み込み）
+                        pass
+            return self._users
+
+
+class LoginThrottled(Exception):
     """
-    .pathファイルからユーザー情報を読み込む
+    ログイン試行が制限されたため、パスワードを検証しなかったことを表す例外
+    Attributes:
+        reason: LoginThrottle.LOCKED（失敗が続いたため一定時間受け付けない）
+            / LoginThrottle.PENDING（検証中の試行が多いため受け付けない）
     """
-    path_file = Path(__file__).parent / ".path"
-    if path_file.exists():
-        with open(path_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    else:
-        st.error("認証ファイルが見つかりません。")
-        return {}
 
-USERS = load_users()
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class LoginThrottle:
+    """
+    ユーザーごとのログイン試行の制限（全セッションで共有）
+    - 失敗が続いたユーザーは一定時間ログインを受け付けない
+    - 検証中の試行も失敗回数に含め、複数セッションからの同時試行で制限をすり抜けられないようにする
+    """
+
+    LOCKED = "locked"
+    PENDING = "pending"
+
+    def __init__(self, max_failures, lockout_seconds):
+        self.max_failures = max_failures
+        self.lockout_seconds = lockout_seconds
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._in_flight = {}
+        self._locked_until = {}
+
+    def retry_after(self, username):
+        """
+        ログインを受け付けるまでの残り秒数を取得
+        Returns:
+            残り秒数（受け付け可能な場合は0）
+        """
+        with self._lock:
+            return max(0.0, self._locked_until.get(username, 0.0) - time.monotonic())
+
+    def acquire(self, username):
+        """
+        ログイン試行を開始（受け付けた場合は、検証後に必ず release を呼ぶこと）
+        Returns:
+            試行を受け付けた場合はNone、受け付けない場合はその理由（LOCKED / PENDING）
+        """
+        with self._lock:
+            if self._locked_until.get(username, 0.0) > time.monotonic():
+                return self.LOCKED
+            in_flight = self._in_flight.get(username, 0)
+            if self._failures.get(username, 0) + in_flight >= self.max_failures:
+                return self.PENDING
+            self._in_flight[username] = in_flight + 1
+            return None
+
+    def release(self, username, success):
+        """
+        ログイン試行を終了し、結果を記録
+        Args:
+            username: ユーザー名
+            success: 成功した場合はTrue、失敗した場合（時間内に検証できなかった場合を含む）はFalse、
+                エラーで検証できなかった場合はNone
+        """
+        with self._lock:
+            self._in_flight[username] -= 1
+            if not self._in_flight[username]:
+                del self._in_flight[username]
+
+            if success:
+                self._failures.pop(username, None)
+                self._locked_until.pop(username, None)
+            elif success is False:
+                failures = self._failures.get(username, 0) + 1
+                if failures >= self.max_failures:
+                    self._locked_until[username] = time.monotonic() + self.lockout_seconds
+                    failures = 0
+                self._failures[username] = failures
+
+
+user_store = UserStore(Path(__file__).parent / ".path")
+login_throttle = LoginThrottle(ct.LOGIN_MAX_FAILURES, ct.LOGIN_LOCKOUT_SECONDS)
+
+# bcryptの検証は1回あたり数百ミリ秒CPUを使うため、全セッションで共有するスレッド数を上限にして、
+# 大勢が同時にログインしてもCPUを奪い合わず、ほかのセッションの処理が止まらないようにする
+_login_executor = ThreadPoolExecutor(
+    max_workers=ct.LOGIN_MAX_WORKERS,
+    thread_name_prefix="login"
+)
+
+
+def _check_password(password, stored_hash, submitted_at):
+    """
+    パスワードをbcryptで検証（検証用スレッドで実行）
+    """
+    with tracing.stage("login", queue_ms=round((time.perf_counter() - submitted_at) * 1000, 1)):
+        return bcrypt.checkpw(password, stored_hash)
 
 
 def verify_credentials(username: str, password: str) -> bool:
@@ -35,11 +164,34 @@ def verify_credentials(username: str, password: str) -> bool:
         
     Returns:
         認証が成功した場合はTrue、失敗した場合はFalse
+
+    Raises:
+        LoginThrottled: 試行が制限されているため、検証しなかった場合
+        TimeoutError: 検証待ちが混み合い、制限時間内に検証できなかった場合（失敗として数える）
     """
-    if username in USERS:
-        stored_hash = USERS[username].encode('utf-8')
-        return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
-    return False
+    users = user_store.get()
+    if username not in users:
+        return False
+    reason = login_throttle.acquire(username)
+    if reason:
+        raise LoginThrottled(reason)
+
+    success = None
+    try:
+        future = tracing.submit(
+            _login_executor, _check_password,
+            password.encode('utf-8'), users[username].encode('utf-8'), time.perf_counter()
+        )
+        try:
+            success = future.result(timeout=ct.LOGIN_TIMEOUT)
+        except TimeoutError:
+            # 検証用スレッドを埋めて制限をすり抜けられないよう、時間内に検証できなかった試行も失敗として数える
+            future.cancel()
+            success = False
+            raise
+        return success
+    finally:
+        login_throttle.release(username, success)
 
 
 def login():
@@ -60,7 +212,31 @@ def login():
         if submit:
             if not username or not password:
                 st.error("ユーザー名とパスワードを入力してください。")
-            elif verify_credentials(username, password):
+                return
+            if not user_store.get():
+                st.error("認証ファイルが見つかりません。")
+                return
+
+            retry_after = login_throttle.retry_after(username)
+            if retry_after:
+                st.error(f"ログインの失敗が続いたため、{math.ceil(retry_after)}秒後にもう一度お試しください。")
+                return
+
+            try:
+                with st.spinner("認証中..."):
+                    authenticated = verify_credentials(username, password)
+            except LoginThrottled as e:
+                if e.reason == LoginThrottle.LOCKED:
+                    retry_after = max(1, math.ceil(login_throttle.retry_after(username)))
+                    st.error(f"ログインの失敗が続いたため、{retry_after}秒後にもう一度お試しください。")
+                else:
+                    st.error("同じユーザーのログインを確認中です。少し待ってからもう一度お試しください。")
+                return
+            except TimeoutError:
+                st.error("ログインが混み合っています。しばらくしてからもう一度お試しください。")
+                return
+
+            if authenticated:
                 st.session_state.authenticated = True
                 st.session_state.username = username
                 st.success(f"ようこそ、{username}さん！")
@@ -74,6 +250,10 @@ def logout():
     ログアウト処理
     - セッションステートを完全にクリアして前のユーザーの情報を削除
     """
+    # 会話履歴から聞き直すための音声ファイルを削除
+    if "session_id" in st.session_state:
+        artifact_store.remove_session(st.session_state.session_id)
+
     # 認証情報をクリア
     st.session_state.authenticated = False
     st.session_state.username = None
@@ -0,0 +1,267 @@
+"""
+functions.py / audio_utils.py の主要な処理を、ローカルの代替APIサーバーに対して計測するベンチマーク
+
+fake_openai_server.py を同じプロセス内で起動し、OPENAI_BASE_URL をそこへ向けるため、
+ネットワークやAPIキーは不要。処理ごとの処理時間（中央値）とメモリ使用量のピークを計測し、
+保存済みのベースライン（benchmarks/baseline.json）と比較する。
+ベースラインがない処理・悪化した処理がある場合は終了コード1で終了する。
+ベースラインは計測した環境に依存するため、計測環境を変えた場合は --update-baseline で作り直す。
+
+実行方法:
+    python benchmarks/bench_functions.py [--repeat 5] [--chat-latency 0.2] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import fake_openai_server  # noqa: E402
+
+# tiktokenのエンコーディングはリポジトリ内に保存し、一度ダウンロードすればネットワークなしで計測できるようにする
+# （ダウンロードできない場合、トークン数は context_budget が文字数から概算する）
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(BENCHMARK_DIR / "tiktoken_cache"))
+
+BASELINE_PATH = BENCHMARK_DIR / "baseline.json"
+
+
+def measure(func, repeat):
+    """
+    処理時間の中央値（ミリ秒）とメモリ使用量のピーク（KB）を計測
+    """
+    func()  # 初回のみ発生するモジュール読み込み・接続確立を除く
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": round(statistics.median(durations), 2), "peak_kb": round(peak / 1024, 1)}
+
+
+@contextmanager
+def temporary_caches():
+    """
+    音声合成・応答キャッシュを空の一時キャッシュに差し替え、終了後に元に戻す
+    - 実際のキャッシュのヒットを計測したり、計測結果で実際のキャッシュを書き換えたりしないようにする
+    """
+    import constants as ct
+    import functions as ft
+    from response_cache import ResponseCache
+    from tts_cache import TTSCache
+
+    from problem_bank import ProblemBank
+
+    saved = ft.tts_cache, ft.response_cache, ft.problem_bank
+    with tempfile.TemporaryDirectory(prefix="bench_cache_") as cache_dir:
+        ft.tts_cache = TTSCache(Path(cache_dir) / "tts", ct.TTS_CACHE_MAX_BYTES)
+        ft.response_cache = ResponseCache(
+            Path(cache_dir) / "responses.sqlite3", ct.RESPONSE_CACHE_MAX_ENTRIES, ct.RESPONSE_CACHE_TTL_SECONDS
+        )
+        ft.problem_bank = ProblemBank(Path(cache_dir) / "problem_bank")
+        try:
+            yield
+        finally:
+            ft.tts_cache, ft.response_cache, ft.problem_bank = saved
+
+
+class SessionState(dict):
+    """
+    st.session_state の代わりに使う、属性でも参照できる辞書
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+class StubStreamlit:
+    """
+    session_state だけを差し替えた streamlit（スクリプトの実行中でなくても functions.py の関数を呼べるようにする）
+    """
+
+    def __init__(self, session_state):
+        self.session_state = session_state
+
+    def __getattr__(self, name):
+        import streamlit
+        return getattr(streamlit, name)
+
+
+@contextmanager
+def session(**values):
+    """
+    functions.py が参照する st.session_state を、指定した値だけを持つ新しいセッションに差し替える
+    """
+    import functions as ft
+
+    saved = ft.st
+    ft.st = StubStreamlit(SessionState(values))
+    try:
+        yield ft.st.session_state
+    finally:
+        ft.st = saved
+
+
+def build_cases(repeat_index):
+    """
+    計測対象の処理を作成（OPENAI_BASE_URL を設定してから呼ぶこと）
+    """
+    from langchain.memory import ConversationBufferMemory
+
+    import audio_utils as au
+    import clients
+    import constants as ct
+    import functions as ft
+    import scoring
+    from problem_prefetch import ProblemPrefetcher, ProblemTextQueue
+
+    openai_obj = clients.get_openai_client()
+    llm = clients.get_chat_model()
+    problem = "Could you tell me how to get to the nearest station?"
+    answer = "Could you tell me how to get to nearest station?"
+
+    pcm_data = fake_openai_server.make_pcm(10)
+    wav_data = au.pcm_to_wav(pcm_data)
+    recording = au.array_to_wav(au.wav_to_array(au.pcm_to_wav(fake_openai_server.make_pcm(5, 48000), 48000))[0], 48000)
+
+    def unique(text):
+        # キャッシュのある処理も毎回APIを呼ぶよう、呼び出しごとに入力を変える
+        repeat_index[0] += 1
+        return f"{text} ({repeat_index[0]})"
+
+    def tts():
+        ft.text_to_speech(unique(problem), openai_obj)
+
+    def transcribe():
+        ingest = au.downsample_for_transcription(recording)
+        ingest, _ = au.trim_silence(ingest)
+        ft.request_transcription(openai_obj, ingest)
+
+    def evaluation():
+        score = scoring.score_answer(problem, answer)
+        evaluation_input = ct.EVALUATION_INPUT_TEMPLATE.format(level="中級者", alignment=scoring.to_compact_json(score))
+        chain = ft.create_chain(ct.SYSTEM_TEMPLATE_EVALUATION, llm, ConversationBufferMemory(return_messages=True))
+        chain.predict(input=evaluation_input)
+
+    def create_problem():
+        # 問題バンク・先読みのない、最初の問題を作成する場合（先読みは裏側で計測に混ざらないよう行わない）
+        with session(
+            username="bench", mode=ct.MODE_3, englv="中級者", speed=1.2, llm=llm, openai_obj=openai_obj,
+            problem_prefetcher=ProblemPrefetcher(depth=0), problem_queue=ProblemTextQueue()
+        ):
+            ft.create_problem_and_play_audio()
+
+    def conversation_stream():
+        # 会話履歴・プロンプトの上限調整・計測を含め、日常英会話の1ターン分の回答を取得
+        with session(englv="中級者", llm=llm, openai_obj=openai_obj):
+            for _ in ft.stream_conversation_reply("Hello! How was your weekend?"):
+                pass
+
+    return {
+        "decode_to_wav": lambda: au.decode_to_wav(pcm_data, "pcm"),
+        "to_playable": lambda: au.to_playable(pcm_data, "pcm", 1.0),
+        "change_speed_1.2": lambda: au.change_speed(wav_data, 1.2),
+        "change_speed_0.8": lambda: au.change_speed(wav_data, 0.8),
+        "text_to_speech": tts,
+        "transcribe_audio": transcribe,
+        "create_problem_and_play_audio": create_problem,
+        "generate_problems_batch": lambda: ft.generate_problems(llm, "中級者"),
+        "evaluation_chain": evaluation,
+        "correct_user_input": lambda: ft.correct_user_input(unique(answer), "中級者", llm),
+        "translate_to_japanese": lambda: ft.translate_to_japanese(unique(problem), llm),
+        "conversation_stream": conversation_stream,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    ベースラインと比較し、許容範囲を超えて悪化した項目の名前を返す
+    - 処理時間は、倍率と差（ミリ秒）の両方が許容範囲を超えた場合のみ悪化とみなす（数ミリ秒の処理の揺らぎを除く）
+    """
+    regressions = []
+    print(f"{'処理':<32}{'中央値 ms':>11}{'基準 ms':>10}{'ピーク KB':>11}{'基準 KB':>10}  判定")
+    for name, result in results.items():
+        base = baseline.get(name)
+        verdict = "-"
+        if base:
+            slower = (
+                result["median_ms"] > base["median_ms"] * tolerance
+                and result["median_ms"] - base["median_ms"] > min_delta_ms
+            )
+            heavier = result["peak_kb"] > base["peak_kb"] * tolerance
+            verdict = "悪化" if slower or heavier else "OK"
+            if slower or heavier:
+                regressions.append(name)
+        base_ms = f"{base['median_ms']:.2f}" if base else "-"
+        base_kb = f"{base['peak_kb']:.1f}" if base else "-"
+        print(f"{name:<32}{result['median_ms']:>11.2f}{base_ms:>10}{result['peak_kb']:>11.1f}{base_kb:>10}  {verdict}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="チャットの遅延（秒）")
+    parser.add_argument("--transcription-latency", type=float, default=0.0, help="文字起こしの遅延（秒）")
+    parser.add_argument("--speech-latency", type=float, default=0.0, help="音声合成の遅延（秒）")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="ベースラインに対して許容する倍率")
+    parser.add_argument("--min-delta-ms", type=float, default=10.0, help="処理時間の悪化とみなす最小の差（ミリ秒）")
+    parser.add_argument("--only", nargs="+", help="指定した処理だけを計測")
+    parser.add_argument("--update-baseline", action="store_true", help="計測結果をベースラインとして保存")
+    args = parser.parse_args()
+
+    config = fake_openai_server.FakeOpenAIConfig(args.chat_latency, args.transcription_latency, args.speech_latency)
+    server = fake_openai_server.start_server(config)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ["OPENAI_API_KEY"] = "dummy"
+
+    results = {}
+    with temporary_caches():
+        cases = build_cases([0])
+        for name, func in cases.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(func, args.repeat)
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else {}
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    print(f"代替APIサーバーへのリクエスト数: {config.requests}")
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps({**baseline, **results}, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"ベースラインを更新しました: {BASELINE_PATH}")
+        return
+
+    # ベースラインと比較できない処理があれば、悪化を検出できないため失敗とする
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print("ベースラインがない処理: " + ", ".join(missing) + "（--update-baseline で現在の結果を保存できます）")
+    if regressions:
+        print("悪化した処理: " + ", ".join(regressions))
+    if missing or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+「発話終了」から文字起こし結果がそろうまでの待ち時間を、録音後にまとめて文字起こしする場合と比較するベンチマーク
+
+発話（正弦波）と無音を交互に並べた録音を、WebRTCと同じ20ミリ秒のフレームで実時間どおりに
+live_capture.LiveTranscriber に渡し、最後のフレームを渡してから結果がそろうまでの時間を計測する。
+比較対象は、録音全体を16kHzに変換・無音除去して1回で文字起こしする従来の処理。
+文字起こしは fake_openai_server.py に向けるため、ネットワークやAPIキーは不要。
+
+実行方法:
+    python benchmarks/bench_live_transcription.py [--repeat 3] [--transcription-latency 0.5]
+        [--transcription-latency-per-kb 0.005] [--sentences 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import fake_openai_server  # noqa: E402
+
+SAMPLE_RATE = 48000
+FRAME_MS = 20
+
+
+def make_recording(sentences, sentence_seconds, pause_seconds):
+    """
+    発話と無音を交互に並べた48kHz・モノラルの録音を作成
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(SAMPLE_RATE * sentence_seconds)) / SAMPLE_RATE
+    speech = (8000 * np.sin(2 * np.pi * 220 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))).astype(np.int16)
+    parts = []
+    for _ in range(sentences):
+        parts.append((rng.standard_normal(int(SAMPLE_RATE * pause_seconds)) * 50).astype(np.int16))
+        parts.append(speech)
+    parts.append((rng.standard_normal(int(SAMPLE_RATE * 0.2)) * 50).astype(np.int16))
+    return np.concatenate(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    parser.add_argument("--transcription-latency", type=float, default=0.5, help="文字起こしの遅延（秒）")
+    parser.add_argument(
+        "--transcription-latency-per-kb", type=float, default=0.005,
+        help="アップロードした音声1KBあたりに加える文字起こしの遅延（秒）"
+    )
+    parser.add_argument("--sentences", type=int, default=3, help="1回の発話に含める文の数")
+    parser.add_argument("--sentence-seconds", type=float, default=2.0, help="1文の長さ（秒）")
+    parser.add_argument("--pause-seconds", type=float, default=0.8, help="文の間の無音の長さ（秒）")
+    args = parser.parse_args()
+
+    config = fake_openai_server.FakeOpenAIConfig(
+        transcription_latency=args.transcription_latency,
+        transcription_latency_per_kb=args.transcription_latency_per_kb
+    )
+    server = fake_openai_server.start_server(config)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "dummy"
+
+    import audio_utils as au
+    import clients
+    import functions as ft
+    from live_capture import LiveTranscriber
+
+    openai_obj = clients.get_openai_client()
+    recording = make_recording(args.sentences, args.sentence_seconds, args.pause_seconds)
+    frame_samples = SAMPLE_RATE * FRAME_MS // 1000
+
+    live_tails = []
+    batch_tails = []
+    for _ in range(args.repeat):
+        transcriber = LiveTranscriber(partial(ft.request_transcription, openai_obj))
+        started = time.perf_counter()
+        for index, start in enumerate(range(0, len(recording), frame_samples)):
+            transcriber.add_samples(recording[start:start + frame_samples], SAMPLE_RATE)
+            # マイクからフレームが届く間隔を再現
+            time.sleep(max(0.0, started + (index + 1) * FRAME_MS / 1000 - time.perf_counter()))
+        stopped = time.perf_counter()
+        live_text, _, _ = transcriber.finish()
+        live_tails.append((time.perf_counter() - stopped) * 1000)
+
+        stopped = time.perf_counter()
+        wav_data = au.downsample_for_transcription(au.array_to_wav(recording, SAMPLE_RATE))
+        wav_data, _ = au.trim_silence(wav_data)
+        batch_text, _ = ft.request_transcription(openai_obj, wav_data)
+        batch_tails.append((time.perf_counter() - stopped) * 1000)
+
+    print(f"録音 {len(recording) / SAMPLE_RATE:.1f}秒（{args.sentences}文）/ 文字起こしの遅延 {args.transcription_latency}秒 + {args.transcription_latency_per_kb}秒/KB")
+    print(f"{'方式':<20}{'発話終了から結果まで ms':>26}")
+    print(f"{'録音後にまとめて':<20}{statistics.median(batch_tails):>26.1f}")
+    print(f"{'区間ごとに発話中から':<20}{statistics.median(live_tails):>26.1f}")
+    print(f"代替APIサーバーへのリクエスト数: {config.requests}")
+    if not live_text or not batch_text:
+        print("エラー: 文字起こし結果が空です")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+大勢のユーザーが同時にログインしたときのパスワード検証（bcrypt）を計測するベンチマーク
+
+一時ファイルにユーザー情報を作成し、次の2通りで同時ログインの待ち時間を比較する。
+- direct: 各セッションのスレッドで bcrypt.checkpw を直接実行（変更前の実装）
+- pool: auth.verify_credentials（全セッション共有のスレッドプールで検証）
+同時ログインの間、ほかのセッションの処理（短いCPU処理）がどれだけ待たされるかも計測する。
+最後に、パスワードを続けて間違えたユーザーの試行が制限されることを確認する。
+
+実行方法:
+    python benchmarks/bench_login.py [--users 40] [--rounds 12] [--workers 4]
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import bcrypt  # noqa: E402
+
+PASSWORD = "password"
+
+
+def percentile(values, ratio):
+    """
+    値のリストから指定した割合の位置の値を取得
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def measure_other_session(stop_event, latencies):
+    """
+    同時ログインの間、ほかのセッションの短い処理（約5ミリ秒のCPU処理）の所要時間を繰り返し計測
+    """
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        total = 0
+        for i in range(50000):
+            total += i * i
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.01)
+
+
+def login_storm(login, usernames):
+    """
+    全ユーザーが同時にログインし、ユーザーごとの待ち時間とほかのセッションの処理時間を計測
+    Args:
+        login: ユーザー名を受け取り、認証結果を返す関数
+        usernames: 同時にログインするユーザー名のリスト
+    """
+    stop_event = threading.Event()
+    other_latencies = []
+    other_session = threading.Thread(target=measure_other_session, args=(stop_event, other_latencies))
+    other_session.start()
+    time.sleep(0.05)
+
+    barrier = threading.Barrier(len(usernames))
+
+    def session(username):
+        barrier.wait()
+        start = time.perf_counter()
+        authenticated = login(username)
+        return (time.perf_counter() - start) * 1000, authenticated
+
+    start = time.perf_counter()
+    # Streamlitはセッションごとに別スレッドでスクリプトを実行するため、ユーザー数分のスレッドで再現する
+    with ThreadPoolExecutor(max_workers=len(usernames)) as sessions:
+        results = list(sessions.map(session, usernames))
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    stop_event.set()
+    other_session.join()
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "authenticated": sum(1 for _, authenticated in results if authenticated),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 0.95),
+        "max_ms": max(latencies),
+        "wall_ms": wall_ms,
+        "other_p95_ms": percentile(other_latencies, 0.95) if other_latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=40, help="同時にログインするユーザー数")
+    parser.add_argument("--rounds", type=int, default=12, help="bcryptのコスト")
+    parser.add_argument("--workers", type=int, help="検証用スレッド数（省略時は constants.LOGIN_MAX_WORKERS）")
+    args = parser.parse_args()
+
+    import auth
+    import constants as ct
+
+    if args.workers:
+        auth._login_executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="login")
+    workers = args.workers or ct.LOGIN_MAX_WORKERS
+
+    # コストが同じなら検証時間も同じため、ハッシュは1つだけ作成して全ユーザーで使う
+    stored_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=args.rounds)).decode("utf-8")
+    usernames = [f"student{i:02d}" for i in range(args.users)]
+
+    with tempfile.TemporaryDirectory(prefix="bench_login_") as work_dir:
+        users_path = Path(work_dir) / ".path"
+        users_path.write_text(json.dumps({username: stored_hash for username in usernames}), encoding="utf-8")
+        auth.user_store = auth.UserStore(users_path)
+
+        results = {
+            "direct": login_storm(
+                lambda username: bcrypt.checkpw(PASSWORD.encode("utf-8"), auth.user_store.get()[username].encode("utf-8")),
+                usernames
+            ),
+            f"pool({workers})": login_storm(lambda username: auth.verify_credentials(username, PASSWORD), usernames),
+        }
+
+        print(f"同時ログイン {args.users}人 / bcryptコスト {args.rounds}")
+        print(f"{'方式':<12}{'成功':>6}{'p50 ms':>10}{'p95 ms':>10}{'最大 ms':>10}{'全体 ms':>10}{'他セッションp95 ms':>20}")
+        for name, result in results.items():
+            print(
+                f"{name:<12}{result['authenticated']:>6}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                f"{result['max_ms']:>10.1f}{result['wall_ms']:>10.1f}{result['other_p95_ms']:>20.1f}"
+            )
+
+        # 続けてパスワードを間違えると、検証せずに試行を断る
+        durations = []
+        for _ in range(ct.LOGIN_MAX_FAILURES + 2):
+            start = time.perf_counter()
+            try:
+                auth.verify_credentials(usernames[0], "wrong-password")
+            except auth.LoginThrottled:
+                pass
+            durations.append((time.perf_counter() - start) * 1000)
+        try:
+            auth.verify_credentials(usernames[0], PASSWORD)
+            locked = False
+        except auth.LoginThrottled as e:
+            locked = e.reason == auth.LoginThrottle.LOCKED and auth.login_throttle.retry_after(usernames[0]) > 0
+        print(
+            f"試行制限: {ct.LOGIN_MAX_FAILURES}回失敗後の試行 {durations[-1]:.1f} ms "
+            f"（検証あり {durations[0]:.1f} ms）/ 正しいパスワードも拒否: {'OK' if locked else 'NG'}"
+        )
+
+        # ユーザー情報のファイルを更新すると、再起動せずに新しいユーザーでログインできる
+        time.sleep(0.01)
+        users_path.write_text(json.dumps({"new_student": stored_hash}), encoding="utf-8")
+        reloaded = auth.verify_credentials("new_student", PASSWORD)
+        print(f"ユーザー情報の再読み込み: {'OK' if reloaded else 'NG'}")
+
+    if results[f"pool({workers})"]["authenticated"] != args.users or not locked or not reloaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
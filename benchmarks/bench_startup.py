@@ -0,0 +1,153 @@
+"""
+アプリのコールドスタート（ログイン画面の表示まで・最初の問題文の表示まで）を計測するベンチマーク
+
+計測ごとに新しいPythonプロセスを起動し、streamlit の AppTest で main.py を実行する。
+最初の問題文の生成は fake_openai_server.py に向けるため、ネットワークやAPIキーは不要。
+キャッシュ・問題バンクの影響を受けないよう、空の一時ディレクトリを作業ディレクトリにして実行する。
+
+実行方法:
+    python benchmarks/bench_startup.py [--repeat 5] [--login-budget-ms 1500] [--first-turn-budget-ms 8000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCHMARK_DIR.parent
+sys.path.insert(0, str(APP_DIR))
+
+import fake_openai_server  # noqa: E402
+
+# tiktokenのエンコーディングはリポジトリ内に保存し、一度ダウンロードすればネットワークなしで計測できるようにする
+# （ダウンロードできない場合、トークン数は context_budget が文字数から概算する）
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(BENCHMARK_DIR / "tiktoken_cache"))
+
+# ログイン画面の表示時点で読み込まれていないことを確認するモジュール
+HEAVY_MODULES = ["openai", "langchain", "langchain_core", "langchain_openai", "tiktoken", "pydub", "scipy", "audiorecorder"]
+# ログイン後、モードを開始するまでは読み込まれていないことを確認するモジュール（音声処理・会話履歴の要約）
+# numpy はアイコン画像の表示で streamlit 自体が読み込むため対象外
+MODE_MODULES = [
+    "pydub", "scipy", "audiorecorder", "streamlit_webrtc",
+    "langchain.memory", "langchain.schema", "langchain.chains"
+]
+
+
+def run_child(scenario):
+    """
+    子プロセス側：main.py を AppTest で実行し、計測結果をJSONで標準出力に書き出す
+    Args:
+        scenario: "login"（未ログインで初回表示）/ "first_turn"（ログイン済みでディクテーションを開始）
+    """
+    import constants as ct
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(APP_DIR / "main.py"), default_timeout=120)
+    result = {}
+
+    if scenario == "login":
+        start = time.perf_counter()
+        app.run()
+        result["login_ms"] = (time.perf_counter() - start) * 1000
+        result["login_form"] = len(app.text_input) > 0
+    else:
+        app.session_state["authenticated"] = True
+        app.session_state["username"] = "bench"
+
+        start = time.perf_counter()
+        app.run()
+        result["app_ms"] = (time.perf_counter() - start) * 1000
+        result["mode_modules_after_login"] = [name for name in MODE_MODULES if name in sys.modules]
+        app.sidebar.selectbox[0].select(ct.MODE_3).run()
+        next(button for button in app.button if button.label == "開始").click().run()
+        result["first_turn_ms"] = (time.perf_counter() - start) * 1000
+        result["problem_shown"] = bool(app.session_state["problem"])
+
+    result["heavy_modules"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    result["errors"] = [error.value for error in app.error]
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def spawn(scenario, base_url):
+    """
+    親プロセス側：子プロセスを起動して計測結果を受け取る（プロセス起動を含む経過時間も計測）
+    """
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as work_dir:
+        # アイコン画像は相対パスで参照されるため、作業ディレクトリから見えるようにする
+        os.symlink(APP_DIR / "images", Path(work_dir) / "images")
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join([str(APP_DIR), str(BENCHMARK_DIR)]),
+            "OPENAI_BASE_URL": base_url,
+            "OPENAI_API_BASE": base_url,
+            "OPENAI_API_KEY": "dummy",
+        }
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--child", scenario],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = wall_ms
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="チャットの遅延（秒）")
+    parser.add_argument("--speech-latency", type=float, default=0.0, help="音声合成の遅延（秒）")
+    parser.add_argument("--login-budget-ms", type=float, default=1500, help="ログイン画面の表示までの上限（ミリ秒）")
+    parser.add_argument("--first-turn-budget-ms", type=float, default=8000, help="最初の問題文の表示までの上限（ミリ秒）")
+    parser.add_argument("--child", choices=["login", "first_turn"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    config = fake_openai_server.FakeOpenAIConfig(args.chat_latency, 0.0, args.speech_latency)
+    server = fake_openai_server.start_server(config)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    logins = [spawn("login", base_url) for _ in range(args.repeat)]
+    first_turns = [spawn("first_turn", base_url) for _ in range(args.repeat)]
+
+    login_ms = statistics.median(result["login_ms"] for result in logins)
+    first_turn_ms = statistics.median(result["first_turn_ms"] for result in first_turns)
+    rows = [
+        ("ログイン画面の表示", login_ms, statistics.median(result["process_ms"] for result in logins), args.login_budget_ms),
+        ("最初の問題文の表示", first_turn_ms, statistics.median(result["process_ms"] for result in first_turns), args.first_turn_budget_ms),
+    ]
+    print(f"{'計測項目':<20}{'中央値 ms':>11}{'プロセス全体 ms':>16}{'上限 ms':>10}  判定")
+    for name, median_ms, process_ms, budget_ms in rows:
+        print(f"{name:<20}{median_ms:>11.1f}{process_ms:>16.1f}{budget_ms:>10.0f}  {'OK' if median_ms <= budget_ms else '超過'}")
+
+    print("ログイン画面の表示時点で読み込み済みの重いモジュール: " + (", ".join(logins[0]["heavy_modules"]) or "なし"))
+    print("ログイン後・モード開始前に読み込み済みの音声処理などのモジュール: " + (", ".join(first_turns[0]["mode_modules_after_login"]) or "なし"))
+    problems = []
+    for result in first_turns:
+        if result["mode_modules_after_login"]:
+            problems.append("モード開始前に読み込まれたモジュール: " + ", ".join(result["mode_modules_after_login"]))
+    if not all(result["login_form"] for result in logins):
+        problems.append("ログインフォームが表示されませんでした")
+    if not all(result["problem_shown"] for result in first_turns):
+        problems.append("問題文が表示されませんでした")
+    for result in logins + first_turns:
+        problems.extend(result["errors"])
+    for problem in dict.fromkeys(problems):
+        print(f"エラー: {problem}")
+
+    if problems or login_ms > args.login_budget_ms or first_turn_ms > args.first_turn_budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+再生速度変更の処理時間を、旧方式（pydubの AudioSegment.speedup）と
+audio_utils.change_speed()（NumPyによるWSOLA）で比較するベンチマーク
+
+旧方式は1.0より遅い速度に対応していないため、その場合は「非対応」と表示する。
+
+実行方法:
+    python benchmarks/bench_time_stretch.py [--lengths 5 15 30 60] [--repeat 3]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+from pydub import AudioSegment
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import audio_utils as au  # noqa: E402
+import constants as ct  # noqa: E402
+from bench_tts_format import make_speech_like_pcm  # noqa: E402
+
+
+def pydub_change_speed(wav_data, speed):
+    """
+    旧方式の再生速度変更
+    """
+    audio = AudioSegment.from_wav(io.BytesIO(wav_data))
+    return au.export_wav(audio.speedup(playback_speed=speed))
+
+
+def measure(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lengths", type=float, nargs="+", default=[5, 15, 30, 60], help="音声の長さ（秒）")
+    parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    print(f"{'長さ':>6}{'速度':>6}{'pydub ms':>12}{'WSOLA ms':>12}{'倍率':>8}")
+    for seconds in args.lengths:
+        wav_data = au.pcm_to_wav(make_speech_like_pcm(seconds))
+        for speed in ct.PLAY_SPEED_OPTION:
+            if speed == 1.0:
+                continue
+            wsola_ms = measure(lambda: au.change_speed(wav_data, speed), args.repeat)
+            if speed > 1.0:
+                pydub_ms = measure(lambda: pydub_change_speed(wav_data, speed), args.repeat)
+                print(f"{seconds:>6.0f}{speed:>6.1f}{pydub_ms:>12.1f}{wsola_ms:>12.1f}{pydub_ms / wsola_ms:>7.1f}x")
+            else:
+                print(f"{seconds:>6.0f}{speed:>6.1f}{'非対応':>10}{wsola_ms:>12.1f}{'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+音声合成の出力形式ごとに、1ターンあたりの再生準備にかかるCPU時間を計測するベンチマーク
+
+旧方式（mp3 → ffmpegでwavに変換）と、ct.TTS_RESPONSE_FORMAT で選べる各形式の
+audio_utils.to_playable() を比較する。ffmpegは子プロセスで動くため、子プロセスの
+CPU時間も含めて計測する。
+
+実行方法:
+    python benchmarks/bench_tts_format.py [--seconds 10] [--repeat 5]
+"""
+import argparse
+import io
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from pydub import AudioSegment
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import audio_utils as au  # noqa: E402
+import constants as ct  # noqa: E402
+
+
+def make_speech_like_pcm(seconds, sample_rate=ct.TTS_PCM_SAMPLE_RATE):
+    """
+    TTSの出力に近い、振幅が揺らぐ16bitモノラルのPCMデータを作成
+    """
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+    signal = envelope * (np.sin(2 * np.pi * 180 * t) + 0.4 * np.sin(2 * np.pi * 720 * t))
+    return (signal / np.max(np.abs(signal)) * 0.6 * 32767).astype(np.int16).tobytes()
+
+
+def encode(pcm_data, audio_format):
+    """
+    PCMデータを各出力形式にエンコード（APIのレスポンスの代わり）
+    """
+    if audio_format == "pcm":
+        return pcm_data
+    wav_data = au.pcm_to_wav(pcm_data)
+    if audio_format == "wav":
+        return wav_data
+    audio = AudioSegment.from_wav(io.BytesIO(wav_data))
+    buffer = io.BytesIO()
+    export_format = {"opus": "ogg", "aac": "adts"}.get(audio_format, audio_format)
+    codec = {"opus": "libopus", "aac": "aac"}.get(audio_format)
+    audio.export(buffer, format=export_format, codec=codec)
+    return buffer.getvalue()
+
+
+def cpu_seconds():
+    """
+    自プロセスと子プロセス（ffmpeg）のCPU時間の合計
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure(func, repeat):
+    start = cpu_seconds()
+    for _ in range(repeat):
+        func()
+    return (cpu_seconds() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0, help="音声の長さ（秒）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    pcm_data = make_speech_like_pcm(args.seconds)
+    mp3_data = encode(pcm_data, "mp3")
+
+    baseline_ms = measure(lambda: au.convert_to_wav(mp3_data, "mp3"), args.repeat)
+    print(f"{args.seconds:.0f}秒の音声・{args.repeat}回平均のCPU時間")
+    print(f"{'方式':<24}{'CPU ms/ターン':>14}{'削減 ms':>10}{'サイズ KB':>11}")
+    print(f"{'旧方式 mp3→wav変換':<24}{baseline_ms:>14.1f}{'-':>10}{len(mp3_data) / 1024:>11.1f}")
+
+    for audio_format in ["pcm", "wav", "mp3", "opus", "aac"]:
+        try:
+            audio_data = encode(pcm_data, audio_format)
+        except Exception as e:
+            print(f"{audio_format:<24}エンコードに失敗したためスキップ: {e}")
+            continue
+        for speed in [1.0, 1.2]:
+            elapsed_ms = measure(lambda: au.to_playable(audio_data, audio_format, speed), args.repeat)
+            label = f"{audio_format} (速度{speed})"
+            print(f"{label:<24}{elapsed_ms:>14.1f}{baseline_ms - elapsed_ms:>10.1f}{len(audio_data) / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+文字起こし用アップロードの前処理（16kHz・モノラル化と圧縮）の効果を計測するベンチマーク
+
+録音直後のwav（既定では48kHz・ステレオの合成音声）と、ct.TRANSCRIBE_UPLOAD_FORMAT で
+選べる各形式のアップロードサイズ・前処理時間を比較する。
+--transcribe を付けると、OPENAI_API_KEY を使って実際に whisper-1 の往復時間も計測する。
+
+実行方法:
+    python benchmarks/bench_upload_ingest.py [--input 録音.wav] [--seconds 8] [--transcribe]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import audio_utils as au  # noqa: E402
+
+
+def make_recording(seconds, sample_rate=48000):
+    """
+    ブラウザの録音データに近い48kHz・ステレオのwavを作成（無音区間を含む）
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    syllables = (np.sin(2 * np.pi * 4 * t) > 0) & (t > 0.8) & (t < seconds - 0.8)
+    voiced = np.sin(2 * np.pi * 150 * t) + 0.5 * np.sin(2 * np.pi * 450 * t) + 0.2 * rng.standard_normal(len(t))
+    mono = np.where(syllables, voiced * 8000, rng.standard_normal(len(t)) * 40)
+    stereo = np.stack([mono, mono * 0.9], axis=1)
+    return au.array_to_wav(np.clip(stereo, -32768, 32767).astype(np.int16), sample_rate)
+
+
+def prepare(wav_data, upload_format):
+    """
+    functions.transcribe_audio() と同じ手順の前処理
+    """
+    if upload_format is None:
+        return wav_data, "audio_input.wav"
+    wav_data = au.downsample_for_transcription(wav_data)
+    wav_data, _ = au.trim_silence(wav_data)
+    return au.encode_for_upload(wav_data, upload_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", help="計測に使う録音wavファイル（省略時は合成音声）")
+    parser.add_argument("--seconds", type=float, default=8.0, help="合成音声の長さ（秒）")
+    parser.add_argument("--transcribe", action="store_true", help="whisper-1 の往復時間も計測する")
+    args = parser.parse_args()
+
+    wav_data = Path(args.input).read_bytes() if args.input else make_recording(args.seconds)
+    client = None
+    if args.transcribe:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+    header = f"{'形式':<22}{'サイズ KB':>11}{'削減率':>8}{'前処理 ms':>11}"
+    print(header + (f"{'文字起こし ms':>14}" if client else ""))
+    for label, upload_format in [("録音そのまま(wav)", None), ("16kHz mono wav", "wav"),
+                                 ("16kHz mono flac", "flac"), ("16kHz mono opus", "opus")]:
+        try:
+            # 初回のみ発生するモジュール読み込みを計測から除くため、1回空実行する
+            prepare(wav_data, upload_format)
+        except Exception as e:
+            print(f"{label:<22}変換に失敗したためスキップ: {e}")
+            continue
+        start = time.perf_counter()
+        upload_data, upload_filename = prepare(wav_data, upload_format)
+        prepare_ms = (time.perf_counter() - start) * 1000
+        line = f"{label:<22}{len(upload_data) / 1024:>11.1f}{len(wav_data) / len(upload_data):>7.1f}x{prepare_ms:>11.1f}"
+
+        if client:
+            start = time.perf_counter()
+            client.audio.transcriptions.create(model="whisper-1", file=(upload_filename, upload_data), language="en")
+            line += f"{(time.perf_counter() - start) * 1000:>14.0f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+ベンチマーク用の、OpenAI APIの代わりに定型の応答を返すローカルHTTPサーバー
+
+チャット（ストリーミングを含む）・文字起こし・音声合成のエンドポイントに対応し、
+エンドポイントごとに応答の遅延を注入できる。ネットワークやAPIキーは不要。
+
+単体での実行方法:
+    python benchmarks/fake_openai_server.py [--port 8765] [--chat-latency 0.3]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=dummy streamlit run main.py
+"""
+import argparse
+import json
+import math
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_REPLY = (
+    "That sounds like a lovely weekend! I went hiking with my friends last Saturday. "
+    "The weather was perfect, and we saw a beautiful waterfall. What do you usually do on weekends?"
+)
+TRANSCRIPT_TEXT = "I would like to order a cup of coffee, please."
+PCM_SAMPLE_RATE = 24000
+SECONDS_PER_CHAR = 0.06  # 音声合成の長さの目安（1文字あたりの秒数）
+
+
+class FakeOpenAIConfig:
+    """
+    エンドポイントごとの遅延（秒）
+    """
+
+    def __init__(self, chat_latency=0.0, transcription_latency=0.0, speech_latency=0.0,
+                 transcription_latency_per_kb=0.0):
+        self.chat_latency = chat_latency
+        self.transcription_latency = transcription_latency
+        # 実際の文字起こしは音声が長いほど時間がかかるため、アップロードされた音声の大きさに比例する遅延も加える
+        self.transcription_latency_per_kb = transcription_latency_per_kb
+        self.speech_latency = speech_latency
+        self.requests = 0
+
+
+def make_pcm(seconds, sample_rate=PCM_SAMPLE_RATE):
+    """
+    音声合成の応答として返す16bitモノラルのPCM（正弦波）
+    """
+    frames = int(seconds * sample_rate)
+    return b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / sample_rate)))
+        for i in range(frames)
+    )
+
+
+def make_wav(pcm_data, sample_rate=PCM_SAMPLE_RATE):
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm_data), b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", len(pcm_data)
+    )
+    return header + pcm_data
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # ヘッダーと本文を別々に送るため、Nagleアルゴリズムと遅延ACKで応答ごとに約40ミリ秒待たされないようにする
+        disable_nagle_algorithm = True
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length)
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, payload):
+            self._send(200, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def do_POST(self):
+            config.requests += 1
+            body = self._read_body()
+            if self.path.endswith("/chat/completions"):
+                self._chat(json.loads(body))
+            elif self.path.endswith("/audio/transcriptions"):
+                self._transcription(body)
+            elif self.path.endswith("/audio/speech"):
+                self._speech(json.loads(body))
+            else:
+                self._send(404, b"{}", "application/json")
+
+        def _chat(self, request):
+            time.sleep(config.chat_latency)
+            reply = CHAT_REPLY
+            # JSONモード（問題文のまとめて生成）では、返答の各文を問題文として返す
+            if (request.get("response_format") or {}).get("type") == "json_object":
+                reply = json.dumps({"problems": [s.strip() for s in re.split(r"(?<=[.!?]) ", CHAT_REPLY)]})
+            prompt_tokens = sum(len(str(message.get("content", ""))) for message in request["messages"]) // 4
+            completion_tokens = len(reply) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            }
+            base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request["model"]}
+
+            if not request.get("stream"):
+                self._send_json({
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+                return
+
+            # Server-Sent Eventsで単語ごとに返す
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunks = [{"role": "assistant", "content": ""}]
+            chunks += [{"content": word + " "} for word in reply.split(" ")]
+            for delta in chunks:
+                self._write_event({**base, "object": "chat.completion.chunk",
+                                   "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self._write_event({**base, "object": "chat.completion.chunk",
+                               "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._write_event({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+        def _write_event(self, payload):
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _transcription(self, body):
+            time.sleep(config.transcription_latency + len(body) / 1024 * config.transcription_latency_per_kb)
+            if b'name="response_format"\r\n\r\nverbose_json' in body:
+                words = []
+                for index, word in enumerate(TRANSCRIPT_TEXT.split()):
+                    words.append({"word": word, "start": index * 0.35, "end": index * 0.35 + 0.3})
+                self._send_json({"text": TRANSCRIPT_TEXT, "language": "english",
+                                 "duration": len(words) * 0.35, "words": words})
+            else:
+                self._send_json({"text": TRANSCRIPT_TEXT})
+
+        def _speech(self, request):
+            time.sleep(config.speech_latency)
+            pcm_data = make_pcm(min(len(request["input"]) * SECONDS_PER_CHAR, 30))
+            if request.get("response_format", "mp3") == "wav":
+                self._send(200, make_wav(pcm_data), "audio/wav")
+            else:
+                # pcm以外の圧縮形式は再現しないため、pcmとして返す
+                self._send(200, pcm_data, "audio/pcm")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """
+    別スレッドでサーバーを起動
+    Returns:
+        server: 起動したサーバー（server.server_address でポートを確認できる）
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, name="fake_openai_server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="チャットの遅延（秒）")
+    parser.add_argument("--transcription-latency", type=float, default=0.0, help="文字起こしの遅延（秒）")
+    parser.add_argument("--speech-latency", type=float, default=0.0, help="音声合成の遅延（秒）")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.chat_latency, args.transcription_latency, args.speech_latency)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(config))
+    print(f"http://127.0.0.1:{args.port}/v1 で待ち受け中")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
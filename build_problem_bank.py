@@ -0,0 +1,84 @@
+"""
+シャドーイング・ディクテーション用の問題文を事前に生成し、問題バンクに保存するバッチ処理
+
+英語レベルごとに問題文を生成して重複を除き、再生速度ごとの音声と、シャドーイング評価用の
+お手本の単語タイムスタンプを合わせて保存する。途中で中断しても、再実行すると続きから処理する。
+
+実行方法:
+    python build_problem_bank.py [--per-level 300] [--workers 8] [--levels 初級者 中級者]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import audio_utils as au
+import clients
+import constants as ct
+import functions as ft
+from problem_bank import problem_bank
+
+
+def render_audio(openai_obj, problem_id, problem, speeds):
+    """
+    問題文の音声を再生速度ごとに作成して保存し、お手本の単語タイムスタンプも保存
+    """
+    tts_audio = ft.text_to_speech(problem, openai_obj)
+    for speed in speeds:
+        audio_output_data, audio_mime_type = au.to_playable(tts_audio, ct.TTS_RESPONSE_FORMAT, speed)
+        problem_bank.add_audio(problem_id, speed, audio_output_data, audio_mime_type)
+
+    wav_data = au.decode_to_wav(tts_audio, ct.TTS_RESPONSE_FORMAT)
+    _, reference_words = ft.request_transcription(
+        openai_obj, au.downsample_for_transcription(wav_data), word_timestamps=True
+    )
+    problem_bank.set_reference_timing(problem_id, reference_words)
+
+
+def build_level(executor, llm, openai_obj, level, per_level, max_attempts):
+    """
+    1つの英語レベルの問題数が per_level に達するまで、問題文を生成して保存
+    """
+    attempts = 0
+    while problem_bank.count(level) < per_level and attempts < max_attempts:
+        batch_size = min(per_level - problem_bank.count(level), max_attempts - attempts)
+        attempts += batch_size
+        # 1回のLLM呼び出しで ct.PROBLEM_BATCH_SIZE 文ずつ生成
+        num_calls = -(-batch_size // ct.PROBLEM_BATCH_SIZE)
+        batches = executor.map(lambda _: ft.generate_problem_batch(llm, level), range(num_calls))
+        problems = [problem for batch in batches for problem in batch]
+
+        added = []
+        for problem in problems:
+            problem_id = problem_bank.add_problem(level, problem)
+            if problem_id is not None:
+                added.append((problem_id, problem))
+        list(executor.map(
+            lambda item: render_audio(openai_obj, item[0], item[1], ct.PLAY_SPEED_OPTION), added
+        ))
+        print(f"{level}: {problem_bank.count(level)}/{per_level}問（重複 {len(problems) - len(added)}件）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--per-level", type=int, default=300, help="英語レベルごとの問題数")
+    parser.add_argument("--workers", type=int, default=8, help="API呼び出しの並列数")
+    parser.add_argument("--levels", nargs="+", default=ct.ENGLISH_LEVEL_OPTION, help="対象の英語レベル")
+    args = parser.parse_args()
+
+    load_dotenv()
+    llm = clients.get_chat_model()
+    openai_obj = clients.get_openai_client()
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # 前回中断した問題の音声を補完
+        incomplete = problem_bank.missing_audio(ct.PLAY_SPEED_OPTION)
+        list(executor.map(lambda item: render_audio(openai_obj, *item), incomplete))
+
+        for level in args.levels:
+            # 重複ばかりになった場合に打ち切るため、試行回数に上限を設ける
+            build_level(executor, llm, openai_obj, level, args.per_level, args.per_level * 3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import threading
+
+import httpx
+from openai import OpenAI
+from langchain_openai import ChatOpenAI
+
+import constants as ct
+
+# =========================
+# プロセス共通のAPIクライアント
+# =========================
+# OpenAI / ChatOpenAI のクライアントはスレッドセーフなため、全セッションで1つのHTTP接続プールを共有する。
+# セッションごとの状態（会話履歴など）は、これまでどおり st.session_state に持たせる。
+
+_lock = threading.Lock()
+_http_client = None
+_openai_client = None
+_chat_models = {}
+
+
+class ConnectionStats:
+    """
+    HTTPリクエスト数と新規接続数を数え、接続の再利用率を求める
+    - httpxのtrace拡張で、TCP接続が新たに張られたタイミングを検知する
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def snapshot(self):
+        """
+        接続の利用状況を取得
+        Returns:
+            リクエスト数・新規接続数・再利用率の辞書
+        """
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+def get_http_client():
+    """
+    全APIクライアントで共有するHTTPクライアント（keep-alive付きの接続プール）を取得
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=ct.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=ct.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=ct.HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(ct.HTTP_TIMEOUT, connect=ct.HTTP_CONNECT_TIMEOUT),
+                event_hooks={"request": [connection_stats.on_request]}
+            )
+        return _http_client
+
+
+def get_openai_client():
+    """
+    全セッションで共有するOpenAIのオブジェクトを取得
+    """
+    global _openai_client
+    http_client = get_http_client()
+    with _lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=http_client)
+        return _openai_client
+
+
+def get_chat_model(model_name=ct.LLM_MODEL, temperature=ct.LLM_TEMPERATURE):
+    """
+    全セッションで共有するChatOpenAIのオブジェクトを取得（モデル名と温度ごとに1つ）
+    """
+    http_client = get_http_client()
+    with _lock:
+        key = (model_name, temperature)
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(
+                model_name=model_name,
+                temperature=temperature,
+                http_client=http_client,
+                # ストリーミング時もトークン使用量を受け取り、計測に使う
+                stream_usage=True
+            )
+        return _chat_models[key]
@@ -6,17 +6,142 @@ USER_ICON_PATH = "images/user_icon.jpg"
 AI_ICON_PATH = "images/ai_icon.jpg"
 AUDIO_INPUT_DIR = "audio/input"
 AUDIO_OUTPUT_DIR = "audio/output"
+TTS_CACHE_DIR = "audio/cache"
+RESPONSE_CACHE_PATH = "cache/responses.sqlite3"
+PROBLEM_BANK_DIR = "problem_bank"
 PLAY_SPEED_OPTION = [2.0, 1.5, 1.2, 1.0, 0.8, 0.6]
 ENGLISH_LEVEL_OPTION = ["初級者", "中級者", "上級者"]
+HISTORY_PAGE_SIZE = 20  # 会話履歴を一度に表示するメッセージ数（それより前はボタンを押した分だけ表示）
+
+# 文字起こし用にアップロードする音声の形式
+# 録音データ（44.1/48kHz・ステレオのことが多い）を16kHz・モノラルに変換してから圧縮する
+# - "flac": 可逆圧縮。認識精度に影響しない（既定）
+# - "opus": 非可逆圧縮。モバイル回線向けに最も小さくなる
+# - "wav": 圧縮しない（ffmpegを使わない）
+TRANSCRIBE_UPLOAD_FORMAT = "flac"
+TRANSCRIBE_SAMPLE_RATE = 16000
+TRANSCRIBE_OPUS_BITRATE = "24k"
+
+# シャドーイングの発話タイミング評価の設定
+FLUENCY_LONG_PAUSE_SECONDS = 0.5  # これ以上の単語間の無音を「長い間」とみなす
+FLUENCY_REFERENCE_CACHE_SIZE = 1000  # お手本音声の単語タイムスタンプを保持する問題数
+FLUENCY_REFERENCE_MAX_WORKERS = 4  # お手本音声の文字起こしを裏側で実行する、全セッション共有のスレッド数
+
+# 文字起こし前の発話区間検出（VAD）の設定
+TRANSCRIBE_MIN_SECONDS = 0.5  # これより短い発話は文字起こしせずに警告を表示
+VAD_FRAME_MS = 20  # 発話判定を行うフレームの長さ（ミリ秒）
+VAD_MIN_RMS = 300  # 発話とみなす最小の音量（16bitの振幅）
+VAD_NOISE_RATIO = 3.0  # 背景雑音の音量の何倍以上を発話とみなすか
+VAD_EDGE_MS = 100  # 背景雑音の推定に使う、音声の先頭・末尾の長さ（ミリ秒）
+VAD_CLEAR_NOISE_RATIO = 10.0  # 背景雑音の推定値が発話の音量のこの分の1以下の場合のみ、推定値を使う（無音の少ない録音で小声を無音とみなさない）
+VAD_ZCR_THRESHOLD = 0.25  # 子音（摩擦音）とみなすゼロ交差率
+VAD_PADDING_MS = 200  # 発話区間の前後に残す余白（ミリ秒）
+
+# WebRTCの音声入力のリアルタイム文字起こし（streamlit-webrtc がインストールされている場合のみ選択可能）
+LIVE_SEGMENT_SILENCE_MS = 500  # 発話区間（前後の余白を含む）の後にこの長さの無音が続いたら、区間を確定して文字起こし
+LIVE_SEGMENT_MAX_SECONDS = 15  # 無音がなくても、この長さで区間を区切る
+LIVE_VAD_INTERVAL_MS = 300  # 発話区間の判定を行う間隔（ミリ秒）
+LIVE_TRANSCRIBE_MAX_WORKERS = 8  # 全セッションで共有する文字起こし用スレッド数
+LIVE_PREVIEW_INTERVAL = 0.5  # 発話中に途中経過の文字起こし結果を更新する間隔（秒）
+WEBRTC_ICE_SERVERS = [{"urls": ["stun:stun.l.google.com:19302"]}]
+
+# 日常英会話の回答を文単位で読み上げる際の設定
+TTS_STREAM_MAX_WORKERS = 4  # 文単位の音声合成を並行実行するスレッド数
+TTS_STREAM_MIN_SENTENCE_CHARS = 12  # これより短い文は次の文とまとめて読み上げる
+
+# LLMの設定
+LLM_MODEL = "gpt-4o-mini"
+LLM_TEMPERATURE = 0.5
+
+# コストの概算に使う単価（米ドル）
+LLM_COST_PER_INPUT_TOKEN = 0.15 / 1_000_000
+LLM_COST_PER_CACHED_INPUT_TOKEN = 0.075 / 1_000_000  # プロンプトキャッシュが使われた入力トークン
+LLM_COST_PER_OUTPUT_TOKEN = 0.60 / 1_000_000
+TTS_COST_PER_CHAR = 15.0 / 1_000_000
+WHISPER_COST_PER_MINUTE = 0.006
+
+# 処理段階ごとの計測の設定
+TRACE_LOG_PATH = "logs/trace.jsonl"
+TRACE_LOG_MAX_BYTES = 10 * 1024 * 1024  # ログファイル1つあたりの容量上限
+TRACE_LOG_BACKUP_COUNT = 5  # ローテーションで残す世代数
+TRACE_SUMMARY_WINDOW = 1000  # p50/p95の集計に使う直近の件数
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464  # Prometheus形式の /metrics を公開するポート（0で無効）
+ADMIN_USERS_ENV = "ADMIN_USERS"  # サイドバーに計測結果を表示するユーザーを指定する環境変数（カンマ区切り・.envでも可）
+
+# 全セッションで共有するHTTP接続プールの設定
+HTTP_MAX_CONNECTIONS = 200  # 同時に張る接続数の上限
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 50  # 再利用のために保持しておく接続数
+HTTP_KEEPALIVE_EXPIRY = 60  # 使われていない接続を保持する秒数
+HTTP_TIMEOUT = 60  # 応答待ちのタイムアウト（秒）
+HTTP_CONNECT_TIMEOUT = 5  # 接続確立のタイムアウト（秒）
+
+# 日常英会話の1ターン内で、添削・翻訳を並行実行する設定
+TURN_TASK_MAX_WORKERS = 8  # 全セッションで共有するスレッド数
+TURN_POLL_INTERVAL = 0.1  # 読み上げ待ちの間に並行タスクの完了を確認する間隔（秒）
+
+# 会話履歴から聞き直すための音声ファイルの保存設定（全セッション合計）
+ARTIFACT_MAX_BYTES = 1024 * 1024 * 1024  # 容量上限
+ARTIFACT_MAX_AGE_SECONDS = 24 * 60 * 60  # 保存期間
+
+# 音声合成の設定
+TTS_MODEL = "tts-1"
+TTS_VOICE = "alloy"
+# 音声合成の出力形式（"pcm" / "wav" / "mp3" / "opus" / "aac"）
+# - pcm: 24kHz・16bit・モノラルの生データ。wavヘッダーを付けるだけで再生・加工でき、デコード不要
+# - mp3/opus/aac: 通信量は小さいが、再生速度の変更や文単位の連結にはデコードが必要
+TTS_RESPONSE_FORMAT = "pcm"
+TTS_PCM_SAMPLE_RATE = 24000
+
+# シャドーイング・ディクテーションの問題文の先読み
+PROBLEM_PREFETCH_DEPTH = 2  # セッションごとに先読みしておく問題数
+PROBLEM_PREFETCH_MAX_WORKERS = 8  # 全セッションで共有する先読み用スレッド数
+PROBLEM_BATCH_SIZE = 5  # 1回のLLM呼び出しで生成する問題文の数
+PROBLEM_MIN_WORDS = 4  # 生成結果として受け付ける問題文の単語数の範囲
+PROBLEM_MAX_WORDS = 35
+
+# 再生速度変更（WSOLA）で重ね合わせるフレームの長さ（ミリ秒）
+TIME_STRETCH_FRAME_MS = 30
+TTS_CACHE_MAX_BYTES = 500 * 1024 * 1024  # 音声合成キャッシュのディスク容量上限
+
+# 添削・翻訳の応答キャッシュ（ノード上の全セッションで共有）
+RESPONSE_CACHE_MAX_ENTRIES = 50000  # 保存件数の上限
+RESPONSE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 保存期間
+
+# 会話履歴の設定
+MEMORY_MAX_TOKEN_LIMIT = 1000  # 要約せずにそのまま保持する会話履歴のトークン数
+SUMMARY_MAX_WORKERS = 4  # 古い会話履歴の要約を裏側で実行する、全セッション共有のスレッド数
+EVALUATION_HISTORY_TURNS = 3  # 評価で「継続的な課題」の参考にする過去の評価の数
+
+# ログイン時のパスワード検証（bcrypt）の設定
+LOGIN_MAX_WORKERS = 4  # 全セッションで共有する検証用スレッド数（CPUコア数程度）
+LOGIN_TIMEOUT = 30  # 検証待ちのタイムアウト（秒）
+LOGIN_MAX_FAILURES = 5  # この回数続けて失敗したユーザーは一定時間ログインを受け付けない
+LOGIN_LOCKOUT_SECONDS = 60
+
+# 処理ごとのプロンプト全体のトークン数の上限（超える場合は会話履歴を古い順に削る）
+CONTEXT_TOKEN_BUDGETS = {
+    "conversation": 2000,
+    "evaluation": 1500,
+    "problem_generation": 600,
+    "correction": 600,
+    "translation": 600,
+}
+TOKENIZER_RETRY_SECONDS = 300  # tiktokenを読み込めなかった場合に、文字数からの概算を続けて再度読み込むまでの秒数
+
+# プロンプトは、プロバイダーのプロンプトキャッシュ（先頭が一致するリクエストの入力トークンを再利用する仕組み）が
+# 効くよう、固定の指示を先頭に置き、英語レベルなど毎回変わる内容は末尾に置く。
 
 # 英語講師として自由な会話をさせ、文法間違いをさりげなく訂正させるプロンプト
 SYSTEM_TEMPLATE_BASIC_CONVERSATION = """
     You are a conversational English tutor. Engage in a natural and free-flowing conversation with the user. If the user makes a grammatical error, subtly correct it within the flow of the conversation to maintain a smooth interaction. Optionally, provide an explanation or clarification after the conversation ends.
     
-    User's English Level: {level}
+    Adjust to the user's English level given below:
     - If "初級者" (Beginner): Use simple vocabulary, basic grammar (present/past tense), short sentences (5-10 words), and common daily topics.
     - If "中級者" (Intermediate): Use moderately complex vocabulary, varied grammar structures (conditionals, perfect tenses), medium-length sentences (10-15 words), and broader topics.
     - If "上級者" (Advanced): Use sophisticated vocabulary, complex grammar (subjunctive, passive voice, idioms), longer sentences (15+ words), and abstract or professional topics.
+
+    User's English Level: {level}
 """
 
 # 約15語のシンプルな英文生成を指示するプロンプト
@@ -28,40 +153,57 @@ SYSTEM_TEMPLATE_CREATE_PROBLEM = """
     - Sentences with situational nuances and emotions
     - Expressions reflecting cultural and regional contexts
 
-    User's English Level: {level}
+    Adjust to the user's English level given below:
     - If "初級者" (Beginner): Use only basic vocabulary (A1-A2 level), simple present/past tense, 8-12 words, avoid idioms.
     - If "中級者" (Intermediate): Use moderate vocabulary (B1-B2 level), include phrasal verbs, 12-18 words, occasional idioms okay.
     - If "上級者" (Advanced): Use advanced vocabulary (C1-C2 level), complex structures, 18-25 words, idioms and cultural references encouraged.
+
+    User's English Level: {level}
 """
 
-# 問題文と回答を比較し、評価結果の生成を支持するプロンプトを作成
-SYSTEM_TEMPLATE_EVALUATION = """
-    あなたは英語学習の専門家です。
-    以下の「LLMによる問題文」と「ユーザーによる回答文」を比較し、分析してください：
+# 1回の呼び出しで複数の問題文をJSONで生成させるプロンプト（1文ごとのシステムプロンプトの送信を省く）
+SYSTEM_TEMPLATE_CREATE_PROBLEM_BATCH = """
+    Generate the requested number of different sentences that reflect natural English used in daily conversations, workplace, and social settings:
+    - Casual conversational expressions
+    - Polite business language
+    - Friendly phrases used among friends
+    - Sentences with situational nuances and emotions
+    - Expressions reflecting cultural and regional contexts
+
+    Adjust to the user's English level given below:
+    - If "初級者" (Beginner): Use only basic vocabulary (A1-A2 level), simple present/past tense, 8-12 words, avoid idioms.
+    - If "中級者" (Intermediate): Use moderate vocabulary (B1-B2 level), include phrasal verbs, 12-18 words, occasional idioms okay.
+    - If "上級者" (Advanced): Use advanced vocabulary (C1-C2 level), complex structures, 18-25 words, idioms and cultural references encouraged.
 
-    【LLMによる問題文】
-    問題文：{llm_text}
+    Respond only with a JSON object in this format: {{"problems": ["sentence 1", "sentence 2"]}}
 
-    【ユーザーによる回答文】
-    回答文：{user_text}
+    Number of sentences: {count}
+    User's English Level: {level}
+"""
 
-    【ユーザーの英語レベル】
-    {level}
+# 単語単位の比較結果をもとに、評価コメントの生成を指示するプロンプト
+# 単語の正誤（【評価】）は scoring.py で算出して表示済みのため、LLMにはコメントのみを生成させる
+# 毎回変わる比較結果・英語レベルはシステムプロンプトに含めず、EVALUATION_INPUT_TEMPLATE でユーザーのメッセージとして渡す
+SYSTEM_TEMPLATE_EVALUATION = """
+    あなたは英語学習の専門家です。
+    ユーザーのメッセージとして、ユーザーの英語レベルと、ディクテーション・シャドーイングの「問題文」と
+    「ユーザーによる回答文」を単語単位で比較した結果のJSONが与えられます
+    （wer: 単語誤り率、missing: 抜けた単語、extra: 余分な単語、substituted: 聞き違えた単語）。
+    シャドーイングの場合は timing も含まれます（rate_wpm / reference_rate_wpm: 学習者・お手本の話す速さ（語/分）、
+    rate_ratio: お手本に対する速さの比、long_pauses / max_pause: 長い間の回数・最長の間（秒）、
+    mean_lag / final_lag: お手本からの平均の遅れ・文末での遅れ（秒））。
 
     【分析項目】
-    1. 単語の正確性（誤った単語、抜け落ちた単語、追加された単語）
-    2. 文法的な正確性
-    3. 文の完成度
-    4. 会話履歴から見られる繰り返しのミスパターン（過去のやり取りから学習）
+    1. 間違えた単語の傾向（音の似た単語、機能語の抜け落ちなど）
+    2. 文法的な観点から見た間違いの原因
+    3. 会話履歴から見られる繰り返しのミスパターン（過去のやり取りから学習）
+    4. timing がある場合は、お手本のペースについていけているか（速さ・間・遅れ）
 
-    **重要**: 会話履歴（memory）があれば、過去のフィードバックと今回のパフォーマンスを比較し、改善点や継続的な課題を指摘してください。
+    **重要**: 単語ごとの正誤はすでにユーザーに表示済みです。比較結果を繰り返し列挙せず、原因と対策に絞ってください。
+    会話履歴（memory）があれば、過去のフィードバックと今回のパフォーマンスを比較し、改善点や継続的な課題を指摘してください。
 
-    フィードバックは以下のフォーマットで日本語で提供してください：
+    フィードバックは以下のフォーマットで日本語で簡潔に提供してください：
 
-    【評価】 # ここで改行を入れる
-    ✓ 正確に再現できた部分 # 項目を複数記載
-    △ 改善が必要な部分 # 項目を複数記載
-    
     【継続的な課題】（会話履歴がある場合のみ）
     繰り返し見られるミスパターンや改善傾向
     
@@ -69,4 +211,14 @@ SYSTEM_TEMPLATE_EVALUATION = """
     レベルに応じた次回の練習のためのポイント
 
     ユーザーの努力を認め、前向きな姿勢で次の練習に取り組めるような励ましのコメントを含めてください。
-"""
\ No newline at end of file
+"""
+
+# 評価のたびに変わる内容（ユーザーのメッセージとして、会話履歴の後ろに置く）
+EVALUATION_INPUT_TEMPLATE = """【ユーザーの英語レベル】
+{level}
+
+【比較結果】
+{alignment}"""
+
+# 問題文と回答が完全に一致した場合の評価コメント（LLMは呼ばない）
+EVALUATION_PERFECT_MESSAGE = "🎉 完璧です！問題文を正確に再現できました。この調子で次の問題にも挑戦しましょう。"
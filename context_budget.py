@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+
+from langchain_core.messages import SystemMessage
+
+import constants as ct
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# 処理ごとのプロンプトのトークン数の上限
+# =========================
+# 日常英会話・評価・問題文生成・添削・翻訳のそれぞれに、プロンプト全体のトークン数の上限を設ける。
+# LLMを呼ぶ前にtiktokenでトークン数を数え、上限を超える場合は会話履歴を古い順に削る。
+# 上限・送信前のトークン数・削ったメッセージ数は tracing の記録に含めて報告する。
+
+# メッセージ1件ごと・応答の開始に加わるトークン数（OpenAIのチャット形式の概算）
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+# トークナイザーを読み込めない場合の概算（英語・日本語混じりのテキストで、おおよそ3文字あたり1トークン）
+CHARS_PER_TOKEN_ESTIMATE = 3
+
+
+# 読み込んだトークナイザーと、読み込みに失敗した場合の次に読み込みを試す時刻
+_encoding = None
+_encoding_retry_at = 0.0
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """
+    LLMのモデルに対応するトークナイザー（読み込めた場合のみ保持し、以降は再利用する）
+    - tiktokenは初回にエンコーディングのファイルをダウンロードするため、ネットワークがない環境などで
+      読み込めない場合はNoneを返し、文字数からの概算に切り替える（トークン数の報告でLLMの呼び出しを止めない）
+    - 一時的な失敗で概算のままにならないよう、一定時間後に再度読み込みを試す
+    Returns:
+        tiktokenのエンコーディング（読み込めない場合はNone）
+    """
+    global _encoding, _encoding_retry_at
+    if _encoding is not None:
+        return _encoding
+
+    if time.monotonic() < _encoding_retry_at:
+        return None
+    # ほかのスレッドが読み込み中の場合は待たずに概算する
+    if not _encoding_lock.acquire(blocking=False):
+        return None
+    try:
+        if _encoding is not None or time.monotonic() < _encoding_retry_at:
+            return _encoding
+        try:
+            import tiktoken
+
+            try:
+                _encoding = tiktoken.encoding_for_model(ct.LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            _encoding_retry_at = time.monotonic() + ct.TOKENIZER_RETRY_SECONDS
+            logger.warning(
+                "tiktokenのエンコーディングを読み込めないため、%d秒間はトークン数を文字数から概算します: %s",
+                ct.TOKENIZER_RETRY_SECONDS, e
+            )
+        return _encoding
+    finally:
+        _encoding_lock.release()
+
+
+def _count_text_tokens(text):
+    """
+    テキストのトークン数（トークナイザーを読み込めない場合は文字数からの概算）
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN_ESTIMATE
+    return len(encoding.encode(text))
+
+
+def count_tokens(messages):
+    """
+    メッセージのリストをLLMに送った場合のトークン数
+    Args:
+        messages: LangChainのメッセージのリスト
+    Returns:
+        トークン数
+    """
+    num_tokens = TOKENS_PER_REPLY
+    for message in messages:
+        num_tokens += TOKENS_PER_MESSAGE + _count_text_tokens(message.content)
+    return num_tokens
+
+
+def _split_summary(history):
+    """
+    会話履歴の先頭にある要約と、それ以降のメッセージに分ける
+    """
+    if history and isinstance(history[0], SystemMessage):
+        return history[:1], history[1:]
+    return [], history
+
+
+def fit_history(task, history, fixed_tokens):
+    """
+    会話履歴を処理ごとの上限に収まるように削る
+    - 新しいメッセージを優先して残し、古いメッセージから順に削る
+    - 要約は残りのメッセージより優先して残すが、要約だけで上限を超える場合は削る
+    Args:
+        task: 処理の名前（ct.CONTEXT_TOKEN_BUDGETS のキー）
+        history: 会話履歴のメッセージのリスト
+        fixed_tokens: 会話履歴以外（システムプロンプト・入力）のトークン数
+    Returns:
+        history: 上限に収まる会話履歴
+        truncated: 削ったメッセージ数
+    """
+    available = ct.CONTEXT_TOKEN_BUDGETS[task] - fixed_tokens
+    summary, messages = _split_summary(history)
+
+    summary_tokens = count_tokens(summary) - TOKENS_PER_REPLY if summary else 0
+    if summary_tokens > available:
+        summary, summary_tokens = [], 0
+    available -= summary_tokens
+
+    kept = []
+    for message in reversed(messages):
+        message_tokens = count_tokens([message]) - TOKENS_PER_REPLY
+        if message_tokens > available:
+            break
+        kept.append(message)
+        available -= message_tokens
+    kept.reverse()
+
+    return summary + kept, len(history) - len(summary) - len(kept)
+
+
+def build_messages(task, prompt, memory, user_input, record):
+    """
+    Chainのプロンプトと会話履歴から、処理ごとの上限に収めたメッセージを作成
+    Args:
+        task: 処理の名前（ct.CONTEXT_TOKEN_BUDGETS のキー）
+        prompt: create_chain() で作成したChainのプロンプト
+        memory: 会話履歴
+        user_input: ユーザーの入力
+        record: tracing.stage() が返した辞書（上限・トークン数・削ったメッセージ数を記録）
+    Returns:
+        LLMに送るメッセージのリスト
+    """
+    history = memory.load_memory_variables({})[memory.memory_key]
+    fixed_tokens = count_tokens(prompt.format_messages(history=[], input=user_input))
+    history, truncated = fit_history(task, history, fixed_tokens)
+    messages = prompt.format_messages(history=history, input=user_input)
+    report(task, messages, record, truncated)
+    return messages
+
+
+def report(task, messages, record, truncated=0):
+    """
+    処理ごとの上限と送信前のトークン数を記録
+    Args:
+        task: 処理の名前（ct.CONTEXT_TOKEN_BUDGETS のキー）
+        messages: LLMに送るメッセージのリスト
+        record: tracing.stage() が返した辞書
+        truncated: 上限に収めるために削ったメッセージ数
+    """
+    record["budget_tokens"] = ct.CONTEXT_TOKEN_BUDGETS[task]
+    record["preflight_tokens"] = count_tokens(messages)
+    record["preflight_estimated"] = _get_encoding() is None
+    record["truncated_messages"] = truncated
+    record["over_budget"] = record["preflight_tokens"] > record["budget_tokens"]
@@ -0,0 +1,171 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.memory import ConversationBufferWindowMemory, ConversationSummaryBufferMemory
+from pydantic import PrivateAttr
+
+import constants as ct
+import context_budget
+import tracing
+
+# =========================
+# 会話履歴の要約（バックグラウンド実行）
+# =========================
+# ConversationSummaryBufferMemory は、会話履歴がトークン数の上限を超えると save_context() の中で
+# 要約のためのLLM呼び出しを同期的に行うため、その分だけ学習者への応答が遅れる。
+# ここでは上限を超えた古いメッセージを「要約待ち」として退避し、要約は応答後に別スレッドで行う。
+# 要約が完了するまでは退避したメッセージをそのまま履歴に含め、完了後は最新の要約に置き換える。
+
+logger = logging.getLogger(__name__)
+
+# 全セッションで共有する要約用スレッドプール
+_summary_executor = ThreadPoolExecutor(
+    max_workers=ct.SUMMARY_MAX_WORKERS,
+    thread_name_prefix="memory_summary"
+)
+
+
+class BackgroundSummaryMemory(ConversationSummaryBufferMemory):
+    """
+    古い会話履歴の要約を応答の後に別スレッドで行う会話履歴
+    - メッセージごとのトークン数を保持し、履歴全体を数え直さない
+    - 次のターンでは、その時点で完了している最新の要約を使う
+    """
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _token_counts: dict = PrivateAttr(default_factory=dict)
+    _pending: list = PrivateAttr(default_factory=list)
+    _future: object = PrivateAttr(default=None)
+    _generation: int = PrivateAttr(default=0)
+
+    def _count_tokens(self, message):
+        """
+        メッセージ1件のトークン数（数えたメッセージは結果を保持して再利用）
+        """
+        cached = self._token_counts.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        # トークナイザーを読み込めない場合も会話を止めないよう、context_budget と同じ数え方（概算あり）を使う
+        num_tokens = context_budget.count_tokens([message]) - context_budget.TOKENS_PER_REPLY
+        self._token_counts[id(message)] = (message, num_tokens)
+        return num_tokens
+
+    def load_memory_variables(self, inputs):
+        """
+        最新の要約・要約待ちのメッセージ・直近のメッセージの順に履歴を返す
+        """
+        with self._lock:
+            summary = self.moving_summary_buffer
+            buffer = list(self._pending) + list(self.chat_memory.messages)
+        if summary:
+            buffer = [self.summary_message_cls(content=summary)] + buffer
+        if not self.return_messages:
+            from langchain_core.messages import get_buffer_string
+            buffer = get_buffer_string(buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        return {self.memory_key: buffer}
+
+    def prune(self):
+        """
+        上限を超えた古いメッセージを要約待ちに移し、要約を別スレッドで開始
+        """
+        with self._lock:
+            buffer = self.chat_memory.messages
+            buffer_length = sum(self._count_tokens(message) for message in buffer)
+            while buffer and buffer_length > self.max_token_limit:
+                message = buffer.pop(0)
+                buffer_length -= self._token_counts.pop(id(message))[1]
+                self._pending.append(message)
+            # 前回の要約に失敗して残っているメッセージもここで再度要約する
+            self._schedule_summary()
+
+    def _schedule_summary(self):
+        """
+        要約待ちのメッセージがあり、実行中の要約がなければ要約を開始（ロック取得中に呼ぶ）
+        """
+        if not self._pending or self._future is not None:
+            return
+        self._future = tracing.submit(
+            _summary_executor,
+            self._summarize,
+            list(self._pending),
+            self.moving_summary_buffer,
+            self._generation
+        )
+
+    def _summarize(self, messages, existing_summary, generation):
+        """
+        既存の要約に要約待ちのメッセージを加えた要約を作成（別スレッドで実行）
+        Args:
+            messages: 要約するメッセージ
+            existing_summary: 作成済みの要約
+            generation: 開始時点の世代（clear() 後に完了した結果は捨てる）
+        """
+        try:
+            with tracing.llm_stage("summarization", messages=len(messages)):
+                new_summary = self.predict_new_summary(messages, existing_summary)
+        except Exception:
+            # 要約に失敗した場合は要約待ちのまま残し、次のターンで再度要約する
+            logger.exception("会話履歴の要約に失敗しました")
+            with self._lock:
+                self._release(generation)
+            return
+
+        with self._lock:
+            if not self._release(generation):
+                return
+            self.moving_summary_buffer = new_summary
+            del self._pending[:len(messages)]
+            # 要約中に増えた要約待ちのメッセージがあれば続けて要約
+            self._schedule_summary()
+
+    def _release(self, generation):
+        """
+        要約を終えたスレッドが、実行中の要約の記録を外す（ロック取得中に呼ぶ）
+        - clear() 後に新しい世代の要約が始まっていれば、そちらの記録は残す
+          （同じ世代で同時に実行される要約は1つだけのため、世代が同じなら自分の要約）
+        Args:
+            generation: 要約を開始した時点の世代
+        Returns:
+            自分の要約が現在の世代のものであればTrue
+        """
+        if generation != self._generation:
+            return False
+        self._future = None
+        return True
+
+    def clear(self):
+        """
+        会話履歴・要約・要約待ちのメッセージをすべて破棄
+        """
+        with self._lock:
+            self.chat_memory.clear()
+            self.moving_summary_buffer = ""
+            self._pending.clear()
+            self._token_counts.clear()
+            self._generation += 1
+            self._future = None
+
+
+def create_memory(llm):
+    """
+    セッション用の会話履歴を作成
+    Args:
+        llm: 要約に使うChatOpenAIのオブジェクト
+    """
+    return BackgroundSummaryMemory(
+        llm=llm,
+        max_token_limit=ct.MEMORY_MAX_TOKEN_LIMIT,
+        return_messages=True
+    )
+
+
+def create_evaluation_memory():
+    """
+    ディクテーション・シャドーイングの評価専用の会話履歴を作成
+    - 日常英会話の履歴とは分け、直近の評価のみを保持する
+    """
+    return ConversationBufferWindowMemory(
+        k=ct.EVALUATION_HISTORY_TURNS,
+        return_messages=True
+    )
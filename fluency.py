@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import constants as ct
+import scoring
+
+# =========================
+# シャドーイングの発話タイミングの評価
+# =========================
+# Whisperの単語タイムスタンプを使い、お手本音声（TTS）と学習者の発話を単語単位で対応付けて、
+# 話す速さ・間の長さ・お手本からの遅れを求める。
+
+
+def expand_words(timed_words):
+    """
+    Whisperの単語タイムスタンプを、scoring.normalize_words() と同じ単位の単語に展開
+    Args:
+        timed_words: (単語, 開始秒, 終了秒) のリスト
+    Returns:
+        words: 正規化した単語のリスト
+        starts: 各単語の開始秒の配列
+        ends: 各単語の終了秒の配列
+    """
+    words, starts, ends = [], [], []
+    for word, start, end in timed_words:
+        for normalized in scoring.normalize_words(word):
+            words.append(normalized)
+            starts.append(start)
+            ends.append(end)
+    return words, np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)
+
+
+def _words_per_minute(starts, ends):
+    if len(starts) < 2:
+        return 0.0
+    span = ends[-1] - starts[0]
+    return float(len(starts) / span * 60) if span > 0 else 0.0
+
+
+def compute_metrics(reference_words, learner_words, speed=1.0):
+    """
+    お手本と学習者の単語タイムスタンプから、発話タイミングの指標を計算
+    Args:
+        reference_words: お手本音声（通常速度）の (単語, 開始秒, 終了秒) のリスト
+        learner_words: 学習者の発話の (単語, 開始秒, 終了秒) のリスト
+        speed: お手本の再生速度（お手本の時刻をこの速度に合わせて換算する）
+    Returns:
+        指標の辞書（LLMにそのまま渡せるよう丸めた値）。計算できない場合はNone
+        - rate_wpm / reference_rate_wpm: 学習者・お手本の話す速さ（語/分）
+        - rate_ratio: お手本に対する話す速さの比
+        - long_pauses / max_pause: 長い間の回数・最長の間（秒）
+        - mean_lag / final_lag: 最初の単語をそろえたときの、お手本からの平均の遅れ・文末での遅れ（秒）
+    """
+    reference_tokens, reference_starts, reference_ends = expand_words(reference_words)
+    learner_tokens, learner_starts, learner_ends = expand_words(learner_words)
+    if len(reference_tokens) < 2 or len(learner_tokens) < 2:
+        return None
+    reference_starts = reference_starts / speed
+    reference_ends = reference_ends / speed
+
+    # 単語間の無音区間
+    gaps = np.maximum(learner_starts[1:] - learner_ends[:-1], 0.0)
+    long_pauses = gaps[gaps >= ct.FLUENCY_LONG_PAUSE_SECONDS]
+
+    # 問題文と一致・置換で対応付いた単語どうしの時刻の差
+    pairs = np.array([
+        (i, j) for operation, i, j in scoring.align_indices(reference_tokens, learner_tokens)
+        if operation in ("equal", "substitute")
+    ])
+    mean_lag = final_lag = 0.0
+    if len(pairs):
+        reference_offsets = reference_starts[pairs[:, 0]] - reference_starts[pairs[0, 0]]
+        learner_offsets = learner_starts[pairs[:, 1]] - learner_starts[pairs[0, 1]]
+        lags = learner_offsets - reference_offsets
+        mean_lag = float(lags.mean())
+        final_lag = float(lags[-1])
+
+    rate_wpm = _words_per_minute(learner_starts, learner_ends)
+    reference_rate_wpm = _words_per_minute(reference_starts, reference_ends)
+    return {
+        "rate_wpm": round(rate_wpm),
+        "reference_rate_wpm": round(reference_rate_wpm),
+        "rate_ratio": round(rate_wpm / reference_rate_wpm, 2) if reference_rate_wpm else 0.0,
+        "long_pauses": int(len(long_pauses)),
+        "max_pause": round(float(gaps.max()), 2) if len(gaps) else 0.0,
+        "mean_lag": round(mean_lag, 2),
+        "final_lag": round(final_lag, 2),
+    }
+
+
+def render_metrics_markdown(metrics):
+    """
+    発話タイミングの指標を評価表示用のMarkdownにする
+    """
+    return "  \n".join([
+        f"⏱ 話す速さ: {metrics['rate_wpm']}語/分（お手本の{metrics['rate_ratio']:.0%}）",
+        f"⏱ 長い間: {metrics['long_pauses']}回（最長{metrics['max_pause']:.1f}秒）",
+        f"⏱ お手本からの遅れ: 平均{metrics['mean_lag']:+.1f}秒 / 文末{metrics['final_lag']:+.1f}秒",
+    ])
+
+
+class ReferenceTimingCache:
+    """
+    問題文ごとのお手本音声の単語タイムスタンプを保持するLRUキャッシュ（全セッション共通）
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, problem):
+        with self._lock:
+            if problem not in self._entries:
+                return None
+            self._entries.move_to_end(problem)
+            return self._entries[problem]
+
+    def put(self, problem, timed_words):
+        with self._lock:
+            self._entries[problem] = timed_words
+            self._entries.move_to_end(problem)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+reference_timing_cache = ReferenceTimingCache(ct.FLUENCY_REFERENCE_CACHE_SIZE)
@@ -1,29 +1,81 @@
 import streamlit as st
 import os
+import re
+import importlib
+import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
 from pathlib import Path
 # import wave
 # import pyaudio
-from pydub import AudioSegment
-from audiorecorder import audiorecorder
-import numpy as np
-from scipy.io.wavfile import write
-from langchain.prompts import (
+from langchain_core.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
     MessagesPlaceholder,
 )
-from langchain.schema import SystemMessage
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationChain
+from langchain_core.messages import SystemMessage, HumanMessage
 import constants as ct
-import uuid  # 一意のファイル名生成のためにuuidをインポート
+from tts_cache import tts_cache
+from response_cache import response_cache
+from artifact_store import artifact_store
+from problem_bank import problem_bank
+import scoring
+import tracing
+import context_budget
 
-def record_audio(audio_input_file_path):
+# =========================
+# 音声処理モジュールの遅延読み込み
+# =========================
+# 音声処理（numpy・pydub）を使うモジュールは、録音・文字起こし・音声合成・発話タイミングの評価などで
+# 初めて属性を参照した時点で読み込む（ログイン後、モードを開始するまでは読み込まない）
+
+class LazyModule:
+    """
+    初めて属性を参照した時点でモジュールを読み込み、以降はそのモジュールの属性を返す
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+au = LazyModule("audio_utils")
+fluency = LazyModule("fluency")
+live_capture = LazyModule("live_capture")
+
+def render_message(message):
+    """
+    会話履歴のメッセージを1件表示
+    Args:
+        message: st.session_state.messages の要素
     """
-    音声入力を受け取って音声ファイルを作成
+    if message["role"] == "assistant":
+        with st.chat_message(message["role"], avatar=ct.AI_ICON_PATH):
+            st.markdown(message["content"])
+            # 保存期間・容量上限により削除済みの音声は表示しない
+            if message.get("audio") and os.path.exists(message["audio"]):
+                st.audio(message["audio"], format=message["audio_format"])
+    elif message["role"] == "user":
+        with st.chat_message(message["role"], avatar=ct.USER_ICON_PATH):
+            st.markdown(message["content"])
+    else:
+        st.divider()
+
+def record_audio():
+    """
+    音声入力を受け取って音声データを作成
+    Returns:
+        wav形式の音声データのバイト列
     """
+    # 録音を使うモード（日常英会話・シャドーイング）で初めて必要になった時点で読み込む
+    from audiorecorder import audiorecorder
 
     audio = audiorecorder(
         start_prompt="発話開始",
@@ -35,63 +87,221 @@ def record_audio(audio_input_file_path):
     )
 
     if len(audio) > 0:
-        audio.export(audio_input_file_path, format="wav")
+        with tracing.stage("record", audio_seconds=len(audio) / 1000.0) as record:
+            audio_input_data = au.export_wav(audio)
+            record["audio_bytes"] = len(audio_input_data)
+        return audio_input_data
     else:
         st.stop()
 
-def transcribe_audio(audio_input_file_path):
+def transcribe_audio(audio_input_data, word_timestamps=False):
     """
-    音声入力ファイルから文字起こしテキストを取得
+    音声入力データから文字起こしテキストを取得
+    - 16kHz・モノラルに変換し、前後の無音を取り除いて圧縮してからアップロードする
+    - 短すぎる・無音の音声はAPIを呼ばずに警告を返す
     Args:
-        audio_input_file_path: 音声入力ファイルのパス
+        audio_input_data: wav形式の音声入力データのバイト列
+        word_timestamps: Trueの場合、単語ごとのタイムスタンプを st.session_state.transcript_words に保存
     Returns:
-        transcript: Whisperの文字起こし結果
+        transcript_text: Whisperの文字起こし結果のテキスト（APIを呼ばなかった場合は空文字）
         warning_message: 警告メッセージ（なければNone）
     """
+    st.session_state.transcript_words = []
 
-    # 音声ファイルの長さをチェック
-    audio = AudioSegment.from_wav(audio_input_file_path)
-    duration_seconds = len(audio) / 1000.0  # ミリ秒から秒に変換
+    # 音声の長さをチェック（wavのヘッダーから取得）
+    duration_seconds = au.wav_duration(audio_input_data)
+    if duration_seconds < ct.TRANSCRIBE_MIN_SECONDS:
+        return "", "⚠️ 音声が非常に短いです。もう一度、発話してみてください。"
+
+    # 16kHz・モノラルに変換し、前後の無音を除去。発話が含まれていなければAPIを呼ばない
+    with tracing.stage("ingest", audio_seconds=duration_seconds):
+        audio_input_data = au.downsample_for_transcription(audio_input_data)
+        audio_input_data, speech_seconds = au.trim_silence(audio_input_data)
+    if speech_seconds == 0:
+        return "", "⚠️ 音声を認識できませんでした。もう一度、はっきりと発話してみてください。"
+    if speech_seconds < ct.TRANSCRIBE_MIN_SECONDS:
+        return "", "⚠️ 音声が非常に短いです。もう一度、発話してみてください。"
+
+    # 圧縮した音声を、ファイルに書き出さずメモリ上のデータのままアップロード
+    transcript_text, transcript_words = request_transcription(
+        st.session_state.openai_obj, audio_input_data, word_timestamps
+    )
+    st.session_state.transcript_words = transcript_words
     
     warning_message = None
-    
-    # 音声の長さをチェック
-    if duration_seconds < 0.5:
-        warning_message = "⚠️ 音声が非常に短いです。もう一度、発話してみてください。"
 
-    with open(audio_input_file_path, 'rb') as audio_input_file:
-        transcript = st.session_state.openai_obj.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_input_file,
-            language="en"
-        )
-    
     # 文字起こし結果が空または非常に短い場合
-    if not transcript.text or len(transcript.text.strip()) < 3:
+    if not transcript_text or len(transcript_text.strip()) < 3:
         warning_message = "⚠️ 音声を認識できませんでした。もう一度、はっきりと発話してみてください。"
-    
-    # 音声入力ファイルを削除
-    os.remove(audio_input_file_path)
 
-    return transcript, warning_message
+    return transcript_text, warning_message
 
-def save_to_wav(llm_response_audio, audio_output_file_path):
+def record_and_transcribe_live(word_timestamps=False):
     """
-    一旦mp3形式で音声ファイル作成後、wav形式に変換
+    WebRTCでマイク音声を受け取りながら、発話の区切りごとに文字起こしを進める
+    - 「発話終了」の時点で最後の区間以外の文字起こしは済んでいるため、結果をすぐに受け取れる
     Args:
-        llm_response_audio: LLMからの回答の音声データ
-        audio_output_file_path: 出力先のファイルパス
+        word_timestamps: Trueの場合、単語ごとのタイムスタンプを st.session_state.transcript_words に保存
+    Returns:
+        transcript_text: Whisperの文字起こし結果のテキスト（発話がなかった場合は空文字）
+        warning_message: 警告メッセージ（なければNone）
     """
+    # リアルタイム文字起こしを選んだ場合のみ読み込む（WebRTCのモジュールは読み込みが重い）
+    from streamlit_webrtc import webrtc_streamer
 
-    temp_audio_output_filename = f"{ct.AUDIO_OUTPUT_DIR}/temp_audio_output_{int(time.time())}.mp3"
-    with open(temp_audio_output_filename, "wb") as temp_audio_output_file:
-        temp_audio_output_file.write(llm_response_audio)
-    
-    audio_mp3 = AudioSegment.from_file(temp_audio_output_filename, format="mp3")
-    audio_mp3.export(audio_output_file_path, format="wav")
+    st.session_state.transcript_words = []
+    transcriber = st.session_state.live_transcriber
+    if transcriber is None or transcriber.word_timestamps != word_timestamps:
+        transcriber = live_capture.LiveTranscriber(partial(request_transcription, st.session_state.openai_obj), word_timestamps)
+        st.session_state.live_transcriber = transcriber
+
+    # マイク音声は受信スレッドで区切り・文字起こしを行い、ブラウザへは送り返さない
+    ctx = webrtc_streamer(
+        key="live_capture_recorder",
+        media_stream_constraints={"video": False, "audio": True},
+        rtc_configuration={"iceServers": ct.WEBRTC_ICE_SERVERS},
+        audio_frame_callback=transcriber.on_frame,
+        sendback_audio=False,
+        translations={"start": "発話開始", "stop": "発話終了"}
+    )
+
+    if ctx.state.playing:
+        # 録音中は途中経過の表示だけを一定間隔で更新し、「発話終了」による再実行を待つ
+        show_live_preview()
+        st.stop()
+
+    if not transcriber.has_audio():
+        st.stop()
+
+    st.session_state.live_transcriber = None
+    transcript_text, transcript_words, speech_seconds = transcriber.finish()
+    st.session_state.transcript_words = transcript_words
+
+    if speech_seconds == 0 or not transcript_text or len(transcript_text.strip()) < 3:
+        return transcript_text, "⚠️ 音声を認識できませんでした。もう一度、はっきりと発話してみてください。"
+
+    return transcript_text, None
+
+@st.fragment(run_every=ct.LIVE_PREVIEW_INTERVAL)
+def show_live_preview():
+    """
+    録音中に、区切りごとの文字起こし結果を途中経過として表示（一定間隔でこの部分のみ再実行）
+    """
+    transcriber = st.session_state.get("live_transcriber")
+    if transcriber is not None:
+        st.caption(transcriber.partial_text() or "発話を聞き取っています...")
+
+def request_transcription(openai_obj, wav_data, word_timestamps=False):
+    """
+    Whisperで文字起こし
+    Args:
+        openai_obj: OpenAIのオブジェクト
+        wav_data: 16kHz・モノラルのwav形式の音声データ
+        word_timestamps: 単語ごとのタイムスタンプも取得するかどうか
+    Returns:
+        transcript_text: 文字起こし結果のテキスト
+        transcript_words: (単語, 開始秒, 終了秒) のリスト（word_timestamps=False の場合は空リスト）
+    """
+    audio_seconds = au.wav_duration(wav_data)
+    upload_data, upload_filename = au.encode_for_upload(wav_data)
+    with tracing.stage(
+        "transcribe",
+        audio_bytes=len(upload_data),
+        audio_seconds=audio_seconds,
+        cost_usd=audio_seconds / 60 * ct.WHISPER_COST_PER_MINUTE
+    ):
+        if not word_timestamps:
+            transcript = openai_obj.audio.transcriptions.create(
+                model="whisper-1",
+                file=(upload_filename, upload_data),
+                language="en"
+            )
+            return transcript.text, []
+
+        transcript = openai_obj.audio.transcriptions.create(
+            model="whisper-1",
+            file=(upload_filename, upload_data),
+            language="en",
+            response_format="verbose_json",
+            timestamp_granularities=["word"]
+        )
+    transcript_words = [(word.word, word.start, word.end) for word in (transcript.words or [])]
+    return transcript.text, transcript_words
+
+# お手本音声の文字起こしを、問題文の表示を待たせずに実行するためのスレッドプール
+_reference_timing_executor = ThreadPoolExecutor(
+    max_workers=ct.FLUENCY_REFERENCE_MAX_WORKERS, thread_name_prefix="reference_timing"
+)
+# 文字起こし中の問題文と、その Future
+_reference_timing_pending = {}
+_reference_timing_lock = threading.Lock()
+
+def start_reference_timing(problem, openai_obj):
+    """
+    お手本音声の単語タイムスタンプの取得を裏側で開始（取得済み・取得中の場合は何もしない）
+    - 結果は評価時の get_reference_timing() で受け取る
+    Args:
+        problem: 問題文
+        openai_obj: OpenAIのオブジェクト
+    """
+    if fluency.reference_timing_cache.get(problem) is not None:
+        return
+    with _reference_timing_lock:
+        if problem in _reference_timing_pending:
+            return
+        future = _reference_timing_pending[problem] = tracing.submit(
+            _reference_timing_executor, _fetch_reference_timing, problem, openai_obj
+        )
+    future.add_done_callback(partial(_finish_reference_timing, problem))
+
+def _finish_reference_timing(problem, future):
+    """
+    裏側での取得が完了した問題文を、取得中の一覧から外す（失敗した場合は評価時に取得し直す）
+    """
+    with _reference_timing_lock:
+        if _reference_timing_pending.get(problem) is future:
+            del _reference_timing_pending[problem]
+
+def get_reference_timing(problem, openai_obj=None):
+    """
+    問題文のお手本音声（通常速度）の単語タイムスタンプを取得（問題文ごとにキャッシュ）
+    - 裏側で取得中の場合は完了を待つ
+    - 発話タイミングの評価は補助的なものなので、取得に失敗した場合は tracing に記録してNoneを返す
+      （単語単位の評価はそのまま表示する）
+    Args:
+        problem: 問題文
+        openai_obj: OpenAIのオブジェクト（別スレッドから呼ぶ場合は明示的に渡す）
+    Returns:
+        (単語, 開始秒, 終了秒) のリスト（取得できなかった場合はNone）
+    """
+    reference_words = fluency.reference_timing_cache.get(problem)
+    if reference_words is not None:
+        return reference_words
 
-    # 音声出力用に一時的に作ったmp3ファイルを削除
-    os.remove(temp_audio_output_filename)
+    with _reference_timing_lock:
+        future = _reference_timing_pending.get(problem)
+    try:
+        with tracing.stage("reference_timing", background=future is not None) as record:
+            if future is not None:
+                record["done"] = future.done()
+                return future.result()
+            if openai_obj is None:
+                openai_obj = st.session_state.openai_obj
+            return _fetch_reference_timing(problem, openai_obj)
+    except Exception:
+        # エラーの種類は tracing.stage が記録済み
+        return None
+
+def _fetch_reference_timing(problem, openai_obj):
+    """
+    お手本音声を合成・文字起こしして単語タイムスタンプを取得し、キャッシュに保存
+    """
+    wav_data = au.decode_to_wav(text_to_speech(problem, openai_obj), ct.TTS_RESPONSE_FORMAT)
+    _, reference_words = request_transcription(
+        openai_obj, au.downsample_for_transcription(wav_data), word_timestamps=True
+    )
+    fluency.reference_timing_cache.put(problem, reference_words)
+    return reference_words
 
 # def play_wav(audio_output_file_path, speed=1.0):
 #     """
@@ -138,92 +348,335 @@ def save_to_wav(llm_response_audio, audio_output_file_path):
 #     # LLMからの回答の音声ファイルを削除
 #     os.remove(audio_output_file_path)
 
-# ！上記関数の代替として、再生速度変更用関数を追加
-def change_speed(input_wav, output_wav, speed):
+def text_to_speech(text, openai_obj=None, speed=1.0):
     """
-    音声ファイルの再生速度を変更して保存
+    テキストを音声データ（ct.TTS_RESPONSE_FORMAT 形式）に変換
+    - 同じ内容の音声合成結果はディスクキャッシュから返す
     Args:
-        input_wav: 入力WAVファイルのパス
-        output_wav: 出力WAVファイルのパス
-        speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
+        text: 読み上げるテキスト
+        openai_obj: OpenAIのオブジェクト（別スレッドから呼ぶ場合は明示的に渡す）
+        speed: 音声合成時の読み上げ速度
+    Returns:
+        音声データのバイト列
     """
-    audio = AudioSegment.from_wav(input_wav)
-    audio = audio.speedup(playback_speed=speed)
-    audio.export(output_wav, format="wav")
+    with tracing.stage("tts", chars=len(text)) as record:
+        cache_key = tts_cache.make_key(ct.TTS_MODEL, ct.TTS_VOICE, text, speed, ct.TTS_RESPONSE_FORMAT)
+        cached_audio = tts_cache.get(cache_key)
+        record["cache_hit"] = cached_audio is not None
+        if cached_audio is not None:
+            record["audio_bytes"] = len(cached_audio)
+            return cached_audio
 
-def create_chain(system_template):
+        if openai_obj is None:
+            openai_obj = st.session_state.openai_obj
+
+        llm_response_audio = openai_obj.audio.speech.create(
+            model=ct.TTS_MODEL,
+            voice=ct.TTS_VOICE,
+            input=text,
+            speed=speed,
+            response_format=ct.TTS_RESPONSE_FORMAT
+        )
+        tts_cache.put(cache_key, llm_response_audio.content)
+        record["audio_bytes"] = len(llm_response_audio.content)
+        record["cost_usd"] = len(text) * ct.TTS_COST_PER_CHAR
+
+    return llm_response_audio.content
+
+@lru_cache(maxsize=32)
+def get_chat_prompt(system_template):
     """
-    LLMによる回答生成用のChain作成
+    システムプロンプト・会話履歴・ユーザー入力の順のプロンプトテンプレートを作成（作成済みのものは再利用）
+    Args:
+        system_template: システムプロンプト
     """
-
-    prompt = ChatPromptTemplate.from_messages([
+    return ChatPromptTemplate.from_messages([
         SystemMessage(content=system_template),
         MessagesPlaceholder(variable_name="history"),
         HumanMessagePromptTemplate.from_template("{input}")
     ])
+
+def create_chain(system_template, llm=None, memory=None):
+    """
+    LLMによる回答生成用のChain作成
+    Args:
+        system_template: システムプロンプト
+        llm: ChatOpenAIのオブジェクト（省略時はセッションのもの）
+        memory: 会話履歴（省略時はセッションのもの）
+    """
+    from langchain.chains import ConversationChain
+
     chain = ConversationChain(
-        llm=st.session_state.llm,
-        memory=st.session_state.memory,
-        prompt=prompt
+        llm=llm if llm is not None else st.session_state.llm,
+        memory=memory if memory is not None else st.session_state.memory,
+        prompt=get_chat_prompt(system_template)
     )
 
     return chain
 
-def create_problem_and_play_audio():
+def get_conversation_chain():
     """
-    問題生成と音声ファイルの再生
+    日常英会話のChainを取得（初回・英語レベルの変更後・会話リセット後のみ作成）
+    - 会話履歴（memory）も日常英会話で初めて必要になった時点で作成する
+    """
+    if "memory" not in st.session_state:
+        from conversation_memory import create_memory
+        # 古い履歴の要約は応答後に別スレッドで行い、応答を待たせない
+        st.session_state.memory = create_memory(st.session_state.llm)
+
+    if "chain_basic_conversation" not in st.session_state or st.session_state.get("prev_englv") != st.session_state.englv:
+        st.session_state.chain_basic_conversation = create_chain(
+            ct.SYSTEM_TEMPLATE_BASIC_CONVERSATION.format(level=st.session_state.englv)
+        )
+        st.session_state.prev_englv = st.session_state.englv
+
+    return st.session_state.chain_basic_conversation
+
+def get_evaluation_memory():
+    """
+    ディクテーション・シャドーイングの評価専用の会話履歴を取得（初回・会話リセット後のみ作成）
+    """
+    if "evaluation_memory" not in st.session_state:
+        from conversation_memory import create_evaluation_memory
+        st.session_state.evaluation_memory = create_evaluation_memory()
+
+    return st.session_state.evaluation_memory
+
+def generate_problem(llm, level):
+    """
+    問題文を生成
+    - 先読み用に別スレッドから呼ばれるため、会話履歴（memory）は使わず、引数の値だけで完結させる
     Args:
-        chain: 問題文生成用のChain
-        speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
-        openai_obj: OpenAIのオブジェクト
+        llm: ChatOpenAIのオブジェクト
+        level: 英語レベル
+    Returns:
+        問題文
     """
+    messages = [
+        SystemMessage(content=ct.SYSTEM_TEMPLATE_CREATE_PROBLEM.format(level=level)),
+        HumanMessage(content="")
+    ]
+    with tracing.stage("problem_generation") as record:
+        context_budget.report("problem_generation", messages, record)
+        response = llm.invoke(messages)
+        tracing.record_usage(record, response)
+    return response.content.strip()
 
-    # 問題文を生成するChainを実行し、問題文を取得
-    problem = st.session_state.chain_create_problem.predict(input="")
+def generate_problems(llm, level, count=ct.PROBLEM_BATCH_SIZE):
+    """
+    1回のLLM呼び出しで複数の問題文をJSONで生成し、検証して分割
+    - 文字列でないもの・単語数が範囲外のもの・重複するものは除く
+    Args:
+        llm: ChatOpenAIのオブジェクト
+        level: 英語レベル
+        count: 生成する問題文の数
+    Returns:
+        問題文のリスト（JSONとして読めない場合は空リスト）
+    """
+    messages = [
+        SystemMessage(content=ct.SYSTEM_TEMPLATE_CREATE_PROBLEM_BATCH.format(count=count, level=level)),
+        HumanMessage(content="")
+    ]
+    with tracing.stage("problem_generation", batch_size=count) as record:
+        context_budget.report("problem_generation", messages, record)
+        response = llm.bind(response_format={"type": "json_object"}).invoke(messages)
+        tracing.record_usage(record, response)
+
+        try:
+            candidates = json.loads(response.content).get("problems", [])
+        except (json.JSONDecodeError, AttributeError):
+            candidates = []
+
+        problems = []
+        seen = set()
+        for candidate in candidates if isinstance(candidates, list) else []:
+            if not isinstance(candidate, str):
+                continue
+            problem = " ".join(candidate.split())
+            words = scoring.normalize_words(problem)
+            if not ct.PROBLEM_MIN_WORDS <= len(words) <= ct.PROBLEM_MAX_WORDS or tuple(words) in seen:
+                continue
+            seen.add(tuple(words))
+            problems.append(problem)
+        record["generated"] = len(problems)
+
+    return problems
+
+def generate_problem_batch(llm, level):
+    """
+    問題文をまとめて生成（まとめて生成できなかった場合は1文だけ生成）
+    Returns:
+        問題文のリスト
+    """
+    return generate_problems(llm, level) or [generate_problem(llm, level)]
+
+def generate_problem_audio(llm, openai_obj, level, speed, reference_timing=False, problem_queue=None):
+    """
+    問題文と再生用の音声データを生成
+    Args:
+        llm: ChatOpenAIのオブジェクト
+        openai_obj: OpenAIのオブジェクト
+        level: 英語レベル
+        speed: 再生速度
+        reference_timing: Trueの場合、シャドーイング評価用にお手本音声の単語タイムスタンプの取得も裏側で開始する
+        problem_queue: まとめて生成した問題文のキュー（省略時は1文ずつ生成）
+    Returns:
+        problem: 問題文
+        audio_output_data: 再生速度を反映した音声データ
+        audio_mime_type: 音声データのMIMEタイプ
+    """
+    if problem_queue is not None:
+        problem = problem_queue.take(level, generate_problem_batch, llm, level)
+    else:
+        problem = generate_problem(llm, level)
 
     # LLMからの回答を音声データに変換
-    llm_response_audio = st.session_state.openai_obj.audio.speech.create(
-        model="tts-1",
-        voice="alloy",
-        input=problem
+    llm_response_audio = text_to_speech(problem, openai_obj)
+
+    # 再生速度を反映（ブラウザがそのまま再生できる場合は変換しない）
+    with tracing.stage("speed_change", speed=speed, audio_bytes=len(llm_response_audio)):
+        audio_output_data, audio_mime_type = au.to_playable(
+            llm_response_audio, ct.TTS_RESPONSE_FORMAT, speed
+        )
+
+    # お手本音声の文字起こしは評価時まで待たずに済むため、裏側で開始だけしておく
+    if reference_timing:
+        start_reference_timing(problem, openai_obj)
+
+    return problem, audio_output_data, audio_mime_type
+
+def prefetch_problems():
+    """
+    現在のモード・英語レベル・再生速度で、次の問題文と音声を裏側で先読み
+    - 条件が変わった場合、先読み済みの問題は破棄される
+    - 問題バンクにまだ解いていない問題がある場合は、LLM・音声合成を呼ばない
+    """
+    if problem_bank.available(st.session_state.username, st.session_state.englv, st.session_state.speed):
+        st.session_state.problem_prefetcher.clear()
+        return
+
+    st.session_state.problem_prefetcher.configure(
+        (st.session_state.mode, st.session_state.englv, st.session_state.speed),
+        generate_problem_audio,
+        st.session_state.llm,
+        st.session_state.openai_obj,
+        st.session_state.englv,
+        st.session_state.speed,
+        st.session_state.mode == ct.MODE_2,
+        st.session_state.problem_queue
     )
 
-    # 音声ファイルの作成
-    audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-    save_to_wav(llm_response_audio.content, audio_output_file_path)
+def create_problem_and_play_audio():
+    """
+    問題生成と再生用の音声データ作成
+    - 問題バンクにまだ解いていない問題があれば、ローカルから取り出すだけで済ませる
+    - なければ先読み済みの問題を使い、次の問題の先読みを補充する
+    Returns:
+        problem: 問題文
+        audio_output_data: 再生速度を反映した音声データ
+        audio_mime_type: 音声データのMIMEタイプ
+    """
+    with tracing.stage("problem_bank") as record:
+        banked = problem_bank.take(st.session_state.username, st.session_state.englv, st.session_state.speed)
+        record["hit"] = banked is not None
+    if banked is not None:
+        problem, audio_output_data, audio_mime_type, reference_words = banked
+        # シャドーイング評価でお手本音声を文字起こしし直さないよう、保存済みのタイムスタンプを使う
+        if reference_words:
+            fluency.reference_timing_cache.put(problem, reference_words)
+        return problem, audio_output_data, audio_mime_type
+
+    prefetched = st.session_state.problem_prefetcher.get()
+    prefetch_problems()
+    if prefetched is not None:
+        return prefetched
 
-    # 音声ファイルの再生処理を変更
-    # play_wav(audio_output_file_path, st.session_state.speed)  # 元のコードをコメントアウト
-    if st.session_state.speed != 1.0:
-        temp_audio_path = f"temp_{uuid.uuid4().hex}.wav"
-        change_speed(audio_output_file_path, temp_audio_path, st.session_state.speed)
-        audio_output_file_path = temp_audio_path
+    return generate_problem_audio(
+        st.session_state.llm,
+        st.session_state.openai_obj,
+        st.session_state.englv,
+        st.session_state.speed,
+        st.session_state.mode == ct.MODE_2,
+        st.session_state.problem_queue
+    )
 
-    return problem, llm_response_audio
+def save_problem_audio(audio_output_data, audio_mime_type):
+    """
+    問題文の音声をセッションの保存領域に置き、会話履歴から聞き直せるようにする
+    """
+    st.session_state.problem_audio = {
+        "audio": artifact_store.save(st.session_state.session_id, audio_output_data, audio_mime_type),
+        "audio_format": audio_mime_type
+    }
 
-def create_evaluation():
+def create_evaluation(evaluation_input):
     """
     ユーザー入力値の評価生成
+    - 評価専用の会話履歴を、評価の上限トークン数に収めてから送る
+    Args:
+        evaluation_input: 英語レベルと比較結果（ct.EVALUATION_INPUT_TEMPLATE）
     """
+    chain = st.session_state.chain_evaluation
+
+    with tracing.stage("evaluation") as record:
+        messages = context_budget.build_messages("evaluation", chain.prompt, chain.memory, evaluation_input, record)
+        response = chain.llm.invoke(messages)
+        tracing.record_usage(record, response)
+        llm_response_evaluation = response.content
 
-    llm_response_evaluation = st.session_state.chain_evaluation.predict(input="")
+    # predict()と同様に、比較結果と評価結果を評価専用の会話履歴に保存
+    chain.memory.save_context({"input": evaluation_input}, {"response": llm_response_evaluation})
 
     return llm_response_evaluation
 
-def correct_user_input(user_text, level):
+def show_evaluation(llm_text, user_text, learner_words=None):
     """
-    ユーザーの英語発話を添削し、より良い表現を提示
+    問題文と回答を単語単位で比較した結果をすぐに表示し、必要な場合のみLLMの評価コメントを追加
+    - 完全一致の場合はLLMを呼ばない
+    - LLMには問題文・回答文そのものではなく、比較結果のみを渡す
     Args:
-        user_text: ユーザーの英語発話
-        level: ユーザーの英語レベル
+        llm_text: 問題文
+        user_text: ユーザーの回答
+        learner_words: シャドーイングの場合、ユーザーの発話の (単語, 開始秒, 終了秒) のリスト
     Returns:
-        correction: 添削結果（改善が必要ない場合はNone）
+        会話履歴に追加する評価結果のテキスト
     """
-    correction_prompt = f"""
-You are an English grammar expert. Analyze the following English sentence and provide corrections if needed.
+    score = scoring.score_answer(llm_text, user_text)
+    score_markdown = scoring.render_score_markdown(score)
 
-User's English Level: {level}
-User's sentence: "{user_text}"
+    # シャドーイングの場合は、お手本音声との発話タイミングも評価
+    timing = None
+    reference_words = get_reference_timing(llm_text) if learner_words else None
+    if reference_words is not None:
+        timing = fluency.compute_metrics(reference_words, learner_words, st.session_state.speed)
+        if timing:
+            score_markdown += "  \n" + fluency.render_metrics_markdown(timing)
+
+    with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+        st.markdown(score_markdown)
+
+        if score["perfect"] and not (timing and timing["long_pauses"]):
+            llm_response_evaluation = ct.EVALUATION_PERFECT_MESSAGE
+        else:
+            with st.spinner('評価結果の生成中...'):
+                # システムプロンプトは固定のまま、比較結果はユーザーのメッセージとして渡す
+                evaluation_input = ct.EVALUATION_INPUT_TEMPLATE.format(
+                    level=st.session_state.englv,
+                    alignment=scoring.to_compact_json(score, timing)
+                )
+                # 日常英会話の履歴は使わず、過去の評価のみを参考にする
+                st.session_state.chain_evaluation = create_chain(
+                    ct.SYSTEM_TEMPLATE_EVALUATION, memory=get_evaluation_memory()
+                )
+                llm_response_evaluation = create_evaluation(evaluation_input)
+        st.markdown(llm_response_evaluation)
+
+    return f"{score_markdown}\n\n{llm_response_evaluation}"
+
+# 添削・翻訳のプロンプト（文面を変更すると応答キャッシュのキーが変わり、古い応答は使われなくなる）
+# プロンプトキャッシュが効くよう、固定の指示を先頭に、入力テキストを末尾に置く
+CORRECTION_PROMPT_TEMPLATE = """
+You are an English grammar expert. Analyze the English sentence given at the end and provide corrections if needed.
 
 If the sentence has grammatical errors or could be improved:
 1. Provide a corrected/improved version
@@ -238,9 +691,64 @@ Format your response as:
 
 【解説】
 [Brief explanation in Japanese]
+
+User's English Level: {level}
+User's sentence: "{user_text}"
 """
-    
-    correction = st.session_state.llm.predict(correction_prompt)
+
+TRANSLATION_PROMPT_TEMPLATE = """
+Translate the following English text to natural Japanese.
+Provide only the Japanese translation without any additional explanation.
+
+English: "{english_text}"
+
+Japanese:
+"""
+
+def predict_cached(task, llm, prompt, text, prompt_template, level=""):
+    """
+    応答キャッシュを確認し、なければLLMを呼び出して結果を保存
+    Args:
+        task: 処理の名前（"correction" / "translation"）
+        llm: ChatOpenAIのオブジェクト
+        prompt: LLMに送るプロンプト
+        text: キャッシュキーに使う入力テキスト
+        prompt_template: プロンプトの文面（キャッシュキーに使う）
+        level: キャッシュキーに使う英語レベル
+    Returns:
+        LLMの応答
+    """
+    cache_key = response_cache.make_key(task, text, level, prompt_template, llm.model_name)
+    with tracing.stage(task) as record:
+        response = response_cache.get(cache_key)
+        record["cache_hit"] = response is not None
+        if response is None:
+            messages = [HumanMessage(content=prompt)]
+            context_budget.report(task, messages, record)
+            llm_response = llm.invoke(messages)
+            tracing.record_usage(record, llm_response)
+            response = llm_response.content
+            response_cache.put(cache_key, task, response)
+
+    return response
+
+def correct_user_input(user_text, level, llm=None):
+    """
+    ユーザーの英語発話を添削し、より良い表現を提示
+    Args:
+        user_text: ユーザーの英語発話
+        level: ユーザーの英語レベル
+        llm: ChatOpenAIのオブジェクト（別スレッドから呼ぶ場合は明示的に渡す）
+    Returns:
+        correction: 添削結果（改善が必要ない場合はNone）
+    """
+    correction_prompt = CORRECTION_PROMPT_TEMPLATE.format(level=level, user_text=user_text)
+
+    if llm is None:
+        llm = st.session_state.llm
+    correction = predict_cached(
+        "correction", llm, correction_prompt, user_text, CORRECTION_PROMPT_TEMPLATE, level
+    )
     
     # 添削が不要な場合はNoneを返す
     if "Perfect" in correction or "No corrections needed" in correction:
@@ -248,24 +756,22 @@ Format your response as:
     
     return correction
 
-def translate_to_japanese(english_text):
+def translate_to_japanese(english_text, llm=None):
     """
     英語テキストを日本語に翻訳
     Args:
         english_text: 英語テキスト
+        llm: ChatOpenAIのオブジェクト（別スレッドから呼ぶ場合は明示的に渡す）
     Returns:
         japanese_text: 日本語訳
     """
-    translation_prompt = f"""
-Translate the following English text to natural Japanese.
-Provide only the Japanese translation without any additional explanation.
+    translation_prompt = TRANSLATION_PROMPT_TEMPLATE.format(english_text=english_text)
 
-English: "{english_text}"
-
-Japanese:
-"""
-    
-    japanese_text = st.session_state.llm.predict(translation_prompt)
+    if llm is None:
+        llm = st.session_state.llm
+    japanese_text = predict_cached(
+        "translation", llm, translation_prompt, english_text, TRANSLATION_PROMPT_TEMPLATE
+    )
     
     return japanese_text.strip()
 
@@ -335,4 +841,214 @@ CRITICAL: Use EXACTLY this format with markers:
         if "PERFECT" not in result.upper():
             correction = result[:500]  # 最初の部分を返す
     
-    return correction, translation
\ No newline at end of file
+    return correction, translation
+
+# =========================
+# 日常英会話の回答ストリーミング
+# =========================
+
+# 文末（. ! ? の後に閉じ引用符・括弧が続いてもよい）とその直後の空白
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+["\')\]]*\s+')
+
+# 文単位の音声合成を回答生成と並行して実行するためのスレッドプール
+_tts_executor = ThreadPoolExecutor(max_workers=ct.TTS_STREAM_MAX_WORKERS, thread_name_prefix="tts")
+
+
+class SentenceBuffer:
+    """
+    ストリーミングで届くトークンを溜め、文が完成するたびに取り出すバッファ
+    """
+
+    def __init__(self, min_chars=ct.TTS_STREAM_MIN_SENTENCE_CHARS):
+        self.buffer = ""
+        self.min_chars = min_chars
+
+    def push(self, token):
+        """
+        トークンを追加し、完成した文のリストを返す
+        Args:
+            token: LLMから届いたトークン
+        Returns:
+            sentences: 完成した文のリスト（なければ空リスト）
+        """
+        self.buffer += token
+        sentences = []
+        search_from = 0
+        while True:
+            match = SENTENCE_END_PATTERN.search(self.buffer, search_from)
+            if not match:
+                break
+            # 「Mr. 」のような短すぎる区切りは次の文とまとめて読み上げる
+            if len(self.buffer[:match.end()].strip()) < self.min_chars:
+                search_from = match.end()
+                continue
+            sentences.append(self.buffer[:match.end()].strip())
+            self.buffer = self.buffer[match.end():]
+            search_from = 0
+        return sentences
+
+    def flush(self):
+        """
+        残りのテキストを最後の文として取り出す
+        """
+        sentence = self.buffer.strip()
+        self.buffer = ""
+        return [sentence] if sentence else []
+
+
+def stream_conversation_reply(user_text):
+    """
+    日常英会話のChainと同じプロンプト・メモリを使い、回答をトークン単位で取得
+    Args:
+        user_text: ユーザーの発話テキスト
+    Yields:
+        LLMからの回答のトークン
+    """
+    chain = get_conversation_chain()
+
+    llm_response = ""
+    with tracing.stage("conversation") as record:
+        # 会話が長くなってもプロンプトが上限を超えないよう、古い履歴から削る
+        messages = context_budget.build_messages("conversation", chain.prompt, chain.memory, user_text, record)
+        start = time.perf_counter()
+        for chunk in st.session_state.llm.stream(messages):
+            # 使用量は最後のチャンクにのみ含まれる
+            tracing.record_usage(record, chunk)
+            if chunk.content:
+                if not llm_response:
+                    record["first_token_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                llm_response += chunk.content
+                yield chunk.content
+
+    # predict()と同様に、やり取りを会話履歴に保存
+    chain.memory.save_context({"input": user_text}, {"response": llm_response})
+
+
+def speak_reply_stream(token_stream, text_placeholder, audio_placeholder, speed=1.0,
+                       on_text_complete=None, poll=None):
+    """
+    回答をトークン単位で表示しつつ、文が完成するたびに音声合成して順番に再生
+    Args:
+        token_stream: LLMからの回答のトークンを返すイテレータ
+        text_placeholder: 回答テキストの表示先（st.empty()）
+        audio_placeholder: 音声プレーヤーの表示先（st.empty()）
+        speed: 再生速度
+        on_text_complete: 回答全文がそろった時点で（読み上げ完了を待たずに）呼ぶ関数
+        poll: 読み上げの待ち時間中に繰り返し呼ぶ関数（並行タスクの結果表示用）
+    Returns:
+        llm_response: 回答全文
+        audio_output_data: 回答全体のwav形式の音声データ（聞き直し用）
+    """
+    openai_obj = st.session_state.openai_obj
+    sentence_buffer = SentenceBuffer()
+    pending = []  # 音声合成中の文（読み上げ順）
+    clips = []
+    # 直前の文の再生が終わる時刻（これより前に次の文を差し替えると途中で切れる）
+    playing_until = 0.0
+
+    def wait_until(is_ready):
+        # 待っている間も並行タスクの結果を表示できるよう、短い間隔で確認する
+        while not is_ready():
+            if poll:
+                poll()
+            time.sleep(ct.TURN_POLL_INTERVAL)
+
+    def play_ready_clips(wait):
+        nonlocal playing_until
+        while pending and (wait or (pending[0].done() and time.monotonic() >= playing_until)):
+            future = pending.pop(0)
+            wait_until(future.done)
+            # 再生時間の計算と連結のため、文単位の音声はwavにそろえる
+            with tracing.stage("speed_change", speed=speed, audio_bytes=len(future.result())):
+                clip = au.change_speed(au.decode_to_wav(future.result(), ct.TTS_RESPONSE_FORMAT), speed)
+            clips.append(clip)
+
+            # 前の文を読み終えるまで待ってから次の文を再生
+            wait_until(lambda: time.monotonic() >= playing_until)
+            audio_placeholder.audio(clip, format="audio/wav", autoplay=True)
+            playing_until = time.monotonic() + au.wav_duration(clip)
+
+    llm_response = ""
+    for token in token_stream:
+        llm_response += token
+        text_placeholder.markdown(llm_response + "▌")
+        for sentence in sentence_buffer.push(token):
+            pending.append(tracing.submit(_tts_executor, text_to_speech, sentence, openai_obj))
+        play_ready_clips(wait=False)
+        if poll:
+            poll()
+    text_placeholder.markdown(llm_response)
+
+    for sentence in sentence_buffer.flush():
+        pending.append(tracing.submit(_tts_executor, text_to_speech, sentence, openai_obj))
+    if on_text_complete:
+        on_text_complete(llm_response)
+    play_ready_clips(wait=True)
+    wait_until(lambda: time.monotonic() >= playing_until)
+
+    # 再生し終えたら、回答全体を1つの音声にまとめて聞き直せるようにする
+    audio_output_data = au.concat_wav(clips)
+    audio_placeholder.audio(audio_output_data, format="audio/wav")
+
+    return llm_response, audio_output_data
+
+
+# =========================
+# 1ターン内の並行タスク
+# =========================
+
+# 添削・翻訳などの補助的なLLM呼び出しを並行実行するスレッドプール
+_turn_executor = ThreadPoolExecutor(max_workers=ct.TURN_TASK_MAX_WORKERS, thread_name_prefix="turn_task")
+
+
+class TurnTasks:
+    """
+    1ターン内で互いに独立したLLM呼び出しを並行実行し、完了した順に画面へ反映する
+    - 画面への反映（render）はStreamlitのスクリプトスレッドから render_ready() / render_all() で行う
+    - 補助的なタスクのため、失敗してもターン全体は止めず、エラーを短く表示する
+    """
+
+    def __init__(self):
+        self._tasks = []
+
+    def submit(self, render, func, *args, on_error=None):
+        """
+        タスクを並行実行
+        Args:
+            render: 結果を受け取って画面に表示する関数
+            func: 別スレッドで実行する関数（st.session_state は参照しないこと）
+            args: func に渡す引数
+            on_error: 失敗した場合に例外を受け取って画面に表示する関数（省略時は警告を表示）
+        """
+        self._tasks.append((tracing.submit(_turn_executor, func, *args), render, on_error))
+
+    def _render(self, future, render, on_error):
+        """
+        タスクの結果を表示（失敗した場合はエラーを表示）
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            if on_error is None:
+                st.warning(f"⚠️ 処理に失敗しました: {e}")
+            else:
+                on_error(e)
+            return
+        render(result)
+
+    def render_ready(self):
+        """
+        完了したタスクの結果を表示
+        """
+        for task in [task for task in self._tasks if task[0].done()]:
+            self._tasks.remove(task)
+            self._render(*task)
+
+    def render_all(self):
+        """
+        残りのタスクを完了した順に表示
+        """
+        tasks = {future: (render, on_error) for future, render, on_error in self._tasks}
+        self._tasks = []
+        for future in as_completed(tasks):
+            self._render(future, *tasks[future])
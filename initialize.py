@@ -1,14 +1,16 @@
-import os
 import streamlit as st
+import importlib.util
+import os
 from dotenv import load_dotenv
-from openai import OpenAI
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain_openai import ChatOpenAI
 
 import constants as ct
-import functions as ft
 from state_manager import initialize_state
+from problem_prefetch import ProblemPrefetcher, ProblemTextQueue
+from tts_cache import tts_cache
+from response_cache import response_cache
+from artifact_store import artifact_store
 import auth
+import tracing
 
 
 def initialize():
@@ -34,21 +36,28 @@ def initialize():
     # =========================
     # 外部リソース初期化
     # =========================
+    # ログイン画面を速く表示するため、APIクライアント・LLMのモジュールはログイン後に読み込む
+    import clients
+
+    # APIクライアントは全セッションで共有し、HTTP接続を再利用する
     if "openai_obj" not in st.session_state:
-        st.session_state.openai_obj = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        st.session_state.openai_obj = clients.get_openai_client()
 
     if "llm" not in st.session_state:
-        st.session_state.llm = ChatOpenAI(
-            model_name="gpt-4o-mini",
-            temperature=0.5
-        )
+        st.session_state.llm = clients.get_chat_model()
 
-    if "memory" not in st.session_state:
-        st.session_state.memory = ConversationSummaryBufferMemory(
-            llm=st.session_state.llm,
-            max_token_limit=1000,
-            return_messages=True
-        )
+    if "problem_prefetcher" not in st.session_state:
+        st.session_state.problem_prefetcher = ProblemPrefetcher()
+
+    if "problem_queue" not in st.session_state:
+        st.session_state.problem_queue = ProblemTextQueue()
+
+    # =========================
+    # 計測
+    # =========================
+    # 以降の処理の計測結果に付けるタグ（モード・英語レベルはサイドバーの選択後に更新）
+    tracing.start_metrics_server()
+    tracing.set_tags(session=st.session_state.session_id, user=st.session_state.username)
 
     # =========================
     # サイドバー UI
@@ -91,12 +100,15 @@ def initialize():
             help="AIの返事を日本語で表示（追加トークン消費）"
         )
 
-        # 英語レベルが設定されたらchainを初期化
-        if "chain_basic_conversation" not in st.session_state or st.session_state.get("prev_englv") != st.session_state.englv:
-            st.session_state.chain_basic_conversation = ft.create_chain(
-                ct.SYSTEM_TEMPLATE_BASIC_CONVERSATION.format(level=st.session_state.englv)
+        # streamlit-webrtc がインストールされている場合のみ、リアルタイム文字起こしを選べる
+        if importlib.util.find_spec("streamlit_webrtc") is not None:
+            st.divider()
+            st.markdown("**音声入力**")
+            st.session_state.live_capture_flg = st.checkbox(
+                "🎙️ リアルタイム文字起こし",
+                value=st.session_state.live_capture_flg,
+                help="話している間に区切りごとに文字起こしを進め、発話終了後すぐに結果を表示（WebRTCでマイクに接続）"
             )
-            st.session_state.prev_englv = st.session_state.englv
 
         # =========================
         # モード変更時の制御
@@ -111,6 +123,8 @@ def initialize():
             if st.session_state.mode == ct.MODE_1:
                 st.session_state.shadowing_flg = False
                 st.session_state.dictation_flg = False
+                # 日常英会話では問題文を使わないため、先読み済みの問題を破棄
+                st.session_state.problem_prefetcher.clear()
 
             elif st.session_state.mode == ct.MODE_2:
                 st.session_state.dictation_flg = False
@@ -120,6 +134,18 @@ def initialize():
 
         st.session_state.pre_mode = st.session_state.mode
 
+        tracing.set_tags(
+            session=st.session_state.session_id,
+            user=st.session_state.username,
+            mode=st.session_state.mode,
+            level=st.session_state.englv
+        )
+
+        # 管理者向けの計測結果（処理段階ごとの時間・トークン数・コスト）
+        if is_admin(st.session_state.username):
+            st.divider()
+            show_admin_panel()
+
         # ログアウトボタン（認証済みの場合のみ表示）
         st.divider()
         st.markdown(f"**ログイン中:** {st.session_state.username}")
@@ -137,5 +163,50 @@ def initialize():
             )
 
 
+def is_admin(username):
+    """
+    計測結果を表示する管理者かどうか（環境変数 ct.ADMIN_USERS_ENV にカンマ区切りで指定したユーザー）
+    """
+    admin_users = os.environ.get(ct.ADMIN_USERS_ENV, "")
+    return username in {name.strip() for name in admin_users.split(",") if name.strip()}
+
+
+def show_admin_panel():
+    """
+    管理者向けに、処理段階ごとの計測結果とキャッシュ・接続の利用状況を表示
+    """
+    with st.expander("📊 パフォーマンス（管理者用）"):
+        st.dataframe(tracing.tracer.summary(), hide_index=True)
+
+        # 音声合成キャッシュの利用状況（節約できたAPI呼び出し回数の確認用）
+        tts_cache_stats = tts_cache.stats()
+        st.caption(
+            f"音声キャッシュ: ヒット {tts_cache_stats['hits']}回 / "
+            f"ミス {tts_cache_stats['misses']}回"
+        )
+        # 添削・翻訳の応答キャッシュの利用状況（全セッション共通）
+        response_cache_stats = response_cache.stats()
+        st.caption(
+            f"応答キャッシュ: ヒット {response_cache_stats['hits']}回 / "
+            f"ミス {response_cache_stats['misses']}回 / "
+            f"保存 {response_cache_stats['entries']}件"
+        )
+        # API接続の再利用状況（全セッション共通）
+        import clients
+        connection_snapshot = clients.connection_stats.snapshot()
+        st.caption(
+            f"API接続: リクエスト {connection_snapshot['requests']}回 / "
+            f"新規接続 {connection_snapshot['new_connections']}回 "
+            f"(再利用率 {connection_snapshot['reuse_rate']:.0%})"
+        )
+        # 聞き直し用の音声の保存領域（全セッション合計）
+        artifact_usage = artifact_store.usage()
+        st.caption(
+            f"保存中の音声: {artifact_usage['files']}件 / "
+            f"{artifact_usage['bytes'] / 1024 / 1024:.1f}MB"
+            f"（上限 {artifact_usage['max_bytes'] / 1024 / 1024:.0f}MB）"
+        )
+
+
 # 環境変数ロード
 load_dotenv()
@@ -0,0 +1,187 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import audio_utils as au
+import constants as ct
+import tracing
+
+# =========================
+# WebRTCの音声入力のリアルタイム文字起こし
+# =========================
+# ブラウザのマイク音声をWebRTCでフレームごとに受け取り、一定時間の無音で発話を区間に区切って、
+# 学習者が話している間に区間ごとの文字起こしを進めておく。
+# 「発話終了」の時点で残っているのは最後の区間の文字起こしだけなので、結果をすぐに受け取れる。
+
+# 全セッションで共有する文字起こし用スレッドプール
+_transcribe_executor = ThreadPoolExecutor(
+    max_workers=ct.LIVE_TRANSCRIBE_MAX_WORKERS,
+    thread_name_prefix="live_transcribe"
+)
+
+
+def frame_to_mono(frame):
+    """
+    WebRTCの音声フレーム（av.AudioFrame）をint16のモノラル配列に変換
+    Args:
+        frame: av.AudioFrame
+    Returns:
+        int16のモノラル配列
+    """
+    samples = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if frame.format.is_planar:
+        samples = samples.T
+    else:
+        samples = samples.reshape(-1, channels)
+    if channels > 1:
+        return samples.mean(axis=1).astype(np.int16)
+    return samples[:, 0].astype(np.int16)
+
+
+class LiveTranscriber:
+    """
+    1回の発話分の音声フレームを区間に区切り、区間ごとに文字起こしする（セッションごと）
+    - on_frame はWebRTCの受信スレッドから、partial_text / finish はスクリプトスレッドから呼ばれる
+    """
+
+    def __init__(self, transcribe, word_timestamps=False):
+        """
+        Args:
+            transcribe: 16kHz・モノラルのwavと word_timestamps を受け取り、(テキスト, 単語のリスト) を返す関数
+            word_timestamps: 単語ごとのタイムスタンプも取得するかどうか
+        """
+        self.transcribe = transcribe
+        self.word_timestamps = word_timestamps
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_samples = 0
+        self._unchecked_samples = 0
+        self._offset = 0  # 破棄・区切り済みのサンプル数（区間の開始時刻の計算用）
+        self._sample_rate = None
+        self._segments = []
+        self._closed = False
+        # 区間はWebRTCの受信スレッドで切り出されるため、作成時（スクリプトスレッド）の計測用タグを引き継ぐ
+        self._context = contextvars.copy_context()
+
+    def on_frame(self, frame):
+        """
+        webrtc_streamer の audio_frame_callback（受け取ったフレームはそのまま返す）
+        """
+        self.add_samples(frame_to_mono(frame), frame.sample_rate)
+        return frame
+
+    def add_samples(self, samples, sample_rate):
+        """
+        受け取った音声を追加し、一定間隔で発話区間を判定する
+        Args:
+            samples: int16のモノラル配列
+            sample_rate: サンプリングレート
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._sample_rate = sample_rate
+            self._pending.append(samples)
+            self._pending_samples += len(samples)
+            self._unchecked_samples += len(samples)
+            if self._unchecked_samples >= sample_rate * ct.LIVE_VAD_INTERVAL_MS / 1000:
+                self._unchecked_samples = 0
+                self._cut_segment(final=False)
+
+    def _cut_segment(self, final):
+        """
+        発話区間の後に十分な無音が続いていれば、区間を切り出して文字起こしを開始（ロックを取得して呼ぶこと）
+        Args:
+            final: Trueの場合、無音を待たずに残りの発話を区間として確定する
+        """
+        sample_rate = self._sample_rate
+        buffer = np.concatenate(self._pending)
+        speech = au.detect_speech(buffer, sample_rate)
+
+        if speech is None:
+            # 発話がなければ、次の発話の前の余白・背景雑音の推定用に直近だけ残して捨てる
+            keep = 0 if final else int(sample_rate * ct.LIVE_SEGMENT_SILENCE_MS / 1000)
+            self._consume(buffer, len(buffer) - keep)
+            return
+
+        start, end = speech
+        silence_samples = sample_rate * ct.LIVE_SEGMENT_SILENCE_MS / 1000
+        too_long = end - start >= sample_rate * ct.LIVE_SEGMENT_MAX_SECONDS
+        if not (final or too_long or len(buffer) - end >= silence_samples):
+            return
+
+        if (end - start) / sample_rate >= ct.TRANSCRIBE_MIN_SECONDS:
+            start_seconds = float(self._offset + start) / sample_rate
+            future = _transcribe_executor.submit(
+                self._context.copy().run, self._transcribe_segment, buffer[start:end], sample_rate
+            )
+            self._segments.append((start_seconds, float(end - start) / sample_rate, future))
+        self._consume(buffer, end)
+
+    def _consume(self, buffer, count):
+        """
+        バッファの先頭から指定したサンプル数を取り除く
+        """
+        count = max(0, count)
+        self._offset += count
+        rest = buffer[count:]
+        self._pending = [rest] if len(rest) else []
+        self._pending_samples = len(rest)
+
+    def _transcribe_segment(self, samples, sample_rate):
+        """
+        区間の音声を16kHz・モノラルに変換して文字起こし（文字起こし用スレッドで実行）
+        """
+        wav_data = au.downsample_for_transcription(au.array_to_wav(samples, sample_rate))
+        return self.transcribe(wav_data, self.word_timestamps)
+
+    def has_audio(self):
+        """
+        音声を受け取ったかどうか
+        """
+        with self._lock:
+            return self._offset + self._pending_samples > 0
+
+    def partial_text(self):
+        """
+        文字起こしが完了した区間のテキストを、先頭から途切れない範囲で連結して取得（途中経過の表示用）
+        """
+        with self._lock:
+            segments = list(self._segments)
+        texts = []
+        for _, _, future in segments:
+            if not future.done() or future.exception():
+                break
+            texts.append(future.result()[0].strip())
+        return " ".join(text for text in texts if text)
+
+    def finish(self):
+        """
+        残りの音声を最後の区間として確定し、すべての区間の文字起こし結果を連結して取得
+        Returns:
+            transcript_text: 文字起こし結果のテキスト（発話がなければ空文字）
+            transcript_words: (単語, 開始秒, 終了秒) のリスト（最初の区間の開始を0秒とする）
+            speech_seconds: 文字起こしした区間の長さの合計（秒）
+        """
+        with tracing.stage("live_transcribe_finish") as record:
+            with self._lock:
+                self._closed = True
+                if self._pending_samples:
+                    self._cut_segment(final=True)
+                segments = list(self._segments)
+            record["pending_segments"] = sum(1 for _, _, future in segments if not future.done())
+
+            texts = []
+            transcript_words = []
+            for start_seconds, _, future in segments:
+                text, words = future.result()
+                texts.append(text.strip())
+                offset = start_seconds - segments[0][0]
+                transcript_words.extend((word, start + offset, end + offset) for word, start, end in words)
+            record["segments"] = len(segments)
+
+        speech_seconds = sum(duration for _, duration, _ in segments)
+        return " ".join(text for text in texts if text), transcript_words, speech_seconds
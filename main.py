@@ -1,26 +1,10 @@
 import streamlit as st
-import os
-import time
-from time import sleep
-from pathlib import Path
-from streamlit.components.v1 import html
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain.chains import ConversationChain
-from langchain.prompts import (
-    ChatPromptTemplate,
-    HumanMessagePromptTemplate,
-    MessagesPlaceholder,
-)
-from langchain.schema import SystemMessage
-from openai import OpenAI
-from langchain_openai import ChatOpenAI
+from streamlit.errors import StreamlitAPIException
 from dotenv import load_dotenv
-import functions as ft
 import constants as ct
-import uuid
 from initialize import initialize
 from state_manager import reset_conversation
-
+from artifact_store import artifact_store
 
 # 各種設定
 load_dotenv()
@@ -34,81 +18,311 @@ st.markdown(f"## {ct.APP_NAME}")
 # 初期化処理
 initialize()
 
+# LLM・音声処理のモジュールは読み込みに数秒かかるため、ログイン画面の表示後（認証済みの場合のみ）に読み込む
+import functions as ft
 
-# メッセージリストの一覧表示
-if st.session_state.start_flg:
-    for message in st.session_state.messages:
-        if message["role"] == "assistant":
-            with st.chat_message(message["role"], avatar="images/ai_icon.jpg"):
-                st.markdown(message["content"])
-        elif message["role"] == "user":
-            with st.chat_message(message["role"], avatar="images/user_icon.jpg"):
-                st.markdown(message["content"])
-        else:
-            st.divider()
 
-# 会話開始ボタンと中断ボタンの切り替え
-if st.session_state.start_flg:
-    if st.button("中断", use_container_width=True):
-        reset_conversation()
-        st.session_state.start_flg = False
+# =========================
+# 会話履歴の表示
+# =========================
+def render_new_messages():
+    """
+    アプリ全体を前回描画した後に追加されたメッセージのみを表示（各モードの部分再実行用）
+    - 追加分が1ページを超えた場合は、アプリ全体を再描画して古いメッセージを折りたたむ
+    """
+    new_messages = st.session_state.messages[st.session_state.history_rendered:]
+    if len(new_messages) > ct.HISTORY_PAGE_SIZE:
         st.rerun()
-else:
-    if st.button("開始", use_container_width=True, type="primary"):
-        reset_conversation()
-        st.session_state.start_flg = True
-        st.session_state.show_reset_message = False
+    for message in new_messages:
+        ft.render_message(message)
+
+
+def show_more_history():
+    """
+    「さらに前の会話を表示」ボタンのコールバック
+    """
+    st.session_state.history_pages += 1
+
+
+def rerun_panel():
+    """
+    モードごとの操作パネルのみを再実行
+    - 「開始」直後のようにアプリ全体の実行中は、部分再実行を指定できないためアプリ全体を再実行
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
         st.rerun()
 
-# 会話未開始の場合は以降の処理を停止
-if not st.session_state.start_flg:
-    st.stop()
 
-# LLMレスポンスの下部にモード実行のボタン表示
-if st.session_state.start_flg:
+@st.fragment
+def older_history(hidden_count):
+    """
+    直近1ページより前のメッセージを、ボタンを押した分だけ表示（この部分のみ再実行）
+    Args:
+        hidden_count: 直近1ページより前のメッセージ数
+    """
+    shown_count = min(hidden_count, st.session_state.history_pages * ct.HISTORY_PAGE_SIZE)
+    if shown_count < hidden_count:
+        st.button(
+            f"さらに前の会話を表示（残り{hidden_count - shown_count}件）",
+            use_container_width=True,
+            on_click=show_more_history
+        )
+    for message in st.session_state.messages[hidden_count - shown_count:hidden_count]:
+        ft.render_message(message)
+
+
+# =========================
+# モードごとの操作パネル
+# =========================
+# 録音・チャット入力・ボタン操作のたびにアプリ全体（初期化・サイドバー・会話履歴）を再実行しないよう、
+# 各モードの処理は st.fragment にして、その部分のみを再実行する。
+
+@st.fragment
+def conversation_panel():
+    """
+    日常英会話モードの録音・回答表示
+    """
+    render_new_messages()
+
+    # モード：「日常英会話」
+    if st.session_state.live_capture_flg:
+        # 発話中に区切りごとの文字起こしを進め、発話終了後すぐに文字起こしテキストを取得
+        try:
+            audio_input_text, warning_message = ft.record_and_transcribe_live()
+        except Exception as e:
+            st.error(f"音声の録音中にエラーが発生しました: {e}")
+            st.stop()
+        if warning_message:
+            st.warning(warning_message)
+    else:
+        # 音声入力を受け取って音声データを作成
+        try:
+            audio_input_data = ft.record_audio()
+        except Exception as e:
+            st.error(f"音声の録音中にエラーが発生しました: {e}")
+            st.stop()
+
+        # 音声入力データから文字起こしテキストを取得
+        with st.spinner('音声入力をテキストに変換中...'):
+            audio_input_text, warning_message = ft.transcribe_audio(audio_input_data)
+
+            # 警告メッセージがあれば表示
+            if warning_message:
+                st.warning(warning_message)
+
+    # 発話が検出できなかった場合は、再度の発話を待つ
+    if not audio_input_text:
+        st.stop()
+
+    # 音声入力テキストの画面表示
+    with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+        st.markdown(audio_input_text)
+        
+    # AIメッセージの画面表示とリストへの追加
+    with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+        text_placeholder = st.empty()
+        audio_placeholder = st.empty()
+        correction_placeholder = st.empty()
+        translation_placeholder = st.empty()
+
+        # 添削・翻訳は回答生成・音声読み上げと並行して実行し、完了した順に表示
+        turn_tasks = ft.TurnTasks()
+
+        def render_correction(correction):
+            if correction:
+                with correction_placeholder.container():
+                    with st.expander("📝 あなたの発話をより良くするには"):
+                        st.markdown(correction)
+            else:
+                correction_placeholder.empty()
+
+        def render_translation(translation):
+            if translation:
+                with translation_placeholder.container():
+                    with st.expander("🇯🇵 日本語訳を見る"):
+                        st.markdown(translation)
+            else:
+                translation_placeholder.empty()
+
+        # ユーザー発話の添削（ON時のみ）：文字起こし結果だけで実行できるため、回答生成と同時に開始
+        if st.session_state.show_corrections:
+            correction_placeholder.caption("📝 添削中...")
+            turn_tasks.submit(
+                render_correction,
+                ft.correct_user_input, audio_input_text, st.session_state.englv, st.session_state.llm,
+                on_error=lambda e: correction_placeholder.caption(f"⚠️ 添削に失敗しました: {e}")
+            )
+
+        # AI返事の日本語訳（ON時のみ）：回答全文がそろった時点で、読み上げと並行して開始
+        def start_translation(llm_response):
+            if st.session_state.show_translation:
+                translation_placeholder.caption("🇯🇵 翻訳中...")
+                turn_tasks.submit(
+                    render_translation,
+                    ft.translate_to_japanese, llm_response, st.session_state.llm,
+                    on_error=lambda e: translation_placeholder.caption(f"⚠️ 翻訳に失敗しました: {e}")
+                )
+
+        # ユーザー入力値をLLMに渡し、回答をストリーミング表示しながら文単位で音声読み上げ
+        llm_response, audio_output_data = ft.speak_reply_stream(
+            ft.stream_conversation_reply(audio_input_text),
+            text_placeholder,
+            audio_placeholder,
+            speed=st.session_state.speed,
+            on_text_complete=start_translation,
+            poll=turn_tasks.render_ready
+        )
+        # 聞き直し用の音声はメモリに持たず、セッションの保存領域に置く
+        audio_output_path = artifact_store.save(st.session_state.session_id, audio_output_data)
+        turn_tasks.render_all()
+
+    # ユーザー入力値とLLMからの回答をメッセージ一覧に追加
+    st.session_state.messages.append({"role": "user", "content": audio_input_text})
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": llm_response,
+        "audio": audio_output_path,
+        "audio_format": "audio/wav"
+    })
+
+
+@st.fragment
+def shadowing_panel():
+    """
+    シャドーイングモードの問題出題・録音・評価表示
+    """
+    render_new_messages()
+    ft.prefetch_problems()
+
+    # LLMレスポンスの下部にモード実行のボタン表示
     if st.session_state.shadowing_flg:
         st.session_state.shadowing_button_flg = st.button("シャドーイング開始")
+
+    # モード：「シャドーイング」
+    # 「シャドーイング」ボタン押下時か、「英会話開始」ボタン押下時
+    if not (st.session_state.shadowing_button_flg or st.session_state.shadowing_count == 0 or st.session_state.shadowing_audio_input_flg):
+        return
+
+    if not st.session_state.shadowing_audio_input_flg:
+        with st.spinner('問題文生成中...'):
+            try:
+                st.session_state.problem, audio_output_data, audio_mime_type = ft.create_problem_and_play_audio()
+                if not st.session_state.problem:
+                    st.error("問題文の生成に失敗しました。もう一度お試しください。")
+                    st.stop()
+            except Exception as e:
+                st.error(f"問題文生成中にエラーが発生しました: {e}")
+                st.stop()
+
+        # 問題文と音声を表示
+        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+            st.markdown(st.session_state.problem)
+            st.audio(audio_output_data, format=audio_mime_type)
+        ft.save_problem_audio(audio_output_data, audio_mime_type)
+
+    # 音声入力を受け取って文字起こしテキストを取得（発話タイミング評価のため単語のタイムスタンプも取得）
+    st.session_state.shadowing_audio_input_flg = True
+    if st.session_state.live_capture_flg:
+        # 発話中に区切りごとの文字起こしを進め、発話終了後すぐに文字起こしテキストを取得
+        try:
+            audio_input_text, warning_message = ft.record_and_transcribe_live(word_timestamps=True)
+        except Exception as e:
+            st.error(f"音声の録音中にエラーが発生しました: {e}")
+            st.stop()
+        if warning_message:
+            st.warning(warning_message)
+    else:
+        try:
+            audio_input_data = ft.record_audio()
+        except Exception as e:
+            st.error(f"音声の録音中にエラーが発生しました: {e}")
+            st.stop()
+
+        with st.spinner('音声入力をテキストに変換中...'):
+            audio_input_text, warning_message = ft.transcribe_audio(audio_input_data, word_timestamps=True)
+
+            # 警告メッセージがあれば表示
+            if warning_message:
+                st.warning(warning_message)
+
+    # 発話が検出できなかった場合は、同じ問題文のまま再度の発話を待つ
+    if not audio_input_text:
+        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+            st.markdown(st.session_state.problem)
+        st.stop()
+
+    st.session_state.shadowing_audio_input_flg = False
+
+    # AIメッセージとユーザーメッセージの画面表示
+    with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+        st.markdown(st.session_state.problem)
+    with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+        st.markdown(audio_input_text)
+        
+    # LLMが生成した問題文と音声入力値をメッセージリストに追加
+    st.session_state.messages.append({"role": "assistant", "content": st.session_state.problem, **st.session_state.problem_audio})
+    st.session_state.messages.append({"role": "user", "content": audio_input_text})
+
+    # 問題文と回答を比較し、評価結果を表示
+    llm_response_evaluation = ft.show_evaluation(
+        st.session_state.problem,
+        audio_input_text,
+        learner_words=st.session_state.transcript_words
+    )
+    st.session_state.messages.append({"role": "assistant", "content": llm_response_evaluation})
+    st.session_state.messages.append({"role": "other"})
+        
+    # 各種フラグの更新
+    st.session_state.shadowing_flg = True
+    st.session_state.shadowing_count += 1
+
+    # 「シャドーイング」ボタンを表示するために、この部分のみ再描画
+    rerun_panel()
+
+
+@st.fragment
+def dictation_panel():
+    """
+    ディクテーションモードの問題出題・チャット入力・評価表示
+    """
+    render_new_messages()
+    ft.prefetch_problems()
+
+    # LLMレスポンスの下部にモード実行のボタン表示
     if st.session_state.dictation_flg:
         st.session_state.dictation_button_flg = st.button("ディクテーション開始")
 
-# 「ディクテーション」モードのチャット入力受付時に実行
-if st.session_state.chat_open_flg:
-    st.info("AIが読み上げた音声を、画面下部のチャット欄からそのまま入力・送信してください。")
+    # 「ディクテーション」モードのチャット入力受付時に実行
+    if st.session_state.chat_open_flg:
+        st.info("AIが読み上げた音声を、画面下部のチャット欄からそのまま入力・送信してください。")
 
-# ディクテーションモード時のみチャット入力を表示
-if st.session_state.mode == ct.MODE_3:
+    # 問題文・評価の表示欄をチャット入力欄より上に確保
+    panel = st.container()
     st.session_state.dictation_chat_message = st.chat_input("AIの音声を聞いて、英文を入力してください")
-else:
-    st.session_state.dictation_chat_message = ""
 
-if st.session_state.dictation_chat_message and not st.session_state.chat_open_flg:
-    st.stop()
+    if st.session_state.dictation_chat_message and not st.session_state.chat_open_flg:
+        st.stop()
 
-# 「英会話開始」ボタンが押された場合の処理
-if st.session_state.start_flg:
+    with panel:
+        # モード：「ディクテーション」
+        # 「ディクテーション」ボタン押下時か、「英会話開始」ボタン押下時か、チャット送信時
+        if not (st.session_state.dictation_button_flg or st.session_state.dictation_count == 0 or st.session_state.dictation_chat_message):
+            return
 
-    # モード：「ディクテーション」
-    # 「ディクテーション」ボタン押下時か、「英会話開始」ボタン押下時か、チャット送信時
-    if st.session_state.mode == ct.MODE_3 and (st.session_state.dictation_button_flg or st.session_state.dictation_count == 0 or st.session_state.dictation_chat_message):
-        if st.session_state.dictation_first_flg:
-            system_template_with_level = ct.SYSTEM_TEMPLATE_CREATE_PROBLEM.format(level=st.session_state.englv)
-            st.session_state.chain_create_problem = ft.create_chain(system_template_with_level)
-            st.session_state.dictation_first_flg = False
         # チャット入力以外
         if not st.session_state.chat_open_flg:
             with st.spinner('問題文生成中...'):
                 try:
-                    st.session_state.problem, llm_response_audio = ft.create_problem_and_play_audio()
+                    st.session_state.problem, audio_output_data, audio_mime_type = ft.create_problem_and_play_audio()
                     if not st.session_state.problem:
                         st.error("問題文の生成に失敗しました。もう一度お試しください。")
                         st.stop()
 
-                    # 音声ファイルの生成
-                    audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-                    ft.save_to_wav(llm_response_audio.content, audio_output_file_path)
-
-                    # 音声ファイルの表示（再生ボタン付き）
-                    st.audio(audio_output_file_path)
+                    # 音声の表示（再生ボタン付き）
+                    st.audio(audio_output_data, format=audio_mime_type)
+                    ft.save_problem_audio(audio_output_data, audio_mime_type)
 
                     # ディクテーション回答待ちのメッセージを表示
                     st.info("AIが読み上げた音声を、画面下部のチャット欄からそのまま入力・送信してください。")
@@ -131,22 +345,14 @@ if st.session_state.start_flg:
                 st.markdown(st.session_state.dictation_chat_message)
 
             # LLMが生成した問題文とチャット入力値をメッセージリストに追加
-            st.session_state.messages.append({"role": "assistant", "content": st.session_state.problem})
+            st.session_state.messages.append({"role": "assistant", "content": st.session_state.problem, **st.session_state.problem_audio})
             st.session_state.messages.append({"role": "user", "content": st.session_state.dictation_chat_message})
             
-            with st.spinner('評価結果の生成中...'):
-                system_template = ct.SYSTEM_TEMPLATE_EVALUATION.format(
-                    llm_text=st.session_state.problem,
-                    user_text=st.session_state.dictation_chat_message,
-                    level=st.session_state.englv
-                )
-                st.session_state.chain_evaluation = ft.create_chain(system_template)
-                # 問題文と回答を比較し、評価結果の生成を指示するプロンプトを作成
-                llm_response_evaluation = ft.create_evaluation()
-            
-            # 評価結果のメッセージリストへの追加と表示
-            with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-                st.markdown(llm_response_evaluation)
+            # 問題文と回答を比較し、評価結果を表示
+            llm_response_evaluation = ft.show_evaluation(
+                st.session_state.problem,
+                st.session_state.dictation_chat_message
+            )
             st.session_state.messages.append({"role": "assistant", "content": llm_response_evaluation})
             st.session_state.messages.append({"role": "other"})
             
@@ -156,163 +362,42 @@ if st.session_state.start_flg:
             st.session_state.dictation_count += 1
             st.session_state.chat_open_flg = False
 
-            st.rerun()
-
-    
-    # モード：「日常英会話」
-    if st.session_state.mode == ct.MODE_1:
-        # 音声入力を受け取って音声ファイルを作成
-        audio_input_file_path = f"{ct.AUDIO_INPUT_DIR}/audio_input_{int(time.time())}.wav"
-        try:
-            ft.record_audio(audio_input_file_path)
-        except Exception as e:
-            st.error(f"音声の録音中にエラーが発生しました: {e}")
-            st.stop()
-
-        # 音声入力ファイルから文字起こしテキストを取得
-        with st.spinner('音声入力をテキストに変換中...'):
-            transcript, warning_message = ft.transcribe_audio(audio_input_file_path)
-            audio_input_text = transcript.text
-            
-            # 警告メッセージがあれば表示
-            if warning_message:
-                st.warning(warning_message)
-
-        # 音声入力テキストの画面表示
-        with st.chat_message("user", avatar=ct.USER_ICON_PATH):
-            st.markdown(audio_input_text)
-        
-        with st.spinner("回答の音声読み上げ準備中..."):
-            # ユーザー入力値をLLMに渡して回答取得
-            llm_response = st.session_state.chain_basic_conversation.predict(input=audio_input_text)
-            
-            # LLMからの回答を音声データに変換
-            llm_response_audio = st.session_state.openai_obj.audio.speech.create(
-                model="tts-1",
-                voice="alloy",
-                input=llm_response
-            )
-
-            # 一旦mp3形式で音声ファイル作成後、wav形式に変換
-            audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-            ft.save_to_wav(llm_response_audio.content, audio_output_file_path)
-
-        # 音声ファイルの読み上げ
-        # ft.play_wav(audio_output_file_path, speed=st.session_state.speed)
-        # play_wav 関数は変更されたため、以下のコードをコメントアウト
-        # ft.play_wav(audio_output_file_path, speed=st.session_state.speed)
-
-        # 代わりに change_speed を使用
-        if st.session_state.speed != 1.0:
-            temp_audio_path = f"{ct.AUDIO_OUTPUT_DIR}/temp_{uuid.uuid4().hex}.wav"
-            ft.change_speed(audio_output_file_path, temp_audio_path, st.session_state.speed)
-        else:
-            temp_audio_path = audio_output_file_path
-
-        st.session_state.temp_audio_path = temp_audio_path
-        st.audio(temp_audio_path)
-
-        # AIメッセージの画面表示とリストへの追加
-        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-            st.markdown(llm_response)
-            
-            # ユーザー発話の添削（ON時のみ）
-            if st.session_state.show_corrections:
-                with st.spinner('添削中...'):
-                    correction = ft.correct_user_input(audio_input_text, st.session_state.englv)
-                
-                if correction:
-                    with st.expander("📝 あなたの発話をより良くするには"):
-                        st.markdown(correction)
-            
-            # AI返事の日本語訳（ON時のみ）
-            if st.session_state.show_translation:
-                with st.spinner('翻訳中...'):
-                    translation = ft.translate_to_japanese(llm_response)
-                
-                if translation:
-                    with st.expander("🇯🇵 日本語訳を見る"):
-                        st.markdown(translation)
-
-        # ユーザー入力値とLLMからの回答をメッセージ一覧に追加
-        st.session_state.messages.append({"role": "user", "content": audio_input_text})
-        st.session_state.messages.append({"role": "assistant", "content": llm_response})
+            rerun_panel()
 
 
-    # モード：「シャドーイング」
-    # 「シャドーイング」ボタン押下時か、「英会話開始」ボタン押下時
-    if st.session_state.mode == ct.MODE_2 and (st.session_state.shadowing_button_flg or st.session_state.shadowing_count == 0 or st.session_state.shadowing_audio_input_flg):
-        if st.session_state.shadowing_first_flg:
-            system_template_with_level = ct.SYSTEM_TEMPLATE_CREATE_PROBLEM.format(level=st.session_state.englv)
-            st.session_state.chain_create_problem = ft.create_chain(system_template_with_level)
-            st.session_state.shadowing_first_flg = False
-        
-        if not st.session_state.shadowing_audio_input_flg:
-            with st.spinner('問題文生成中...'):
-                try:
-                    st.session_state.problem, llm_response_audio = ft.create_problem_and_play_audio()
-                    if not st.session_state.problem:
-                        st.error("問題文の生成に失敗しました。もう一度お試しください。")
-                        st.stop()
-                except Exception as e:
-                    st.error(f"問題文生成中にエラーが発生しました: {e}")
-                    st.stop()
-
-            # 問題文を表示
-            with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-                st.markdown(st.session_state.problem)
-
-        # 音声入力を受け取って音声ファイルを作成
-        st.session_state.shadowing_audio_input_flg = True
-        audio_input_file_path = f"{ct.AUDIO_INPUT_DIR}/audio_input_{int(time.time())}.wav"
-        try:
-            ft.record_audio(audio_input_file_path)
-        except Exception as e:
-            st.error(f"音声の録音中にエラーが発生しました: {e}")
-            st.stop()
-            
-        st.session_state.shadowing_audio_input_flg = False
+# メッセージリストの一覧表示（直近1ページのみ。それより前はボタンを押した分だけ表示）
+if st.session_state.start_flg:
+    hidden_count = max(0, len(st.session_state.messages) - ct.HISTORY_PAGE_SIZE)
+    if hidden_count:
+        older_history(hidden_count)
+    for message in st.session_state.messages[hidden_count:]:
+        ft.render_message(message)
+    st.session_state.history_rendered = len(st.session_state.messages)
 
-        with st.spinner('音声入力をテキストに変換中...'):
-            # 音声入力ファイルから文字起こしテキストを取得
-            transcript, warning_message = ft.transcribe_audio(audio_input_file_path)
-            audio_input_text = transcript.text
-            
-            # 警告メッセージがあれば表示
-            if warning_message:
-                st.warning(warning_message)
+# 会話開始ボタンと中断ボタンの切り替え
+if st.session_state.start_flg:
+    if st.button("中断", use_container_width=True):
+        reset_conversation()
+        st.session_state.start_flg = False
+        st.rerun()
+else:
+    if st.button("開始", use_container_width=True, type="primary"):
+        reset_conversation()
+        st.session_state.start_flg = True
+        st.session_state.show_reset_message = False
+        st.rerun()
 
-        # AIメッセージとユーザーメッセージの画面表示
-        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-            st.markdown(st.session_state.problem)
-        with st.chat_message("user", avatar=ct.USER_ICON_PATH):
-            st.markdown(audio_input_text)
-        
-        # LLMが生成した問題文と音声入力値をメッセージリストに追加
-        st.session_state.messages.append({"role": "assistant", "content": st.session_state.problem})
-        st.session_state.messages.append({"role": "user", "content": audio_input_text})
-
-        with st.spinner('評価結果の生成中...'):
-            if st.session_state.shadowing_evaluation_first_flg:
-                system_template = ct.SYSTEM_TEMPLATE_EVALUATION.format(
-                    llm_text=st.session_state.problem,
-                    user_text=audio_input_text,
-                    level=st.session_state.englv
-                )
-                st.session_state.chain_evaluation = ft.create_chain(system_template)
-                st.session_state.shadowing_evaluation_first_flg = False
-            # 問題文と回答を比較し、評価結果の生成を指示するプロンプトを作成
-            llm_response_evaluation = ft.create_evaluation()
-        
-        # 評価結果のメッセージリストへの追加と表示
-        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-            st.markdown(llm_response_evaluation)
-        st.session_state.messages.append({"role": "assistant", "content": llm_response_evaluation})
-        st.session_state.messages.append({"role": "other"})
-        
-        # 各種フラグの更新
-        st.session_state.shadowing_flg = True
-        st.session_state.shadowing_count += 1
+# 会話未開始の場合は以降の処理を停止
+# （シャドーイング・ディクテーションでは、開始を待つ間に最初の問題文と音声を裏側で先読み。開始後は各パネルで先読み）
+if not st.session_state.start_flg:
+    if st.session_state.mode in [ct.MODE_2, ct.MODE_3]:
+        ft.prefetch_problems()
+    st.stop()
 
-        # 「シャドーイング」ボタンを表示するために再描画
-        st.rerun()
\ No newline at end of file
+# 選択中のモードの操作パネルを表示
+if st.session_state.mode == ct.MODE_1:
+    conversation_panel()
+elif st.session_state.mode == ct.MODE_2:
+    shadowing_panel()
+elif st.session_state.mode == ct.MODE_3:
+    dictation_panel()
@@ -0,0 +1,184 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import constants as ct
+import scoring
+
+# =========================
+# 事前生成した問題文のバンク
+# =========================
+# build_problem_bank.py で英語レベルごとに問題文を大量に生成し、再生速度ごとの音声と
+# シャドーイング評価用のお手本の単語タイムスタンプとともにSQLiteに保存しておく。
+# 出題時はユーザーがまだ解いていない問題をローカルで検索するだけで済み、
+# バンクに該当する問題がない場合のみ、その場でLLM・音声合成を呼び出す。
+
+AUDIO_EXTENSIONS = {"audio/wav": "wav", "audio/mpeg": "mp3", "audio/ogg": "ogg", "audio/aac": "aac"}
+
+
+def speed_key(speed):
+    """
+    再生速度を保存用の文字列にする（浮動小数点の誤差で一致しなくなるのを防ぐ）
+    """
+    return f"{float(speed):.2f}"
+
+
+class ProblemBank:
+    """
+    問題文・音声・出題履歴のインデックス付きローカルストア
+    - 同一プロセス内の複数セッション（スレッド）からのアクセスはロックで保護
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.audio_dir = self.root / "audio"
+        self._lock = threading.Lock()
+        self._conn = None  # 初回アクセス時に接続する
+
+    def _connect(self):
+        """
+        データベースに接続し、テーブルを作成（ロック取得中に呼ぶ）
+        """
+        if self._conn is None:
+            self.audio_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                self.root / "problems.sqlite3", timeout=5, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS problems ("
+                "id INTEGER PRIMARY KEY, level TEXT NOT NULL, text TEXT NOT NULL, "
+                "normalized TEXT NOT NULL, reference_timing TEXT, created_at REAL NOT NULL, "
+                "UNIQUE (level, normalized));"
+                "CREATE TABLE IF NOT EXISTS problem_audio ("
+                "problem_id INTEGER NOT NULL REFERENCES problems (id), speed TEXT NOT NULL, "
+                "path TEXT NOT NULL, mime TEXT NOT NULL, PRIMARY KEY (problem_id, speed));"
+                "CREATE TABLE IF NOT EXISTS seen ("
+                "username TEXT NOT NULL, problem_id INTEGER NOT NULL, seen_at REAL NOT NULL, "
+                "PRIMARY KEY (username, problem_id));"
+                "CREATE INDEX IF NOT EXISTS problems_level ON problems (level);"
+            )
+            self._conn = conn
+        return self._conn
+
+    def add_problem(self, level, text):
+        """
+        問題文を追加（大文字小文字・句読点の違いを無視して重複は追加しない）
+        Returns:
+            追加した問題のID（重複していた場合はNone）
+        """
+        normalized = " ".join(scoring.normalize_words(text))
+        if not normalized:
+            return None
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT OR IGNORE INTO problems (level, text, normalized, created_at) VALUES (?, ?, ?, ?)",
+                (level, text, normalized, time.time())
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def add_audio(self, problem_id, speed, audio_data, mime_type):
+        """
+        問題文の再生速度ごとの音声を保存
+        """
+        path = self.audio_dir / f"{problem_id}_{speed_key(speed)}.{AUDIO_EXTENSIONS.get(mime_type, 'bin')}"
+        path.write_bytes(audio_data)
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO problem_audio (problem_id, speed, path, mime) VALUES (?, ?, ?, ?)",
+                (problem_id, speed_key(speed), str(path.relative_to(self.root)), mime_type)
+            )
+
+    def set_reference_timing(self, problem_id, reference_words):
+        """
+        シャドーイング評価用のお手本の単語タイムスタンプを保存
+        """
+        with self._lock:
+            self._connect().execute(
+                "UPDATE problems SET reference_timing = ? WHERE id = ?",
+                (json.dumps(reference_words), problem_id)
+            )
+
+    def missing_audio(self, speeds):
+        """
+        いずれかの再生速度の音声がない問題（ビルドの途中で中断した場合など）
+        Returns:
+            (問題のID, 問題文, 音声のない再生速度のリスト) のリスト
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT problems.id, problems.text, group_concat(problem_audio.speed) FROM problems "
+                "LEFT JOIN problem_audio ON problem_audio.problem_id = problems.id GROUP BY problems.id"
+            ).fetchall()
+        missing = []
+        for problem_id, text, saved in rows:
+            saved = set(saved.split(",")) if saved else set()
+            speeds_missing = [speed for speed in speeds if speed_key(speed) not in saved]
+            if speeds_missing:
+                missing.append((problem_id, text, speeds_missing))
+        return missing
+
+    def count(self, level):
+        """
+        英語レベルごとの問題数
+        """
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM problems WHERE level = ?", (level,)
+            ).fetchone()[0]
+
+    def _unseen_query(self, columns):
+        return (
+            f"SELECT {columns} FROM problems "
+            "JOIN problem_audio ON problem_audio.problem_id = problems.id AND problem_audio.speed = ? "
+            "WHERE problems.level = ? AND problems.id NOT IN (SELECT problem_id FROM seen WHERE username = ?)"
+        )
+
+    def available(self, username, level, speed):
+        """
+        ユーザーがまだ解いていない、指定の再生速度の音声がある問題の数
+        """
+        with self._lock:
+            return self._connect().execute(
+                self._unseen_query("COUNT(*)"), (speed_key(speed), level, username)
+            ).fetchone()[0]
+
+    def take(self, username, level, speed):
+        """
+        ユーザーがまだ解いていない問題を1件取り出し、出題済みとして記録
+        Returns:
+            problem: 問題文
+            audio_output_data: 再生速度を反映した音声データ
+            audio_mime_type: 音声データのMIMEタイプ
+            reference_words: お手本の (単語, 開始秒, 終了秒) のリスト（保存していなければNone）
+            （該当する問題がなければNone）
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                self._unseen_query("problems.id, problems.text, problems.reference_timing, "
+                                   "problem_audio.path, problem_audio.mime") + " ORDER BY random() LIMIT 1",
+                (speed_key(speed), level, username)
+            ).fetchone()
+            if row is None:
+                return None
+            problem_id, text, reference_timing, path, mime_type = row
+
+        # 音声を読み込めなかった問題は出題済みにせず、後で再び出題できるようにする
+        try:
+            audio_output_data = (self.root / path).read_bytes()
+        except OSError:
+            return None
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO seen (username, problem_id, seen_at) VALUES (?, ?, ?)",
+                (username, problem_id, time.time())
+            )
+        reference_words = [tuple(word) for word in json.loads(reference_timing)] if reference_timing else None
+        return text, audio_output_data, mime_type, reference_words
+
+
+# 全セッションで共有する問題バンク
+problem_bank = ProblemBank(ct.PROBLEM_BANK_DIR)
@@ -0,0 +1,109 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import constants as ct
+import tracing
+
+# =========================
+# 問題文の先読み
+# =========================
+# 学習者が回答を録音・入力している間に、次の問題文と音声を裏側で生成しておく。
+# 先読みした問題は (モード, 英語レベル, 再生速度) に紐づけ、条件が変わったら破棄する。
+# 問題文は1回のLLM呼び出しで複数まとめて生成し、セッションごとのキューから1文ずつ使う。
+
+# 全セッションで共有する先読み用スレッドプール
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=ct.PROBLEM_PREFETCH_MAX_WORKERS,
+    thread_name_prefix="problem_prefetch"
+)
+
+
+class ProblemPrefetcher:
+    """
+    セッションごとの先読み済み問題のキュー
+    """
+
+    def __init__(self, depth=ct.PROBLEM_PREFETCH_DEPTH):
+        self.depth = depth
+        self.key = None
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def configure(self, key, generate, *args):
+        """
+        先読みの条件を設定し、キューを規定数まで埋める
+        Args:
+            key: 先読みの条件（モード・英語レベル・再生速度のタプル）
+            generate: 問題文と音声を生成する関数（別スレッドで実行）
+            args: generate に渡す引数（st.session_state は別スレッドから参照できないため値で渡す）
+        """
+        with self._lock:
+            if key != self.key:
+                self._clear()
+                self.key = key
+            while len(self._queue) < self.depth:
+                self._queue.append(tracing.submit(_prefetch_executor, generate, *args))
+
+    def get(self):
+        """
+        先読み済みの問題を1件取り出す（生成中の場合は完了を待つ）
+        Returns:
+            generate の戻り値（先読みしていなければNone）
+        """
+        with self._lock:
+            if not self._queue:
+                return None
+            future = self._queue.popleft()
+        return future.result()
+
+    def clear(self):
+        """
+        先読み済みの問題をすべて破棄
+        """
+        with self._lock:
+            self._clear()
+            self.key = None
+
+    def _clear(self):
+        while self._queue:
+            # 未着手のものは取り消し、生成中のものは結果を捨てる
+            self._queue.popleft().cancel()
+
+
+class ProblemTextQueue:
+    """
+    まとめて生成した問題文を1文ずつ取り出すセッションごとのキュー
+    - 先読み用の複数スレッドから同時に取り出されても、LLMの呼び出しは1回にまとめる
+    """
+
+    def __init__(self):
+        self.key = None
+        self._texts = deque()
+        self._lock = threading.Lock()
+
+    def take(self, key, generate_batch, *args):
+        """
+        問題文を1文取り出す（キューが空の場合はまとめて生成して補充する）
+        Args:
+            key: 問題文の条件（英語レベル）。変わった場合はキューを破棄する
+            generate_batch: 問題文のリストを生成する関数
+            args: generate_batch に渡す引数
+        Returns:
+            問題文
+        """
+        with self._lock:
+            if key != self.key:
+                self._texts.clear()
+                self.key = key
+            if not self._texts:
+                self._texts.extend(generate_batch(*args))
+            return self._texts.popleft()
+
+    def clear(self):
+        """
+        キューの問題文をすべて破棄
+        """
+        with self._lock:
+            self._texts.clear()
+            self.key = None
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import constants as ct
+
+# =========================
+# LLMの応答のSQLiteキャッシュ
+# =========================
+# 添削・翻訳のように、同じ入力に対して同じ応答で構わないLLM呼び出しの結果を保存する。
+# キーには (処理, 正規化した入力, 英語レベル, プロンプトのハッシュ, モデル) を使うため、
+# functions.py のプロンプトの文面を変更すると、古い応答は自動的に使われなくなる。
+# SQLiteのファイルはノード上の全セッション（プロセス）で共有し、期限切れ・件数上限超過分は削除する。
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    キャッシュキー用に入力テキストを正規化（前後の空白を除き、連続する空白を1つにまとめる）
+    - 大文字・小文字や句読点は添削結果に影響するため変更しない
+    """
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def prompt_version(prompt_template):
+    """
+    プロンプトの文面のハッシュ（文面を変更するとキャッシュキーが変わる）
+    """
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    期限と件数上限のあるLLM応答のキャッシュ
+    - 同一プロセス内の複数セッション（スレッド）からのアクセスはロックで保護
+    - 複数プロセスからの同時アクセスはSQLiteのWALモードで扱う
+    """
+
+    def __init__(self, db_path, max_entries, ttl_seconds):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None  # 初回アクセス時に接続する
+
+    @staticmethod
+    def make_key(task, text, level, prompt_template, model):
+        """
+        キャッシュキー（SHA-256）を作成
+        Args:
+            task: 処理の名前（"correction" / "translation"）
+            text: 入力テキスト
+            level: 英語レベル（翻訳のように使わない場合は空文字）
+            prompt_template: プロンプトの文面
+            model: LLMのモデル名
+        """
+        raw = json.dumps(
+            [task, normalize_text(text), level, prompt_version(prompt_template), model],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        """
+        データベースに接続し、テーブルを作成（ロック取得中に呼ぶ）
+        """
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, task TEXT NOT NULL, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            # 保存のたびに行う期限切れの削除で、テーブル全体を走査しないようにする
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        """
+        期限内の応答を取得
+        Returns:
+            応答のテキスト（なければNone）
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            # 最終利用時刻を更新して、件数上限超過時の削除順（LRU）に反映
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, task, response):
+        """
+        応答を保存し、期限切れ・件数上限超過分を削除
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, task, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, task, response, now, now)
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        """
+        キャッシュの利用状況を取得
+        Returns:
+            ヒット数・ミス数・ヒット率・保存件数の辞書
+        """
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
+
+
+# ノード上の全セッションで共有するキャッシュ
+response_cache = ResponseCache(ct.RESPONSE_CACHE_PATH, ct.RESPONSE_CACHE_MAX_ENTRIES, ct.RESPONSE_CACHE_TTL_SECONDS)
@@ -0,0 +1,165 @@
+import json
+import re
+
+# =========================
+# 問題文と回答の単語単位の比較
+# =========================
+# ディクテーション・シャドーイングの回答を、LLMを使わずに問題文と単語単位で突き合わせる。
+# 結果（WER・抜け・余分・置き換わった単語）はすぐに画面へ表示し、
+# LLMにはコメント生成のためにこの比較結果だけを渡す。
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+
+
+def normalize_words(text):
+    """
+    大文字小文字・句読点・アポストロフィの違いを無視して単語のリストにする
+    """
+    text = text.lower().replace("’", "'").replace("‘", "'")
+    return WORD_PATTERN.findall(text)
+
+
+def align_indices(reference_words, hypothesis_words):
+    """
+    編集距離が最小になるよう、問題文と回答の単語を対応付ける
+    Args:
+        reference_words: 問題文の単語のリスト
+        hypothesis_words: 回答の単語のリスト
+    Returns:
+        (操作, 問題文の単語の位置, 回答の単語の位置) のリスト
+        操作は "equal" / "substitute" / "delete"（抜け） / "insert"（余分）で、対応する単語がない側はNone
+    """
+    rows, cols = len(reference_words) + 1, len(hypothesis_words) + 1
+    distance = [[0] * cols for _ in range(rows)]
+    for i in range(rows):
+        distance[i][0] = i
+    for j in range(cols):
+        distance[0][j] = j
+    for i in range(1, rows):
+        for j in range(1, cols):
+            cost = 0 if reference_words[i - 1] == hypothesis_words[j - 1] else 1
+            distance[i][j] = min(
+                distance[i - 1][j - 1] + cost,
+                distance[i - 1][j] + 1,
+                distance[i][j - 1] + 1
+            )
+
+    # 終点から逆にたどって対応付けを復元
+    operations = []
+    i, j = rows - 1, cols - 1
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            cost = 0 if reference_words[i - 1] == hypothesis_words[j - 1] else 1
+            if distance[i][j] == distance[i - 1][j - 1] + cost:
+                operations.append(("equal" if cost == 0 else "substitute", i - 1, j - 1))
+                i, j = i - 1, j - 1
+                continue
+        if i > 0 and distance[i][j] == distance[i - 1][j] + 1:
+            operations.append(("delete", i - 1, None))
+            i -= 1
+        else:
+            operations.append(("insert", None, j - 1))
+            j -= 1
+    operations.reverse()
+    return operations
+
+
+def align_words(reference_words, hypothesis_words):
+    """
+    問題文と回答の単語を対応付ける
+    Returns:
+        (操作, 問題文の単語, 回答の単語) のリスト（対応する単語がない側はNone）
+    """
+    return [
+        (
+            operation,
+            None if i is None else reference_words[i],
+            None if j is None else hypothesis_words[j]
+        )
+        for operation, i, j in align_indices(reference_words, hypothesis_words)
+    ]
+
+
+def score_answer(reference_text, hypothesis_text):
+    """
+    問題文と回答を比較して採点
+    Args:
+        reference_text: 問題文
+        hypothesis_text: ユーザーの回答
+    Returns:
+        採点結果の辞書
+        - wer: 単語誤り率（0が完全一致）
+        - perfect: 完全一致かどうか
+        - operations: align_words() の結果
+        - missing / extra / substituted: 抜けた単語・余分な単語・(正, 誤) の組
+    """
+    reference_words = normalize_words(reference_text)
+    hypothesis_words = normalize_words(hypothesis_text)
+    operations = align_words(reference_words, hypothesis_words)
+
+    missing = [ref for op, ref, _ in operations if op == "delete"]
+    extra = [hyp for op, _, hyp in operations if op == "insert"]
+    substituted = [(ref, hyp) for op, ref, hyp in operations if op == "substitute"]
+    errors = len(missing) + len(extra) + len(substituted)
+
+    return {
+        "wer": errors / max(1, len(reference_words)),
+        "perfect": errors == 0 and bool(reference_words),
+        "operations": operations,
+        "missing": missing,
+        "extra": extra,
+        "substituted": substituted,
+    }
+
+
+def render_score_markdown(score):
+    """
+    採点結果を既存の評価フォーマット（✓ / △）のMarkdownにする
+    """
+    correct_count = sum(1 for op, _, _ in score["operations"] if op == "equal")
+    reference_count = sum(1 for op, _, _ in score["operations"] if op != "insert")
+
+    # 問題文を並べ、間違えた箇所だけ取り消し線と回答を添える
+    marked_words = []
+    for op, ref, hyp in score["operations"]:
+        if op == "equal":
+            marked_words.append(ref)
+        elif op == "substitute":
+            marked_words.append(f"~~{hyp}~~ **{ref}**")
+        elif op == "delete":
+            marked_words.append(f"**[{ref}]**")
+        else:
+            marked_words.append(f"~~{hyp}~~")
+
+    lines = [
+        "【評価】",
+        f"✓ 正確に再現できた単語: {correct_count} / {reference_count}語"
+        f"（単語誤り率 {score['wer']:.0%}）",
+    ]
+    if score["substituted"]:
+        lines.append("△ 聞き違えた単語: " + ", ".join(f"{hyp} → {ref}" for ref, hyp in score["substituted"]))
+    if score["missing"]:
+        lines.append("△ 抜けた単語: " + ", ".join(score["missing"]))
+    if score["extra"]:
+        lines.append("△ 余分な単語: " + ", ".join(score["extra"]))
+    lines.append("")
+    lines.append(" ".join(marked_words))
+    return "  \n".join(lines)
+
+
+def to_compact_json(score, timing=None):
+    """
+    LLMに渡すための、採点結果の簡潔なJSON表現
+    Args:
+        score: score_answer() の結果
+        timing: シャドーイングの発話タイミングの指標（fluency.compute_metrics() の結果）
+    """
+    compact = {
+        "wer": round(score["wer"], 2),
+        "missing": score["missing"],
+        "extra": score["extra"],
+        "substituted": [{"expected": ref, "answered": hyp} for ref, hyp in score["substituted"]],
+    }
+    if timing:
+        compact["timing"] = timing
+    return json.dumps(compact, ensure_ascii=False)
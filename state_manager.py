@@ -1,6 +1,7 @@
+import uuid
 import streamlit as st
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain_openai import ChatOpenAI
+
+from artifact_store import artifact_store
 
 # =========================
 # セッションステート定義
@@ -13,6 +14,8 @@ DEFAULT_STATE = {
     
     # 共通
     "messages": [],
+    "history_rendered": 0,  # アプリ全体の前回描画時に表示済みのメッセージ数
+    "history_pages": 0,  # 直近1ページより前に追加表示したページ数
     "start_flg": False,
     "mode": None,
     "pre_mode": None,
@@ -21,25 +24,26 @@ DEFAULT_STATE = {
     "show_corrections": True,  # 添削表示ON/OFF
     "show_translation": True,  # 翻訳表示ON/OFF
 
+    # 音声入力
+    "live_capture_flg": False,  # WebRTCのリアルタイム文字起こしON/OFF
+    "live_transcriber": None,  # 発話中の区間ごとの文字起こし（live_capture.LiveTranscriber）
+
     # シャドーイング
     "shadowing_flg": False,
     "shadowing_button_flg": False,
     "shadowing_count": 0,
-    "shadowing_first_flg": True,
     "shadowing_audio_input_flg": False,
-    "shadowing_evaluation_first_flg": True,
 
     # ディクテーション
     "dictation_flg": False,
     "dictation_button_flg": False,
     "dictation_count": 0,
-    "dictation_first_flg": True,
     "dictation_chat_message": "",
-    "dictation_evaluation_first_flg": True,
 
     # その他
     "chat_open_flg": False,
     "problem": "",
+    "problem_audio": {},
 }
 
 
@@ -54,6 +58,10 @@ def initialize_state():
         if key not in st.session_state:
             st.session_state[key] = value
 
+    # 音声ファイルの保存先をセッションごとに分けるためのID
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
 
 # -------------------------
 # 会話リセット
@@ -63,17 +71,20 @@ def reset_conversation():
     会話のみをリセットする
     - チャット履歴
     - LangChain memory
+    - 会話履歴から聞き直すための音声ファイル
     """
     st.session_state.messages = []
+    st.session_state.history_rendered = 0
+    st.session_state.history_pages = 0
+    st.session_state.problem_audio = {}
+    st.session_state.live_transcriber = None
+    if "session_id" in st.session_state:
+        artifact_store.remove_session(st.session_state.session_id)
 
-    # 過去会話の要約・内部キャッシュ混入を防ぐため、ConversationMemoryを新規生成してLLM文脈を完全に初期化
-    if "llm" in st.session_state:
-        from langchain.memory import ConversationSummaryBufferMemory
-        st.session_state.memory = ConversationSummaryBufferMemory(
-            llm=st.session_state.llm,
-            max_token_limit=1000,
-            return_messages=True
-        )
+    # 過去会話の要約・内部キャッシュ混入を防ぐため、ConversationMemoryとそれを使うChainを破棄してLLM文脈を完全に初期化
+    # （次に必要になった時点で functions.get_conversation_chain() / get_evaluation_memory() が新規作成する）
+    for key in ["memory", "chain_basic_conversation", "evaluation_memory"]:
+        st.session_state.pop(key, None)
 
 # -------------------------
 # 完全リセット
@@ -0,0 +1,241 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import constants as ct
+
+# =========================
+# 処理段階ごとの計測
+# =========================
+# 録音・文字起こし・LLM・音声合成・音声変換などの段階ごとに、処理時間・トークン数・音声のバイト数・
+# 概算コストを記録する。記録にはセッション・モード・英語レベルのタグを付け、
+# ローテーションするJSONLファイルに書き出すとともに、Prometheus形式のテキストとして公開する。
+
+# スクリプトスレッドで設定したタグを、スレッドプールで実行する処理にも引き継ぐためのコンテキスト変数
+_tags = contextvars.ContextVar("trace_tags", default={})
+
+
+def set_tags(**tags):
+    """
+    このスクリプト実行中の記録に付けるタグを設定（セッションID・モード・英語レベルなど）
+    """
+    _tags.set(tags)
+
+
+def submit(executor, func, *args):
+    """
+    タグを引き継いだまま、スレッドプールで関数を実行
+    Returns:
+        Future
+    """
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+class Tracer:
+    """
+    計測結果をJSONLファイルに書き出し、段階ごとに集計する
+    """
+
+    def __init__(self, log_path, max_bytes, backup_count, window):
+        self.window = window
+        self._durations = defaultdict(lambda: deque(maxlen=self.window))
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+        Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+        self._logger = logging.getLogger("english_conversation.trace")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def emit(self, record):
+        """
+        計測結果を1件記録
+        """
+        self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        with self._lock:
+            stage = record["stage"]
+            self._durations[stage].append(record["duration_ms"])
+            totals = self._totals[stage]
+            totals["count"] += 1
+            totals["duration_ms"] += record["duration_ms"]
+            for field in ("prompt_tokens", "completion_tokens", "cached_tokens", "audio_bytes", "cost_usd",
+                          "truncated_messages"):
+                totals[field] += record.get(field) or 0
+
+    def summary(self):
+        """
+        段階ごとの処理時間のp50/p95と累計値
+        Returns:
+            段階ごとの集計結果の辞書のリスト
+        """
+        import numpy as np
+
+        with self._lock:
+            rows = []
+            for stage, durations in sorted(self._durations.items()):
+                p50, p95 = np.percentile(np.asarray(durations), [50, 95])
+                totals = self._totals[stage]
+                rows.append({
+                    "stage": stage,
+                    "count": int(totals["count"]),
+                    "p50_ms": round(float(p50), 1),
+                    "p95_ms": round(float(p95), 1),
+                    "prompt_tokens": int(totals["prompt_tokens"]),
+                    "completion_tokens": int(totals["completion_tokens"]),
+                    "cached_tokens": int(totals["cached_tokens"]),
+                    # 入力トークンのうち、プロバイダーのプロンプトキャッシュが使われた割合
+                    "cache_hit_rate": round(totals["cached_tokens"] / totals["prompt_tokens"], 3)
+                    if totals["prompt_tokens"] else 0.0,
+                    "audio_bytes": int(totals["audio_bytes"]),
+                    "cost_usd": round(totals["cost_usd"], 4),
+                    "truncated_messages": int(totals["truncated_messages"]),
+                })
+            return rows
+
+    def prometheus_text(self):
+        """
+        集計結果をPrometheusのテキスト形式で出力
+        """
+        lines = [
+            "# HELP app_stage_duration_seconds Processing time per stage",
+            "# TYPE app_stage_duration_seconds summary",
+        ]
+        counters = {
+            "prompt_tokens": "app_stage_prompt_tokens_total",
+            "completion_tokens": "app_stage_completion_tokens_total",
+            "cached_tokens": "app_stage_cached_tokens_total",
+            "audio_bytes": "app_stage_audio_bytes_total",
+            "cost_usd": "app_stage_cost_usd_total",
+            "truncated_messages": "app_stage_truncated_messages_total",
+        }
+        rows = self.summary()
+        with self._lock:
+            totals = {stage: dict(values) for stage, values in self._totals.items()}
+        for row in rows:
+            label = f'stage="{row["stage"]}"'
+            lines.append(f'app_stage_duration_seconds{{{label},quantile="0.5"}} {row["p50_ms"] / 1000}')
+            lines.append(f'app_stage_duration_seconds{{{label},quantile="0.95"}} {row["p95_ms"] / 1000}')
+            lines.append(f'app_stage_duration_seconds_sum{{{label}}} {totals[row["stage"]]["duration_ms"] / 1000}')
+            lines.append(f'app_stage_duration_seconds_count{{{label}}} {row["count"]}')
+        for field, metric in counters.items():
+            lines.append(f"# TYPE {metric} counter")
+            for row in rows:
+                lines.append(f'{metric}{{stage="{row["stage"]}"}} {totals[row["stage"]].get(field, 0)}')
+        lines.append("# HELP app_stage_cache_hit_ratio Share of prompt tokens served from the provider prompt cache")
+        lines.append("# TYPE app_stage_cache_hit_ratio gauge")
+        for row in rows:
+            lines.append(f'app_stage_cache_hit_ratio{{stage="{row["stage"]}"}} {row["cache_hit_rate"]}')
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer(ct.TRACE_LOG_PATH, ct.TRACE_LOG_MAX_BYTES, ct.TRACE_LOG_BACKUP_COUNT, ct.TRACE_SUMMARY_WINDOW)
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    処理段階の時間を計測して記録
+    - with の中で、返された辞書に audio_bytes などの値を追加できる
+    Args:
+        name: 段階の名前
+        fields: 記録に含める値
+    """
+    record = {"stage": name, "ts": time.time(), **_tags.get(), **fields}
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        tracer.emit(record)
+
+
+@contextmanager
+def llm_stage(name, **fields):
+    """
+    LLM呼び出しの段階を計測し、トークン数とコストも記録
+    """
+    from langchain_community.callbacks import get_openai_callback
+
+    with stage(name, **fields) as record, get_openai_callback() as callback:
+        yield record
+        record["prompt_tokens"] = callback.prompt_tokens
+        record["completion_tokens"] = callback.completion_tokens
+        record["cost_usd"] = callback.total_cost
+
+
+def record_usage(record, message):
+    """
+    ストリーミング応答など、コールバックで数えられない場合にLLMの使用量を記録
+    Args:
+        record: stage() が返した辞書
+        message: usage_metadata を持つLLMの応答（AIMessage / AIMessageChunk）
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    record["prompt_tokens"] = usage.get("input_tokens", 0)
+    record["completion_tokens"] = usage.get("output_tokens", 0)
+    record["cached_tokens"] = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    record["cost_usd"] = (
+        (record["prompt_tokens"] - record["cached_tokens"]) * ct.LLM_COST_PER_INPUT_TOKEN
+        + record["cached_tokens"] * ct.LLM_COST_PER_CACHED_INPUT_TOKEN
+        + record["completion_tokens"] * ct.LLM_COST_PER_OUTPUT_TOKEN
+    )
+
+
+# =========================
+# Prometheus形式の公開
+# =========================
+
+_metrics_server_lock = threading.Lock()
+_metrics_server = None
+_metrics_server_failed = False  # ポートが使用中で起動できなかった場合はTrue
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host=ct.METRICS_HOST, port=ct.METRICS_PORT):
+    """
+    /metrics を返すHTTPサーバーをプロセスに1つだけ起動
+    - ポートが使用中（別プロセスが起動済み）の場合は何もしない（失敗を記録し、再実行のたびに起動し直さない）
+    """
+    global _metrics_server, _metrics_server_failed
+    if not port:
+        return
+    with _metrics_server_lock:
+        if _metrics_server is not None or _metrics_server_failed:
+            return
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            _metrics_server_failed = True
+            return
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics_server", daemon=True).start()
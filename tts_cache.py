@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import constants as ct
+
+# =========================
+# 音声合成結果のディスクキャッシュ
+# =========================
+# (model, voice, text, speed, 出力形式) のハッシュをファイル名として音声データを保存する。
+# 容量上限を超えたら、最後に使われた時刻（mtime）が古いものから削除する。
+
+
+class TTSCache:
+    """
+    音声合成結果を内容アドレスで保存するLRUディスクキャッシュ
+    - 同一プロセス内の複数セッション（スレッド）からの同時アクセスはロックで保護
+    - ファイルは一時ファイルに書いてから置き換えるため、読み込み途中の破損ファイルは見えない
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None  # 初回アクセス時にディレクトリを走査して求める
+
+    @staticmethod
+    def make_key(model, voice, text, speed=1.0, audio_format="mp3"):
+        """
+        キャッシュキー（SHA-256）を作成
+        """
+        raw = "\0".join([model, voice, f"{float(speed):.3f}", audio_format, text])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.bin"
+
+    def _entries(self):
+        return [path for path in self.cache_dir.glob("*/*.bin") if path.is_file()]
+
+    def get(self, key):
+        """
+        キャッシュから音声データを取得
+        Returns:
+            音声データのバイト列（なければNone）
+        """
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            # 最終利用時刻を更新してLRUの順序に反映
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        音声データをキャッシュに保存し、容量上限を超えた分を古い順に削除
+        """
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+
+        with self._lock:
+            # 同じキーを上書きする場合は、置き換える前のファイルの分を合計から差し引く
+            try:
+                old_size = path.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(temp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        最終利用時刻の古いものから削除して容量上限内に収める（ロック取得済みで呼ぶ）
+        """
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+        self._total_bytes = total_bytes
+
+    def stats(self):
+        """
+        キャッシュの利用状況を取得
+        Returns:
+            ヒット数・ミス数・ヒット率・保存容量の辞書
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._total_bytes or 0,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# 全セッションで共有するキャッシュ
+tts_cache = TTSCache(ct.TTS_CACHE_DIR, ct.TTS_CACHE_MAX_BYTES)